@@ -1,11 +1,14 @@
 from django.contrib import admin
+from django.db import transaction
 from .models import (
     ServiceCategory, Service, StoreCategory, StoreItem, UserProfile, 
-    Cart, CartItem, Order, OrderItem, Wishlist, Booking, Contact,
-    EventManagement, Photography, Catering, PrintingService, Notification
+    Cart, CartItem, StockReservation, Order, OrderItem, Wishlist, Booking, Contact,
+    EventManagement, Photography, Catering, PrintingService, Notification, CatalogEntry, Broadcast,
+    NotificationArchive,
 )
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
+from . import broadcasts
 
 # ============== Service Models ==============
 
@@ -42,7 +45,8 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'updated_at')
+    list_display = ('user', 'item_count', 'total_quantity', 'created_at', 'updated_at')
+    readonly_fields = ('item_count', 'total_quantity')
     list_filter = ('created_at',)
     search_fields = ('user__username',)
 
@@ -52,6 +56,14 @@ class CartItemAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     search_fields = ('cart__user__username', 'item__name')
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('item', 'cart', 'quantity', 'expires_at', 'created_at')
+    list_filter = ('expires_at',)
+    search_fields = ('cart__user__username', 'item__name')
+    # Rows are written by core.inventory together with the matching stock change
+    readonly_fields = ('cart_item', 'cart', 'item', 'quantity', 'expires_at', 'created_at')
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'total_amount', 'status', 'created_at')
@@ -69,18 +81,25 @@ class WishlistAdmin(admin.ModelAdmin):
     list_display = ('user', 'item_count', 'created_at')
     search_fields = ('user__username',)
     filter_horizontal = ('items',)
-
-    def item_count(self, obj):
-        return obj.items.count()
-    item_count.short_description = 'Number of Items'
+    readonly_fields = ('item_count',)
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
-    list_display = ('user', 'service_type', 'date', 'time_slot', 'status', 'total_amount', 'created_at')
+    list_display = ('user', 'service_type', 'service', 'date', 'time_slot', 'status', 'total_amount', 'created_at')
     list_filter = ('service_type', 'status', 'date', 'created_at')
     search_fields = ('user__username', 'requirements', 'service_id')
     readonly_fields = ('created_at', 'updated_at')
     ordering = ('-created_at',)
+    list_select_related = ('user',)
+
+    def get_queryset(self, request):
+        # One catalog query for the whole page instead of one per row
+        return super().get_queryset(request).with_services()
+
+    def service(self, obj):
+        service = obj.get_service()
+        return service.title if service else '-'
+    service.short_description = 'Service'
 
 
 # ============== Contact Model ==============
@@ -123,6 +142,50 @@ class NotificationAdmin(admin.ModelAdmin):
     mark_as_unread.short_description = 'Mark selected as unread'
 
 
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    # Written by the retention sweep (core.retention); payloads are compressed
+    list_display = ('notification_type', 'count', 'oldest', 'newest', 'archived_at')
+    list_filter = ('notification_type',)
+    exclude = ('payload',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    # Saving a new broadcast sends it to every active user (core.broadcasts)
+    list_display = ('title', 'notification_type', 'status', 'sent', 'recipients', 'throughput', 'created_at')
+    list_filter = ('status', 'notification_type')
+    search_fields = ('title', 'message')
+    readonly_fields = (
+        'status', 'sent', 'recipients', 'last_user_id', 'throughput', 'error', 'created_by',
+        'created_at', 'started_at', 'finished_at', 'heartbeat_at',
+    )
+    actions = ['resume']
+
+    def has_change_permission(self, request, obj=None):
+        # A broadcast's text cannot change once it has been sent to anyone
+        return obj is None or obj.status == 'pending' and obj.sent == 0
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+        if not change:
+            transaction.on_commit(lambda: broadcasts.schedule(obj.pk))
+
+    def resume(self, request, queryset):
+        queryset.filter(status='failed').update(status='pending')
+        for pk in queryset.exclude(status='completed').values_list('pk', flat=True):
+            broadcasts.schedule(pk)
+    resume.short_description = 'Resume selected broadcasts'
+
+
 # ============== Service-Specific Models ==============
 
 @admin.register(EventManagement)
@@ -149,6 +212,19 @@ class PrintingServiceAdmin(admin.ModelAdmin):
     list_filter = ('print_type',)
     search_fields = ('title',)
 
+@admin.register(CatalogEntry)
+class CatalogEntryAdmin(admin.ModelAdmin):
+    # Derived from the tables above by core.catalog; edit those instead
+    list_display = ('title', 'kind', 'category', 'price', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('title', 'category')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 # ============== Customize Admin Site ==============
 
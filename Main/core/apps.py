@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Connect the signal receivers that keep derived indexes in sync
+        # and push notification changes to connected clients
+        from . import autocomplete, catalog, derivatives, fragments, listings, navigation, notifications, search, websocket_auth, wishlists  # noqa: F401
@@ -0,0 +1,228 @@
+"""
+In-memory autocomplete for the navbar search dropdown.
+
+Service titles, store item names and category names are loaded once into
+a sorted array of lowercase keys, one key per word start, so that "pho"
+finds both "Photography" and "Wedding Photo Package".  A prefix lookup is
+two binary searches over that array; the best ``AUTOCOMPLETE_TOP_K``
+suggestions for each prefix are cached after the first lookup, and the
+one- and two-letter prefixes are cached eagerly at build time because
+their ranges are the largest.
+
+Catalog changes bump a version stamp (see core.versioning) from
+post_save/post_delete once the transaction commits; other workers notice
+the change within ``VERSION_CHECK_INTERVAL`` seconds and rebuild on their
+next lookup.  One lookup per process rebuilds while concurrent ones keep
+answering from the previous index, so apart from that rebuild lookups
+never query the database.
+"""
+
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .models import Service, ServiceCategory, StoreCategory, StoreItem
+from .versioning import VersionStamp
+
+logger = logging.getLogger(__name__)
+
+# Suggestion types in the order they are preferred on equal match quality
+KIND_ORDER = {'service_category': 0, 'store_category': 1, 'service': 2, 'storeitem': 3}
+
+
+class Suggestion:
+    """A single suggestion as returned to the navbar."""
+
+    __slots__ = ('kind', 'id', 'label', 'price')
+
+    def __init__(self, kind, id, label, price=None):
+        self.kind = kind
+        self.id = id
+        self.label = label
+        self.price = price
+
+    @property
+    def url(self):
+        if self.kind == 'service':
+            return reverse('service_detail', args=[self.id])
+        if self.kind == 'storeitem':
+            return reverse('store_item_detail', args=[self.id])
+        listing = 'all_services' if self.kind == 'service_category' else 'all_store_items'
+        return f'{reverse(listing)}?category={self.id}'
+
+    def as_dict(self):
+        data = {'type': self.kind, 'id': self.id, 'label': self.label, 'url': self.url}
+        if self.price is not None:
+            data['price'] = str(self.price)
+        return data
+
+
+class AutocompleteIndex:
+    """
+    Immutable sorted-array prefix index.
+
+    ``keys[i]`` is the lowercase label from one word start onwards and
+    ``ranks[i]`` orders matches for that key: matches at the start of the
+    label first, then by suggestion type, then shorter labels.  Results
+    repeat a (type, label) pair at most once.
+    """
+
+    def __init__(self, suggestions, top_k, cache_size):
+        self.suggestions = suggestions
+        self.top_k = top_k
+        self.cache_size = cache_size
+        rows = []
+        for position, suggestion in enumerate(suggestions):
+            label = suggestion.label.lower()
+            offset = 0
+            for word_number, word in enumerate(label.split()):
+                start = label.index(word, offset)
+                offset = start + len(word)
+                rank = (word_number > 0, KIND_ORDER[suggestion.kind], len(label), label)
+                rows.append((label[start:], rank, position))
+        rows.sort()
+        self.keys = [row[0] for row in rows]
+        self.ranks = [row[1] for row in rows]
+        self.positions = [row[2] for row in rows]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._warm()
+
+    def _warm(self):
+        first_letters = {key[:1] for key in self.keys if key}
+        first_pairs = {key[:2] for key in self.keys if len(key) >= 2}
+        for prefix in sorted(first_letters | first_pairs):
+            self._cache[prefix] = self._compute(prefix)
+
+    def _compute(self, prefix):
+        low = bisect.bisect_left(self.keys, prefix)
+        high = bisect.bisect_left(self.keys, prefix + '\uffff', low)
+        best = {}
+        for index in range(low, high):
+            position = self.positions[index]
+            rank = self.ranks[index]
+            if position not in best or rank < best[position]:
+                best[position] = rank
+        results = []
+        seen = set()
+        for position in sorted(best, key=best.__getitem__):
+            suggestion = self.suggestions[position]
+            label = (suggestion.kind, suggestion.label.lower())
+            if label in seen:
+                continue
+            seen.add(label)
+            results.append(suggestion)
+            if len(results) == self.top_k:
+                break
+        return tuple(results)
+
+    def lookup(self, prefix, limit=None):
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return ()
+        with self._lock:
+            hit = self._cache.get(prefix)
+            if hit is not None:
+                self._cache.move_to_end(prefix)
+        if hit is None:
+            hit = self._compute(prefix)
+            with self._lock:
+                self._cache[prefix] = hit
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return hit if limit is None else hit[:limit]
+
+
+def load_suggestions():
+    """Read every suggestable label from the database."""
+    suggestions = []
+    for pk, name in ServiceCategory.objects.values_list('pk', 'name'):
+        suggestions.append(Suggestion('service_category', pk, name))
+    for pk, name in StoreCategory.objects.values_list('pk', 'name'):
+        suggestions.append(Suggestion('store_category', pk, name))
+    for pk, title, price in Service.objects.values_list('pk', 'title', 'price').iterator(chunk_size=2000):
+        suggestions.append(Suggestion('service', pk, title, price))
+    for pk, name, price in StoreItem.objects.values_list('pk', 'name', 'price').iterator(chunk_size=2000):
+        suggestions.append(Suggestion('storeitem', pk, name, price))
+    return suggestions
+
+
+class AutocompleteService:
+    """Owns the current index and rebuilds it when the version moves."""
+
+    def __init__(self):
+        self._index = None
+        self._built_version = None
+        self._build_lock = threading.Lock()
+        self.version = VersionStamp('autocomplete')
+
+    def invalidate(self):
+        """Record a catalog change locally and for the other workers."""
+        self.version.bump()
+
+    def build(self):
+        """Rebuild the index from the database."""
+        with self._build_lock:
+            return self._build()
+
+    def _build(self):
+        version = self.version.current()
+        suggestions = load_suggestions()
+        self._index = AutocompleteIndex(
+            suggestions,
+            top_k=getattr(settings, 'AUTOCOMPLETE_TOP_K', 10),
+            cache_size=getattr(settings, 'AUTOCOMPLETE_PREFIX_CACHE_SIZE', 10000),
+        )
+        self._built_version = version
+        logger.info('Built autocomplete index with %d suggestions', len(suggestions))
+        return self._index
+
+    def _stale(self):
+        return self._index is None or self._built_version != self.version.current()
+
+    def index(self):
+        # One request rebuilds; the others keep answering from the previous index
+        if self._stale() and self._build_lock.acquire(blocking=self._index is None):
+            try:
+                if self._stale():
+                    self._build()
+            finally:
+                self._build_lock.release()
+        return self._index
+
+    def suggest(self, prefix, limit=None):
+        return self.index().lookup(prefix, limit)
+
+
+autocomplete = AutocompleteService()
+
+
+def warm():
+    """Build the index ahead of the first request; failures are only logged."""
+    try:
+        autocomplete.build()
+    except Exception:
+        logger.exception('Autocomplete warm-up failed; the index will be built on first use')
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=StoreItem)
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_save, sender=StoreCategory)
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=StoreItem)
+@receiver(post_delete, sender=ServiceCategory)
+@receiver(post_delete, sender=StoreCategory)
+def invalidate_autocomplete(sender, update_fields=None, **kwargs):
+    """Stamp a new autocomplete version when a suggestable label changes."""
+    if update_fields is not None and not {'title', 'name', 'price'}.intersection(update_fields):
+        return
+    # After the commit, so that no worker rebuilds from the rows being written
+    transaction.on_commit(autocomplete.invalidate)
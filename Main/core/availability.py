@@ -0,0 +1,218 @@
+"""
+Booking availability and slot conflicts.
+
+A booking occupies its service from ``time_slot`` for ``duration_minutes``
+(the package duration for event and photography packages,
+``BOOKING_DEFAULT_DURATION`` for the rest).  A service takes up to
+``BOOKING_CAPACITY[service_type]`` overlapping bookings (default 1); bookings
+that are pending or confirmed count, cancelled and completed ones do not.
+
+Times are handled as absolute minutes (``date.toordinal() * 1440`` plus the
+minute of the day), so bookings that run past midnight need no special
+casing.  ``Calendar`` turns the bookings of one service into the sorted,
+disjoint intervals during which it is fully booked; whether a window is
+free is then one bisect, whatever the number of bookings.
+
+* ``free_slots`` answers "free slots of a service over the next N days"
+  with one query for the bookings of the whole range, then checks every
+  slot of the grid (``BOOKING_HOURS`` split into ``BOOKING_SLOT_MINUTES``
+  steps) against the calendar in memory.
+* ``reserve_slot`` saves a new or moved booking only if its window is free.
+  It first writes the booked service's row, which makes concurrent
+  reservations of the same service take turns (a row lock on server
+  databases, the database write lock on SQLite), then reads and checks the
+  bookings around the date in the same transaction.
+
+Durations are capped at a day, so bookings starting the day before are the
+only ones from outside a date range that can reach into it.
+"""
+
+import bisect
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Booking, booking_targets
+
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class SlotUnavailable(Exception):
+    """Raised when a booking cannot take the slot it asks for."""
+
+
+def opening_hours():
+    """First and last minute of the day a booking may start in"""
+    opens, closes = getattr(settings, 'BOOKING_HOURS', (9, 21))
+    return opens * 60, closes * 60
+
+
+def slot_minutes():
+    return getattr(settings, 'BOOKING_SLOT_MINUTES', 60)
+
+
+def horizon_days():
+    return getattr(settings, 'BOOKING_HORIZON_DAYS', 90)
+
+
+def capacity(service_type):
+    return getattr(settings, 'BOOKING_CAPACITY', {}).get(service_type, 1)
+
+
+def service_duration(service_type, service_id):
+    """Minutes a booking of the service lasts"""
+    model = booking_targets.model_for(service_type)
+    default = getattr(settings, 'BOOKING_DEFAULT_DURATION', 120)
+    if model is None or not any(field.name == 'duration' for field in model._meta.fields):
+        return default
+    hours = model.objects.filter(pk=service_id).values_list('duration', flat=True).first()
+    if hours is None:
+        return default
+    return max(0, min(hours * 60, MINUTES_PER_DAY))
+
+
+def minute(day, at):
+    """Absolute minute of a date and time"""
+    return day.toordinal() * MINUTES_PER_DAY + at.hour * 60 + at.minute
+
+
+class Calendar:
+    """
+    The intervals during which a service is fully booked.
+
+    Built from ``(start, end)`` minute intervals: a sweep over their end
+    points keeps the stretches where at least ``capacity`` of them overlap,
+    merged into sorted, disjoint, half-open intervals.
+    """
+
+    def __init__(self, intervals, capacity=1):
+        # At equal times ends (-1) sort before starts (+1): [a, b) and [b, c) do not overlap
+        points = []
+        for start, end in intervals:
+            if end > start:
+                points.append((start, 1))
+                points.append((end, -1))
+        points.sort()
+        self.starts = []
+        self.ends = []
+        load = 0
+        opened = None
+        for at, change in points:
+            load += change
+            if opened is None and load >= capacity:
+                opened = at
+            elif opened is not None and load < capacity:
+                if self.ends and self.ends[-1] == opened:
+                    self.ends[-1] = at
+                elif at > opened:
+                    self.starts.append(opened)
+                    self.ends.append(at)
+                opened = None
+
+    def is_free(self, start, end):
+        """Whether [start, end) meets no fully booked interval"""
+        index = bisect.bisect_right(self.ends, start)
+        return index == len(self.ends) or self.starts[index] >= end
+
+
+def bookings(service_type, service_id, first, last, exclude=None):
+    """Active bookings of a service that can overlap the dates ``first`` to ``last``"""
+    queryset = Booking.objects.filter(
+        service_type=service_type,
+        service_id=service_id,
+        date__range=(first - timedelta(days=1), last),
+        status__in=ACTIVE_STATUSES,
+    )
+    if exclude is not None:
+        queryset = queryset.exclude(pk=exclude)
+    return queryset.order_by().values_list('date', 'time_slot', 'duration_minutes')
+
+
+def calendar(service_type, service_id, first, last, exclude=None):
+    """The calendar of a service over a date range, from one query"""
+    intervals = []
+    for day, at, duration in bookings(service_type, service_id, first, last, exclude):
+        start = minute(day, at)
+        intervals.append((start, start + duration))
+    return Calendar(intervals, capacity(service_type))
+
+
+def free_slots(service_type, service_id, start=None, days=None, duration=None):
+    """
+    ``{date: [time, ...]}`` of the slot starts at which a booking of
+    ``duration`` minutes (default: the service's) fits, for ``days`` days
+    from ``start`` (default: from now over the booking horizon), cut off
+    at the last bookable date.
+    """
+    now = timezone.localtime()
+    start = max(start or now.date(), now.date())
+    # check_window refuses dates past the horizon, so never offer them
+    last = now.date() + timedelta(days=horizon_days())
+    days = max(0, min(days or horizon_days(), horizon_days(), (last - start).days + 1))
+    if duration is None:
+        duration = service_duration(service_type, service_id)
+    # Slots late on the last day can run into the next one
+    busy = calendar(service_type, service_id, start, start + timedelta(days=days))
+
+    earliest = minute(now.date(), now.time())
+    opens, closes = opening_hours()
+    step = slot_minutes()
+    slots = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        base = day.toordinal() * MINUTES_PER_DAY
+        free = []
+        for at in range(opens, closes, step):
+            begin = base + at
+            if begin >= earliest and busy.is_free(begin, begin + duration):
+                free.append(time(at // 60, at % 60))
+        slots[day] = free
+    return slots
+
+
+def check_window(booking):
+    """Raise SlotUnavailable unless the booking's date and time may be booked at all"""
+    now = timezone.localtime()
+    if booking.date < now.date() or (booking.date == now.date() and booking.time_slot < now.time()):
+        raise SlotUnavailable('That time has already passed.')
+    if booking.date > now.date() + timedelta(days=horizon_days()):
+        raise SlotUnavailable(f'Bookings open {horizon_days()} days in advance.')
+    opens, closes = opening_hours()
+    at = booking.time_slot.hour * 60 + booking.time_slot.minute
+    if not opens <= at < closes:
+        raise SlotUnavailable(f'Bookings start between {time(opens // 60):%H:%M} and {time(closes // 60):%H:%M}.')
+
+
+def reserve_slot(booking):
+    """
+    Save a new or rescheduled booking if its window is free.
+
+    Raises SlotUnavailable, saving nothing, if the time is outside the
+    bookable window, the service does not exist or the window overlaps
+    ``capacity`` other active bookings.
+    """
+    check_window(booking)
+    model = booking_targets.model_for(booking.service_type)
+    if model is None:
+        raise SlotUnavailable('This service cannot be booked.')
+    if booking.pk is None:
+        booking.duration_minutes = service_duration(booking.service_type, booking.service_id)
+    start = minute(booking.date, booking.time_slot)
+    end = start + booking.duration_minutes
+    last = date.fromordinal((end - 1) // MINUTES_PER_DAY) if end > start else booking.date
+    with transaction.atomic():
+        # A no-op write, so that reservations of one service run one at a time
+        if not model.objects.filter(pk=booking.service_id).update(price=F('price')):
+            raise SlotUnavailable('This service is no longer available.')
+        busy = calendar(booking.service_type, booking.service_id, booking.date, last, exclude=booking.pk)
+        if not busy.is_free(start, end):
+            raise SlotUnavailable(
+                f'{datetime.combine(booking.date, booking.time_slot):%B %d, %Y at %I:%M %p} is already booked.'
+            )
+        booking.save()
+    return booking
@@ -0,0 +1,166 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+
+Benchmarks never touch the development or production database: they run
+inside a throwaway test database created with Django's test utilities,
+seed it with synthetic rows, and tear it down afterwards.
+"""
+
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.test.utils import setup_databases, teardown_databases
+
+from .inventory import InsufficientStock, release, reserve
+from .models import StockReservation, StoreItem
+
+WORDS = [
+    'wedding', 'birthday', 'corporate', 'mehendi', 'holud', 'reception',
+    'engagement', 'anniversary', 'photography', 'videography', 'drone',
+    'catering', 'biryani', 'kebab', 'dessert', 'buffet', 'decoration',
+    'floral', 'stage', 'lighting', 'balloon', 'banner', 'invitation',
+    'card', 'printing', 'venue', 'banquet', 'hall', 'music', 'dj', 'band',
+    'makeup', 'bridal', 'groom', 'transport', 'tent', 'chair', 'table',
+    'candle', 'rose', 'garland', 'gift', 'favour', 'cake', 'sweets',
+    'premium', 'royal', 'classic', 'deluxe', 'budget', 'dhaka', 'chittagong',
+    'sylhet', 'outdoor', 'indoor', 'rooftop', 'garden', 'luxury', 'package',
+]
+
+
+@contextmanager
+def benchmark_database(verbosity=0, keepdb=False, threads=False):
+    """
+    Run the enclosed block against a fresh test database.
+
+    With ``threads=True`` a SQLite test database is created as a temporary
+    file instead of in memory: the shared in-memory cache fails concurrent
+    writers immediately with "table is locked", whereas a file database
+    makes them wait for the write lock like a server database would.
+    """
+    settings_dict = connection.settings_dict
+    saved = None
+    if threads and connection.vendor == 'sqlite':
+        saved = (settings_dict['TEST'].get('NAME'), dict(settings_dict['OPTIONS']))
+        handle, path = tempfile.mkstemp(suffix='.sqlite3', prefix='bench-')
+        os.close(handle)
+        settings_dict['TEST']['NAME'] = path
+        # Take the write lock when a transaction starts, so two transactions
+        # never deadlock upgrading read locks; wait up to 30s for it
+        settings_dict['OPTIONS'].update(transaction_mode='IMMEDIATE', timeout=30)
+    old_config = setup_databases(verbosity, interactive=False, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity, keepdb=keepdb)
+        if saved is not None:
+            settings_dict['TEST']['NAME'], settings_dict['OPTIONS'] = saved
+            if os.path.exists(path):
+                os.remove(path)
+
+
+SYLLABLES = ['ba', 'ka', 'ri', 'sha', 'no', 'mi', 'ta', 'lo', 'ra', 'de', 'pu', 'jo', 'ne', 'si', 'go', 'ha']
+
+
+def long_tail_words(count=20000):
+    """Deterministic made-up words forming the rare end of the vocabulary."""
+    words = []
+    base = len(SYLLABLES)
+    for number in range(count):
+        word = ''
+        for _ in range(4):
+            word += SYLLABLES[number % base]
+            number //= base
+        words.append(word)
+    return words
+
+
+LONG_TAIL = long_tail_words()
+
+
+def phrase(rng, low, high, rare=0.0):
+    """
+    Return a phrase of ``low`` to ``high`` words.
+
+    Words come from the common catalog vocabulary, except that each word is
+    replaced with probability ``rare`` by a Zipf-distributed long-tail word,
+    which gives queries a realistic spread of selectivity.
+    """
+    words = []
+    for _ in range(rng.randint(low, high)):
+        if rare and rng.random() < rare:
+            words.append(LONG_TAIL[min(int(rng.paretovariate(1.0)) - 1, len(LONG_TAIL) - 1)])
+        else:
+            words.append(rng.choice(WORDS))
+    return ' '.join(words).capitalize()
+
+
+def make_rng(seed=42):
+    return random.Random(seed)
+
+
+def timed(func, *args, **kwargs):
+    """Call ``func`` and return (elapsed seconds, result)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Summarise timings (seconds) as milliseconds."""
+    if not samples:
+        return {'n': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    return {
+        'n': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+# ============== BASELINES ==============
+
+@transaction.atomic
+def commit_cart(cart_items):
+    """
+    Convert the reservations of ``cart_items`` into sold stock, one line at
+    a time.  This is the commit the checkout view ran before
+    ``core.checkout.place_order``; bench_checkout keeps it as its baseline
+    and stress_inventory commits single cart lines with it.
+
+    Lines whose reservation expired or shrank are topped up with a
+    conditional UPDATE; if that fails the whole commit is rolled back and
+    ``InsufficientStock`` is raised.  The consumed reservations are deleted
+    so removing the cart lines afterwards does not return their stock.
+    """
+    cart_items = list(cart_items)
+    ids = [cart_item.pk for cart_item in cart_items]
+    reserved = dict(
+        StockReservation.objects.select_for_update()
+        .filter(cart_item_id__in=ids)
+        .values_list('cart_item_id', 'quantity')
+    )
+    for cart_item in cart_items:
+        shortfall = cart_item.quantity - reserved.get(cart_item.pk, 0)
+        if shortfall > 0 and not reserve(cart_item.item_id, shortfall):
+            available = StoreItem.objects.filter(pk=cart_item.item_id).values_list('stock', flat=True).first() or 0
+            raise InsufficientStock(cart_item.item_id, cart_item.quantity, reserved.get(cart_item.pk, 0) + available)
+        elif shortfall < 0:
+            release(cart_item.item_id, -shortfall)
+    StockReservation.objects.filter(cart_item_id__in=ids).delete()
@@ -0,0 +1,209 @@
+"""
+Notification broadcasts.
+
+A ``Broadcast`` sends one notification to every active user.  Recipients
+are read in primary-key order ``NOTIFICATION_BROADCAST_BATCH_SIZE`` ids at
+a time and written with one bulk INSERT per batch, so memory stays bounded
+by the batch whatever the number of users.  Each batch commits together
+with the broadcast's progress:
+
+    INSERT INTO core_notification ... (one row per user of the batch)
+    UPDATE core_broadcast SET last_user_id = <last id of the batch>, sent = sent + n
+     WHERE id = %s AND status = 'running' AND last_user_id = <previous last id>
+
+so a broadcast interrupted at any point resumes after the last committed
+batch, without notifying anyone twice.  The conditional UPDATE also stops
+a worker whose broadcast was taken over by another one: its batch is
+rolled back.
+
+Broadcasts run on a background thread of the process that created them
+(``NOTIFICATION_BROADCAST_THREADS``; 0 leaves them to a worker).  The
+``run_broadcasts`` command is that worker: it runs pending broadcasts and
+takes over running ones whose heartbeat is older than
+``NOTIFICATION_BROADCAST_LEASE`` seconds, i.e. whose process died.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Broadcast, Notification
+from .notifications import publish_created
+
+logger = logging.getLogger(__name__)
+
+
+class Superseded(Exception):
+    """Another worker took the broadcast over; this one must stop."""
+
+
+def batch_size():
+    return getattr(settings, 'NOTIFICATION_BROADCAST_BATCH_SIZE', 1000)
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_BROADCAST_LEASE', 60))
+
+
+def recipients(after=0):
+    """Ids of the users a broadcast notifies, after ``after``, in order"""
+    return User.objects.filter(is_active=True, pk__gt=after).order_by('pk').values_list('pk', flat=True)
+
+
+def notify_users(user_ids, notification_type, title, message, link=None):
+    """Create the same notification for every user in ``user_ids`` with one INSERT."""
+    notifications = Notification.objects.bulk_create([
+        Notification(user_id=user_id, notification_type=notification_type, title=title, message=message, link=link)
+        for user_id in user_ids
+    ])
+    if notifications and notifications[0].pk is None:
+        notifications = inserted(notifications)
+    publish_created(notifications)
+    return len(notifications)
+
+
+def inserted(notifications):
+    """
+    The rows of a bulk INSERT, read back with their ids on databases that
+    do not return them (MySQL), so pushed notifications can be marked read.
+    """
+    first = notifications[0]
+    stamps = [notification.created_at for notification in notifications]
+    rows = Notification.objects.filter(
+        user_id__in=[notification.user_id for notification in notifications],
+        notification_type=first.notification_type,
+        title=first.title,
+        created_at__range=(min(stamps), max(stamps)),
+    ).order_by('pk')
+    # One row per user, should an identical notification share the instant
+    return list({row.user_id: row for row in rows}.values())
+
+
+# ============== RUNNING ==============
+
+def claim(broadcast_id):
+    """
+    Mark a broadcast running for the caller.  Succeeds for pending and
+    failed broadcasts and for running ones whose worker stopped beating.
+    """
+    now = timezone.now()
+    return Broadcast.objects.filter(
+        Q(status__in=('pending', 'failed')) | Q(status='running', heartbeat_at__lt=now - lease()),
+        pk=broadcast_id,
+    ).update(status='running', heartbeat_at=now, started_at=Coalesce(F('started_at'), Value(now)), error='') == 1
+
+
+def send_batch(broadcast, size):
+    """Notify the next ``size`` recipients; False once there are none left."""
+    with transaction.atomic():
+        user_ids = list(recipients(broadcast.last_user_id)[:size])
+        if not user_ids:
+            return False
+        notify_users(user_ids, broadcast.notification_type, broadcast.title, broadcast.message, broadcast.link)
+        advanced = Broadcast.objects.filter(
+            pk=broadcast.pk, status='running', last_user_id=broadcast.last_user_id,
+        ).update(last_user_id=user_ids[-1], sent=F('sent') + len(user_ids), heartbeat_at=timezone.now())
+        if not advanced:
+            raise Superseded()
+    broadcast.last_user_id = user_ids[-1]
+    broadcast.sent += len(user_ids)
+    return True
+
+
+def run(broadcast_id, size=None, max_batches=None, progress=None):
+    """
+    Send a broadcast until every recipient is notified, or ``max_batches``
+    batches have been sent, after which it is left pending for the next
+    run.  ``progress(broadcast)`` is called after every batch.  Returns the
+    broadcast, or None if it could not be claimed.
+    """
+    if not claim(broadcast_id):
+        return None
+    size = size or batch_size()
+    broadcast = Broadcast.objects.get(pk=broadcast_id)
+    broadcast.recipients = broadcast.sent + recipients(broadcast.last_user_id).count()
+    Broadcast.objects.filter(pk=broadcast_id).update(recipients=broadcast.recipients)
+    batches = 0
+    try:
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                Broadcast.objects.filter(pk=broadcast_id, status='running').update(status='pending')
+                break
+            if not send_batch(broadcast, size):
+                Broadcast.objects.filter(pk=broadcast_id, status='running').update(
+                    status='completed', finished_at=timezone.now(),
+                )
+                break
+            batches += 1
+            if progress is not None:
+                progress(broadcast)
+    except Superseded:
+        logger.warning('Broadcast %s was taken over by another worker', broadcast_id)
+    except Exception as exc:
+        logger.exception('Broadcast %s failed after %s notifications', broadcast_id, broadcast.sent)
+        Broadcast.objects.filter(pk=broadcast_id, status='running').update(status='failed', error=str(exc))
+    broadcast.refresh_from_db()
+    return broadcast
+
+
+def runnable():
+    """Ids of the broadcasts a worker should pick up, oldest first"""
+    stalled = Q(status='running', heartbeat_at__lt=timezone.now() - lease())
+    return Broadcast.objects.filter(Q(status='pending') | stalled).order_by('created_at').values_list('pk', flat=True)
+
+
+# ============== BACKGROUND ==============
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'NOTIFICATION_BROADCAST_THREADS', 1),
+                thread_name_prefix='broadcasts',
+            )
+        return _executor
+
+
+def _run_in_background(broadcast_id):
+    close_old_connections()
+    started = time.perf_counter()
+    try:
+        broadcast = run(broadcast_id)
+        if broadcast is not None:
+            logger.info(
+                'Broadcast %s %s: %s notifications in %.1fs',
+                broadcast_id, broadcast.status, broadcast.sent, time.perf_counter() - started,
+            )
+    except Exception:
+        logger.exception('Broadcast %s could not run', broadcast_id)
+    finally:
+        connections.close_all()
+
+
+def schedule(broadcast_id):
+    """Run a broadcast on a background thread, unless broadcasts are left to a worker."""
+    if getattr(settings, 'NOTIFICATION_BROADCAST_THREADS', 1) > 0:
+        _get_executor().submit(_run_in_background, broadcast_id)
+
+
+def broadcast(notification_type, title, message, link=None, created_by=None):
+    """Create a broadcast and start it once the current transaction commits."""
+    created = Broadcast.objects.create(
+        notification_type=notification_type, title=title, message=message, link=link, created_by=created_by,
+    )
+    transaction.on_commit(lambda: schedule(created.pk))
+    return created
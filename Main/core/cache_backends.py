@@ -0,0 +1,434 @@
+"""
+Two-tier cache backend.
+
+Production used to keep the default cache in ``DatabaseCache``, so every
+cache read (listing pages, detail fragments, version stamps, wishlist
+membership, ...) was a round trip to the remote database.  ``TieredCache``
+puts a small in-process cache (L1) in front of a shared one (L2):
+
+* L1 is an LRU of pickled values bounded by ``L1_MAX_ENTRIES`` entries and
+  ``L1_MAX_BYTES`` bytes.  An entry lives for ``L1_TIMEOUT`` seconds at
+  most, and never longer than the timeout it was set with.  A value read
+  from L2 may outlive its L2 expiry in L1 by up to ``L1_TIMEOUT``.
+* L2 is any Django cache backend, configured under ``OPTIONS['L2']``:
+  ``RedisCache`` or ``DatabaseCache`` to share values between hosts,
+  ``FileBasedCache`` only when every process runs on one host.
+
+Writes go to L2 and are broadcast to the other processes through an
+invalidation log kept in L2 itself: a sequence number under
+``tiered:seq`` and, per write, the keys it changed in one of
+``LOG_WINDOW`` slots reused in turn (``tiered:log:<seq % LOG_WINDOW>``).
+At most every ``BROADCAST_INTERVAL`` seconds each process reads the
+sequence number and drops the logged keys from its L1, or all of L1 when
+it missed entries (they expired, were overwritten by later writes, or the
+log was cleared).  A process therefore
+serves a value another process replaced for at most that long; if a
+broadcast is lost (``FileBasedCache`` and ``DatabaseCache`` do not
+increment atomically across processes) ``L1_TIMEOUT`` still bounds it.
+
+Appending to the log costs three L2 operations (``incr`` and the slot
+``set``, and ``incr`` is a read and a write outside Redis), which on a
+``DatabaseCache`` L2 would turn every cache write into four database round
+trips.  With ``BATCH_BROADCASTS``, the default for ``DatabaseCache``, a
+write only goes to L2 and its keys are queued: the queue is appended as
+one log entry at most every ``BROADCAST_INTERVAL`` seconds, by the first
+cache operation after the interval, so a burst of writes costs one round
+trip each plus one append.  Other processes then see a write up to
+``BROADCAST_INTERVAL`` later, and up to ``L1_TIMEOUT`` later when the
+process that made it serves nothing more in the meantime.
+
+``get_or_set`` recomputes a missing value once however many requests miss
+it together: threads of one process queue on a per-key lock, and other
+processes see a lock key added to L2 and poll for the value for up to
+``LOCK_TIMEOUT`` seconds before computing it themselves.
+
+``stats()`` reports hits and misses per tier, broadcast activity and L2
+latency for the current process.
+
+Example::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TieredCache',
+            'OPTIONS': {
+                'L2': {
+                    'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                    'LOCATION': 'redis://127.0.0.1:6379/1',
+                },
+                'L1_TIMEOUT': 5,
+            },
+        }
+    }
+"""
+
+import logging
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.db import DatabaseCache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SEQ_KEY = 'tiered:seq'
+LOG_PREFIX = 'tiered:log:'
+LOCK_PREFIX = 'tiered:lock:'
+
+# Seconds an invalidation log entry is kept in L2
+LOG_TIMEOUT = 300
+# Log slots; a process that falls further behind clears its L1 instead.
+# Fixed so that the log adds a bounded number of entries to L2
+LOG_WINDOW = 256
+# Seconds between polls while another process recomputes a value
+LOCK_POLL_INTERVAL = 0.05
+# Per-key locks for single-flight recomputation within a process
+FLIGHT_LOCKS = 64
+
+_missing = object()
+
+
+class TieredCache(BaseCache):
+    """In-process LRU in front of a shared Django cache backend."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        l2 = dict(options.get('L2') or {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'})
+        backend = import_string(l2.pop('BACKEND'))
+        self.shared = backend(l2.pop('LOCATION', location), l2)
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 2048))
+        self.l1_max_bytes = int(options.get('L1_MAX_BYTES', 32 * 1024 * 1024))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self.broadcast_interval = float(options.get('BROADCAST_INTERVAL', 1))
+        self.lock_timeout = float(options.get('LOCK_TIMEOUT', 10))
+        self.batch_broadcasts = bool(options.get('BATCH_BROADCASTS', isinstance(self.shared, DatabaseCache)))
+
+        self._entries = OrderedDict()  # key -> (pickled value, deadline)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._seen_seq = None
+        self._next_sync = 0.0
+        self._unpublished = set()
+        self._next_publish = 0.0
+        self._flight_locks = [threading.Lock() for _ in range(FLIGHT_LOCKS)]
+        self._counts = defaultdict(int)
+        self._latency = defaultdict(lambda: [0, 0.0, 0.0])  # operation -> [calls, seconds, max]
+        self._stats_lock = threading.Lock()
+
+    # ============== L1 ==============
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._counts['l1_hits'] += 1
+                pickled = entry[0]
+            else:
+                if entry is not None:
+                    self._l1_pop(key)
+                self._counts['l1_misses'] += 1
+                return False, None
+        return True, pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout=None):
+        ttl = self.l1_timeout if timeout is None else min(timeout, self.l1_timeout)
+        if ttl <= 0:
+            with self._lock:
+                self._l1_pop(key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1_pop(key)
+            if len(pickled) > self.l1_max_bytes // 8:
+                return  # too large to be worth the room
+            self._entries[key] = (pickled, time.monotonic() + ttl)
+            self._bytes += len(pickled)
+            while len(self._entries) > self.l1_max_entries or self._bytes > self.l1_max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counts['l1_evictions'] += 1
+
+    def _l1_pop(self, key):
+        # Callers hold self._lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+        return entry is not None
+
+    def _l1_discard(self, keys):
+        with self._lock:
+            return sum(self._l1_pop(key) for key in keys)
+
+    def _l1_clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._counts['l1_flushes'] += 1
+
+    # ============== L2 AND BROADCASTS ==============
+
+    def _l2(self, operation, *args):
+        started = time.perf_counter()
+        try:
+            return getattr(self.shared, operation)(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                latency = self._latency[operation]
+                latency[0] += 1
+                latency[1] += elapsed
+                latency[2] = max(latency[2], elapsed)
+
+    def _publish(self, keys):
+        """Broadcast ``keys`` to every process, now or with the next batch."""
+        self._counts['writes'] += 1
+        if not self.batch_broadcasts:
+            self._append(keys)
+            return
+        with self._lock:
+            self._unpublished.update(keys)
+            due = time.monotonic() >= self._next_publish
+        if due:
+            self._flush()
+
+    def _flush(self):
+        """Append the queued keys to the log as one entry."""
+        with self._lock:
+            keys, self._unpublished = self._unpublished, set()
+            self._next_publish = time.monotonic() + self.broadcast_interval
+        if keys:
+            self._append(keys)
+
+    def _append(self, keys):
+        """Append ``keys`` to the invalidation log read by every process."""
+        try:
+            try:
+                seq = self._l2('incr', SEQ_KEY)
+            except ValueError:
+                self._l2('add', SEQ_KEY, 0, None)
+                seq = self._l2('incr', SEQ_KEY)
+            self._l2('set', f'{LOG_PREFIX}{seq % LOG_WINDOW}', (seq, list(keys)), LOG_TIMEOUT)
+        except Exception:
+            logger.exception('Could not broadcast cache invalidation')
+        self._counts['broadcasts'] += 1
+
+    def _sync(self):
+        """Apply the invalidations other processes published since the last check."""
+        if time.monotonic() < self._next_sync or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = time.monotonic() + self.broadcast_interval
+            if self._unpublished and time.monotonic() >= self._next_publish:
+                self._flush()
+            seq = self._l2('get', SEQ_KEY) or 0
+            seen, self._seen_seq = self._seen_seq, seq
+            if seen is None:
+                # First check: values this process wrote before it may
+                # already have been replaced elsewhere
+                if self._entries:
+                    self._l1_clear()
+                return
+            if seq == seen:
+                return
+            if seq < seen or seq - seen > LOG_WINDOW:
+                self._l1_clear()
+                return
+            slots = {f'{LOG_PREFIX}{number % LOG_WINDOW}': number for number in range(seen + 1, seq + 1)}
+            entries = self._l2('get_many', list(slots))
+            if any(entries.get(slot, (None,))[0] != number for slot, number in slots.items()):
+                self._l1_clear()
+                return
+            dropped = self._l1_discard({key for _, keys in entries.values() for key in keys})
+            self._counts['invalidations'] += dropped
+        except Exception:
+            logger.exception('Could not read cache invalidations')
+            self._l1_clear()
+        finally:
+            self._sync_lock.release()
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    # ============== CACHE API ==============
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._sync()
+        found, value = self._l1_get(key)
+        if found:
+            return value
+        value = self._l2('get', key, _missing)
+        if value is _missing:
+            self._counts['l2_misses'] += 1
+            return default
+        self._counts['l2_hits'] += 1
+        self._l1_set(key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        full_keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        self._sync()
+        found, missing = {}, []
+        for full_key, key in full_keys.items():
+            hit, value = self._l1_get(full_key)
+            if hit:
+                found[key] = value
+            else:
+                missing.append(full_key)
+        if missing:
+            shared = self._l2('get_many', missing)
+            self._counts['l2_hits'] += len(shared)
+            self._counts['l2_misses'] += len(missing) - len(shared)
+            for full_key, value in shared.items():
+                self._l1_set(full_key, value)
+                found[full_keys[full_key]] = value
+        return found
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return True
+        return self._l2('has_key', key)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self._timeout(timeout)
+        self._l2('set', key, value, timeout)
+        self._publish([key])
+        self._l1_set(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self._timeout(timeout)
+        if not self._l2('add', key, value, timeout):
+            return False
+        # Not broadcast: L2 had no value, and a copy of an expired or culled
+        # one in another process's L1 lives for L1_TIMEOUT at most anyway
+        self._l1_set(key, value, timeout)
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        full_keys = {self.make_and_validate_key(key, version=version): key for key in data}
+        timeout = self._timeout(timeout)
+        values = {full_key: data[key] for full_key, key in full_keys.items()}
+        failed = self._l2('set_many', values, timeout) or []
+        self._publish(full_keys)
+        for full_key, value in values.items():
+            if full_key not in failed:
+                self._l1_set(full_key, value, timeout)
+        return [full_keys[full_key] for full_key in failed]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._l2('touch', key, self._timeout(timeout))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self._l2('incr', key, delta)
+        self._publish([key])
+        self._l1_discard([key])
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        deleted = self._l2('delete', key)
+        self._publish([key])
+        self._l1_discard([key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        full_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if full_keys:
+            self._l2('delete_many', full_keys)
+            self._publish(full_keys)
+            self._l1_discard(full_keys)
+
+    def clear(self):
+        # Clearing L2 also drops the log, which makes every process clear its L1
+        self._l2('clear')
+        self._l1_clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Return the value under ``key``, computing ``default()`` and storing
+        it on a miss.  Concurrent misses, in this process or others, wait
+        for the first one's value rather than all computing it.
+        """
+        value = self.get(key, _missing, version=version)
+        if value is not _missing:
+            return value
+        full_key = self.make_and_validate_key(key, version=version)
+        with self._flight_locks[hash(full_key) % FLIGHT_LOCKS]:
+            value = self.get(key, _missing, version=version)
+            if value is not _missing:
+                self._counts['coalesced'] += 1
+                return value
+            lock_key, token = f'{LOCK_PREFIX}{full_key}', uuid.uuid4().hex
+            # Read back: FileBasedCache.add is not atomic across processes
+            if not (self._l2('add', lock_key, token, self.lock_timeout) and self._l2('get', lock_key) == token):
+                value = self._wait_for(full_key, lock_key)
+                if value is not _missing:
+                    self._counts['coalesced'] += 1
+                    return value
+                lock_key = None  # its holder gave up; compute without it
+            try:
+                self._counts['recomputes'] += 1
+                value = default() if callable(default) else default
+                self.set(key, value, timeout, version=version)
+            finally:
+                if lock_key is not None:
+                    self._l2('delete', lock_key)
+            return value
+
+    def _wait_for(self, full_key, lock_key):
+        """Poll L2 for ``full_key`` while another process holds ``lock_key``."""
+        deadline = time.monotonic() + self.lock_timeout
+        self._counts['lock_waits'] += 1
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = self._l2('get', full_key, _missing)
+            if value is not _missing:
+                self._l1_set(full_key, value)
+                return value
+            if not self._l2('has_key', lock_key):
+                break
+        return self._l2('get', full_key, _missing)
+
+    # ============== STATISTICS ==============
+
+    def stats(self):
+        """Counters and L2 latency of this process since it started."""
+        with self._stats_lock:
+            latency = {
+                operation: {
+                    'calls': calls,
+                    'mean_ms': round(1000 * seconds / calls, 3),
+                    'max_ms': round(1000 * longest, 3),
+                }
+                for operation, (calls, seconds, longest) in self._latency.items()
+            }
+        with self._lock:
+            counts = dict(self._counts)
+            entries, size = len(self._entries), self._bytes
+        hits = counts.get('l1_hits', 0) + counts.get('l2_hits', 0)
+        lookups = counts.get('l1_hits', 0) + counts.get('l1_misses', 0)
+        return {
+            **counts,
+            'l1_entries': entries,
+            'l1_bytes': size,
+            'l1_hit_ratio': round(counts.get('l1_hits', 0) / lookups, 4) if lookups else None,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'l2_latency': latency,
+        }
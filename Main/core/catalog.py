@@ -0,0 +1,324 @@
+"""
+Unified catalog read model.
+
+Services live in five unrelated tables (Service, EventManagement,
+Photography, Catering, PrintingService) and store items in a sixth, each
+with its own title, price and image columns.  ``CatalogEntry`` holds one
+denormalized row per sellable thing so that cross-type listings and
+searches are one indexed query on one table instead of a query per table
+and a merge in Python.  ``lookup`` resolves (kind, id) pairs of any types
+to source model instances in one query on the (kind, object_id) key, as
+Booking.get_service does; the instances hold the columns the entries
+carry and read the others from their source table on first access.
+
+Each row carries:
+
+* ``kind`` and ``object_id``: the source type (the ``Booking.service_type``
+  codes plus ``storeitem``) and primary key;
+* ``title``, ``price``, ``image`` and ``created_at`` copied from the source,
+  and the start of its description as ``summary``;
+* ``category``: the category name for services and store items, and the
+  event, shoot, cuisine or print type for the specialised services, with
+  ``category_id`` set where there is a category row;
+* ``facets``: the type-specific attributes (capacity, duration, the
+  ``includes_*`` flags, ...) as JSON.
+
+Rows are written in the same transaction as the source row by the
+post_save/post_delete receivers below; renaming a category rewrites the
+``category`` of its entries with one UPDATE.  Store item stock is not
+copied: it changes through UPDATEs that bypass signals (core.inventory).
+Writes that bypass signals altogether (bulk_create, raw SQL, restores) are
+repaired with ``manage.py rebuild_catalog``.
+"""
+
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import (
+    CatalogEntry, Catering, EventManagement, Photography, PrintingService,
+    Service, ServiceCategory, StoreCategory, StoreItem,
+)
+from .pagination import keyset_page
+from .versioning import VersionStamp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Characters of the source description kept for listing cards
+SUMMARY_LENGTH = 300
+
+# Bumped once a transaction that changed entries commits; in-process
+# structures derived from the catalog (core.facets) rebuild when it moves
+version = VersionStamp('catalog-entries')
+
+# Columns copied onto CatalogEntry; the rest of an entry goes into ``facets``
+ENTRY_FIELDS = ('title', 'summary', 'price', 'image', 'category', 'category_id', 'facets', 'created_at')
+
+
+class CatalogSource:
+    """Describes how the rows of one model are mapped onto catalog entries."""
+
+    def __init__(self, kind, model, title_field='title', category_field=None, category_model=None, facet_fields=()):
+        self.kind = kind
+        self.model = model
+        self.title_field = title_field
+        # Either a category foreign key or a plain type column
+        self.category_field = category_field
+        self.category_model = category_model
+        self.facet_fields = tuple(facet_fields)
+
+    def columns(self):
+        """Source columns read by ``rows``, in ``entry`` argument order."""
+        category = (f'{self.category_field}__name', f'{self.category_field}_id') if self.category_model else (self.category_field,)
+        return ('pk', self.title_field, 'description', 'price', 'image', 'created_at') + category + self.facet_fields
+
+    def entry(self, pk, title, description, price, image, created_at, *rest):
+        if self.category_model:
+            category, category_id = rest[:2]
+            facet_values = rest[2:]
+        else:
+            category, category_id = (rest[0] if self.category_field else ''), None
+            facet_values = rest[1:] if self.category_field else rest
+        return CatalogEntry(
+            kind=self.kind,
+            object_id=pk,
+            title=title,
+            summary=(description or '')[:SUMMARY_LENGTH],
+            price=price,
+            image=image or '',
+            category=category or '',
+            category_id=category_id,
+            facets=dict(zip(self.facet_fields, facet_values)),
+            created_at=created_at,
+        )
+
+    def entry_for(self, obj):
+        """The entry of a saved instance; reads its category unless already loaded."""
+        values = [obj.pk, getattr(obj, self.title_field), obj.description, obj.price, obj.image.name, obj.created_at]
+        if self.category_model:
+            category = getattr(obj, self.category_field)
+            values += [category.name, category.pk]
+        elif self.category_field:
+            values.append(getattr(obj, self.category_field))
+        values += [getattr(obj, name) for name in self.facet_fields]
+        return self.entry(*values)
+
+    def instance(self, entry):
+        """
+        The source model instance of ``entry``.  Columns an entry does not
+        carry (the full description, ``updated_at``) are deferred.
+        """
+        values = {
+            self.model._meta.pk.attname: entry.object_id,
+            self.title_field: entry.title,
+            'price': entry.price,
+            'image': entry.image.name,
+            'created_at': entry.created_at,
+            **{name: entry.facets[name] for name in self.facet_fields if name in entry.facets},
+        }
+        if self.category_model:
+            values[f'{self.category_field}_id'] = entry.category_id
+        elif self.category_field:
+            values[self.category_field] = entry.category
+        names = [field.attname for field in self.model._meta.concrete_fields if field.attname in values]
+        return self.model.from_db(entry._state.db, names, [values[name] for name in names])
+
+    def rows(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Yield an unsaved entry per source row, reading in chunks."""
+        queryset = self.model.objects.order_by('pk').values_list(*self.columns())
+        for values in queryset.iterator(chunk_size=batch_size):
+            yield self.entry(*values)
+
+
+SOURCES = {
+    'service': CatalogSource('service', Service, category_field='category', category_model=ServiceCategory),
+    'event': CatalogSource(
+        'event', EventManagement, category_field='event_type',
+        facet_fields=('capacity', 'duration', 'includes_decoration', 'includes_catering'),
+    ),
+    'photo': CatalogSource(
+        'photo', Photography, category_field='shoot_type',
+        facet_fields=('duration', 'includes_editing', 'number_of_photos', 'includes_prints'),
+    ),
+    'catering': CatalogSource(
+        'catering', Catering, category_field='cuisine_type',
+        facet_fields=('min_order_quantity', 'includes_serving_staff', 'includes_setup'),
+    ),
+    'printing': CatalogSource(
+        'printing', PrintingService, category_field='print_type',
+        facet_fields=('paper_type', 'min_order_quantity', 'includes_design', 'delivery_time'),
+    ),
+    'storeitem': CatalogSource('storeitem', StoreItem, title_field='name', category_field='category', category_model=StoreCategory),
+}
+
+SOURCE_BY_MODEL = {source.model: source for source in SOURCES.values()}
+SOURCE_BY_CATEGORY = {source.category_model: source for source in SOURCES.values() if source.category_model}
+
+SERVICE_KINDS = ('service', 'event', 'photo', 'catering', 'printing')
+SPECIALISED_KINDS = ('event', 'photo', 'catering', 'printing')
+
+
+# ============== QUERIES ==============
+
+def entries(kinds=None):
+    """Catalog entries, optionally restricted to some kinds."""
+    queryset = CatalogEntry.objects.all()
+    if kinds:
+        queryset = queryset.filter(kind__in=kinds)
+    return queryset
+
+
+def lookup(pairs):
+    """
+    ``{(kind, object_id): instance}`` of the source rows of ``pairs`` that
+    have an entry, read with one query (see ``CatalogSource.instance``).
+    """
+    ids_by_kind = {}
+    for kind, object_id in pairs:
+        ids_by_kind.setdefault(kind, set()).add(object_id)
+    if not ids_by_kind:
+        return {}
+    condition = Q()
+    for kind, ids in ids_by_kind.items():
+        condition |= Q(kind=kind, object_id__in=ids)
+    return {
+        (entry.kind, entry.object_id): SOURCES[entry.kind].instance(entry)
+        for entry in CatalogEntry.objects.filter(condition)
+    }
+
+
+def page(kinds, ordering, size, after=None):
+    """A keyset page of entries (see core.pagination) across ``kinds``."""
+    return keyset_page(entries(kinds), ordering, size, after=after)
+
+
+def as_dict(entry):
+    return {
+        'type': entry.kind,
+        'id': entry.object_id,
+        'title': entry.title,
+        'price': str(entry.price),
+        'image': entry.image.url if entry.image else None,
+        'category': entry.category,
+        'facets': entry.facets,
+    }
+
+
+def search(query, kinds=None, limit=50, queryset=None):
+    """
+    Entries (of ``queryset`` if given) whose title or category contains
+    every word of ``query``, titles starting with the first word first,
+    then by title.
+    """
+    terms = query.split()
+    if not terms:
+        return CatalogEntry.objects.none()
+    queryset = entries(kinds) if queryset is None else queryset
+    for term in terms:
+        queryset = queryset.filter(Q(title__icontains=term) | Q(category__icontains=term))
+    prefix = Case(When(title__istartswith=terms[0], then=Value(0)), default=Value(1), output_field=IntegerField())
+    return queryset.order_by(prefix, 'title', 'id')[:limit]
+
+
+# ============== MAINTENANCE ==============
+
+def refresh(obj):
+    """Write the entry of a saved source instance."""
+    entry = SOURCE_BY_MODEL[type(obj)].entry_for(obj)
+    CatalogEntry.objects.update_or_create(
+        kind=entry.kind,
+        object_id=entry.object_id,
+        defaults={name: getattr(entry, name) for name in ENTRY_FIELDS},
+    )
+    transaction.on_commit(version.bump)
+
+
+def remove(kind, object_id):
+    CatalogEntry.objects.filter(kind=kind, object_id=object_id).delete()
+    transaction.on_commit(version.bump)
+
+
+def refresh_category(category):
+    source = SOURCE_BY_CATEGORY[type(category)]
+    CatalogEntry.objects.filter(kind=source.kind, category_id=category.pk).update(category=category.name)
+    transaction.on_commit(version.bump)
+
+
+def rebuild(kinds=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Rewrite the entries of ``kinds`` (default: all) from the source tables.
+
+    Rows are upserted ``batch_size`` at a time, then entries whose source row
+    is gone are deleted.  Returns ``{kind: (written, deleted)}``.
+    """
+    results = {}
+    for kind in kinds or SOURCES:
+        source = SOURCES[kind]
+        written = 0
+        batch = []
+        for entry in source.rows(batch_size):
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                written += _upsert(batch)
+                batch = []
+        if batch:
+            written += _upsert(batch)
+        stale = CatalogEntry.objects.filter(kind=kind).exclude(object_id__in=source.model.objects.values('pk'))
+        deleted, _ = stale.delete()
+        results[kind] = (written, deleted)
+    version.bump()
+    return results
+
+
+def _upsert(batch):
+    # Single-statement upsert (INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE);
+    # MySQL takes no conflict target and matches on the (kind, object_id) key
+    options = {'update_conflicts': True, 'update_fields': list(ENTRY_FIELDS) + ['updated_at']}
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['kind', 'object_id']
+    with transaction.atomic():
+        CatalogEntry.objects.bulk_create(batch, **options)
+    return len(batch)
+
+
+CATALOG_FIELDS = {'title', 'name', 'description', 'price', 'image', 'category', 'category_id', 'created_at'}
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=EventManagement)
+@receiver(post_save, sender=Photography)
+@receiver(post_save, sender=Catering)
+@receiver(post_save, sender=PrintingService)
+@receiver(post_save, sender=StoreItem)
+def catalog_source_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the entry of a saved service or store item in step with it."""
+    if raw:
+        return
+    source = SOURCE_BY_MODEL[sender]
+    watched = CATALOG_FIELDS.union(source.facet_fields, [source.category_field])
+    if update_fields is not None and not watched.intersection(update_fields):
+        return
+    refresh(instance)
+
+
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=EventManagement)
+@receiver(post_delete, sender=Photography)
+@receiver(post_delete, sender=Catering)
+@receiver(post_delete, sender=PrintingService)
+@receiver(post_delete, sender=StoreItem)
+def catalog_source_deleted(sender, instance, **kwargs):
+    remove(SOURCE_BY_MODEL[sender].kind, instance.pk)
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_save, sender=StoreCategory)
+def catalog_category_saved(sender, instance, created, raw=False, **kwargs):
+    """Entries carry their category's name; rewrite it on rename."""
+    if not created and not raw:
+        refresh_category(instance)
@@ -0,0 +1,389 @@
+"""
+Publish/subscribe channel layer for multi-process deployments.
+
+``InMemoryChannelLayer`` only reaches consumers in the same process, so a
+notification published by one worker never reaches a WebSocket held by
+another.  ``PubSubChannelLayer`` relays messages through a broker that
+speaks the Redis protocol:
+
+* a real Redis server (``redis://host:6379/0``), or
+* ``Broker``, a small RESP server that implements just SUBSCRIBE,
+  UNSUBSCRIBE, PUBLISH and PING.  Run it on a Unix socket for
+  multi-process single-host deployments
+  (``manage.py channel_broker --socket /run/eventnest/channels.sock``,
+  layer URL ``unix:///run/eventnest/channels.sock``), or on TCP as a local
+  stand-in for Redis in tests and benchmarks.
+
+Consumers live in per-process queues.  Each layer instance subscribes to
+one topic for its own specific channels and to one topic per group that
+has local members, so ``group_send`` is a single PUBLISH however many
+consumers are connected: every process that has members receives the
+message once and fans it out to its local queues.  Members in the
+sending process are served directly without waiting for the broker.
+
+Delivery is at-most-once, as in channels_redis' pub/sub layer: messages
+for processes that are not connected are lost, and a full consumer queue
+drops group messages.  When the broker connection drops, the listener
+reconnects with exponential backoff (``RECONNECT_DELAY`` up to
+``MAX_RECONNECT_DELAY`` seconds) and resubscribes to every topic, so
+connected consumers keep receiving; messages published while it was
+disconnected are lost.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+import weakref
+from collections import defaultdict
+
+import redis.asyncio as redis
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the first reconnection attempt, doubled after each failure
+RECONNECT_DELAY = 0.1
+MAX_RECONNECT_DELAY = 5.0
+
+
+class PubSubChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, url='unix:///tmp/eventnest-channels.sock', prefix='channels', capacity=100, **kwargs):
+        super().__init__(capacity=capacity, **kwargs)
+        self.url = url
+        self.prefix = prefix
+        self.instance = uuid.uuid4().hex[:12]
+        self.queues = {}
+        self.groups = defaultdict(set)
+        self._subscribed = set()
+        self._clients = weakref.WeakKeyDictionary()
+        self._pubsub = None
+        self._listener = None
+        self._loop = None
+        self._lock = None
+
+    # ---------- connections ----------
+
+    def _client(self):
+        """Publishing connection for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = redis.from_url(self.url)
+        return client
+
+    def _local(self):
+        """True when called on the loop that owns this process's consumers."""
+        return self._loop is not None and asyncio.get_running_loop() is self._loop
+
+    async def _ensure_listener(self):
+        if self._listener is not None and not self._listener.done():
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._listener is not None and not self._listener.done():
+                return
+            self._loop = asyncio.get_running_loop()
+            await self._connect()
+            self._listener = asyncio.ensure_future(self._listen())
+
+    async def _connect(self):
+        """Open a new subscriber connection for everything this process listens to.  Callers hold the lock."""
+        pubsub, self._pubsub = self._pubsub, self._client().pubsub()
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        topics = {self._topic(f'specific.{self.instance}!')}
+        topics |= {self._group_topic(group) for group in self.groups}
+        topics |= {self._topic(channel) for channel in self.queues if '!' not in channel}
+        self._subscribed = set()
+        await self._pubsub.subscribe(*topics)
+        self._subscribed = topics
+
+    async def _subscribe(self, topic):
+        async with self._lock:
+            if topic not in self._subscribed:
+                self._subscribed.add(topic)
+                try:
+                    await self._pubsub.subscribe(topic)
+                except (ConnectionError, redis.ConnectionError):
+                    # The listener resubscribes to it once it has reconnected
+                    logger.warning('Could not subscribe to %s; waiting for the listener to reconnect', topic)
+
+    async def _unsubscribe(self, topic):
+        async with self._lock:
+            if topic in self._subscribed:
+                self._subscribed.discard(topic)
+                try:
+                    await self._pubsub.unsubscribe(topic)
+                except (ConnectionError, redis.ConnectionError):
+                    pass  # not resubscribed on reconnection either
+
+    def _topic(self, name):
+        return f'{self.prefix}:{self.non_local_name(name)}'
+
+    def _group_topic(self, group):
+        return f'{self.prefix}:group:{group}'
+
+    # ---------- delivery ----------
+
+    async def _listen(self):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    delay = RECONNECT_DELAY
+                    if message['type'] != 'message':
+                        continue
+                    envelope = json.loads(message['data'])
+                    if envelope.get('origin') == self.instance:
+                        continue  # already delivered locally by group_send
+                    if 'group' in envelope:
+                        self._deliver_group(envelope['group'], envelope['message'])
+                    else:
+                        self._deliver(envelope['channel'], envelope['message'], raise_full=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Channel layer listener for %s lost its connection', self.url)
+            await self._reconnect(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def _reconnect(self, delay):
+        """Resubscribe after ``delay`` seconds, retrying with backoff until the broker answers."""
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                async with self._lock:
+                    await self._connect()
+                logger.info('Channel layer listener for %s reconnected', self.url)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                logger.warning('Could not reconnect to %s (%s); retrying in %.1fs', self.url, exc, delay)
+
+    def _deliver(self, channel, message, raise_full=True):
+        queue = self.queues.get(channel)
+        if queue is None:
+            if '!' in channel:
+                return  # consumer has gone away
+            queue = self.queues[channel] = asyncio.Queue()
+        if queue.qsize() >= self.get_capacity(channel):
+            if raise_full:
+                raise ChannelFull(channel)
+            return
+        queue.put_nowait(message)
+
+    def _deliver_group(self, group, message):
+        for channel in tuple(self.groups.get(group, ())):
+            self._deliver(channel, message, raise_full=False)
+
+    async def _publish(self, topic, envelope):
+        await self._client().publish(topic, json.dumps(envelope))
+
+    # ---------- channel layer API ----------
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        if self._local() and channel in self.queues:
+            self._deliver(channel, message)
+            return
+        await self._publish(self._topic(channel), {'channel': channel, 'message': message})
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        await self._ensure_listener()
+        if channel not in self.queues:
+            self.queues[channel] = asyncio.Queue()
+            if '!' not in channel:
+                await self._subscribe(self._topic(channel))
+        try:
+            return await self.queues[channel].get()
+        except asyncio.CancelledError:
+            # The consumer's receive loop is cancelled when it disconnects
+            if '!' in channel:
+                self.queues.pop(channel, None)
+            raise
+
+    async def new_channel(self, prefix='specific'):
+        await self._ensure_listener()
+        channel = f'{prefix}.{self.instance}!{uuid.uuid4().hex}'
+        self.queues[channel] = asyncio.Queue()
+        return channel
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._ensure_listener()
+        members = self.groups[group]
+        members.add(channel)
+        if len(members) == 1:
+            await self._subscribe(self._group_topic(group))
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        members = self.groups.get(group)
+        if members is None:
+            return
+        members.discard(channel)
+        if not members:
+            del self.groups[group]
+            await self._unsubscribe(self._group_topic(group))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_group_name(group)
+        envelope = {'group': group, 'message': message}
+        if self._local():
+            self._deliver_group(group, message)
+            envelope['origin'] = self.instance
+        await self._publish(self._group_topic(group), envelope)
+
+    async def flush(self):
+        self.queues.clear()
+        self.groups.clear()
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        self._subscribed.clear()
+
+    async def close(self):
+        await self.flush()
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+# ============== BROKER ==============
+
+class Broker:
+    """
+    Minimal Redis-protocol pub/sub server.
+
+    Understands SUBSCRIBE, UNSUBSCRIBE, PUBLISH and PING; any other command
+    (redis-py sends CLIENT SETINFO on connect) gets an error reply, which
+    clients ignore.  Subscribers that stop reading are disconnected once
+    ``max_buffer`` bytes are waiting for them.
+    """
+
+    def __init__(self, max_buffer=64 * 1024 * 1024):
+        self.max_buffer = max_buffer
+        self.subscribers = defaultdict(set)
+        self.connections = set()
+        self.published = 0
+        self.server = None
+
+    async def start(self, socket_path=None, host='127.0.0.1', port=0):
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.server = await asyncio.start_unix_server(self.handle, path=socket_path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    @property
+    def address(self):
+        socket = self.server.sockets[0].getsockname()
+        return f'unix://{socket}' if isinstance(socket, str) else f'redis://{socket[0]}:{socket[1]}'
+
+    async def close(self):
+        self.server.close()
+        for writer in tuple(self.connections):
+            writer.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    def encode(*items):
+        parts = [f'*{len(items)}\r\n'.encode()]
+        for item in items:
+            if isinstance(item, int):
+                parts.append(f':{item}\r\n'.encode())
+            else:
+                if isinstance(item, str):
+                    item = item.encode()
+                parts.append(b'$%d\r\n%s\r\n' % (len(item), item))
+        return b''.join(parts)
+
+    async def read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()  # inline command, e.g. from redis-cli or telnet
+        arguments = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            arguments.append((await reader.readexactly(length + 2))[:-2])
+        return arguments
+
+    async def handle(self, reader, writer):
+        topics = set()
+        self.connections.add(writer)
+        try:
+            while True:
+                command = await self.read_command(reader)
+                if command is None:
+                    break
+                if not command:
+                    continue
+                name = command[0].upper()
+                if name == b'SUBSCRIBE':
+                    for topic in command[1:]:
+                        topics.add(topic)
+                        self.subscribers[topic].add(writer)
+                        writer.write(self.encode('subscribe', topic, len(topics)))
+                elif name == b'UNSUBSCRIBE':
+                    for topic in command[1:] or list(topics):
+                        topics.discard(topic)
+                        self._remove(topic, writer)
+                        writer.write(self.encode('unsubscribe', topic, len(topics)))
+                elif name == b'PUBLISH':
+                    writer.write(b':%d\r\n' % self.publish(command[1], command[2]))
+                elif name == b'PING':
+                    writer.write(self.encode('pong', b'') if topics else b'+PONG\r\n')
+                else:
+                    writer.write(b'-ERR unknown command\r\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for topic in topics:
+                self._remove(topic, writer)
+            self.connections.discard(writer)
+            writer.close()
+
+    def publish(self, topic, data):
+        self.published += 1
+        subscribers = self.subscribers.get(topic, ())
+        if not subscribers:
+            return 0
+        frame = self.encode('message', topic, data)
+        for writer in tuple(subscribers):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                logger.warning('Disconnecting slow subscriber from %r', topic)
+                writer.transport.abort()
+                continue
+            writer.write(frame)
+        return len(subscribers)
+
+    def _remove(self, topic, writer):
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self.subscribers[topic]
@@ -0,0 +1,126 @@
+"""
+Checkout pipeline: turn a cart into an order in one transaction.
+
+``place_order`` locks the cart and its lines, commits their stock
+reservations (topping up any that expired with at most one batched
+conditional UPDATE), creates the order and all of its lines with
+``bulk_create``, clears the cart with a single DELETE and writes the order
+notification.  The number of queries does not grow with the number of cart
+lines.
+
+Checkouts are idempotent per client-supplied token: the checkout form
+carries a random token, and resubmitting it (double clicks, retries after a
+timeout) returns the order already placed instead of a second one.
+"""
+
+import logging
+
+from django.db import IntegrityError, transaction
+
+from .deletion import delete_rows
+from .inventory import InsufficientStock, release_many, reserve_many
+from .models import Cart, CartItem, Notification, Order, OrderItem, StockReservation, StoreItem
+
+logger = logging.getLogger(__name__)
+
+
+class EmptyCart(Exception):
+    """Raised when there is nothing to check out."""
+
+
+def place_order(user, shipping_address, checkout_token=None):
+    """
+    Check out ``user``'s cart and return ``(order, created)``.
+
+    ``created`` is False when ``checkout_token`` was already used for an
+    order, which is then returned unchanged.  Raises ``EmptyCart`` or
+    ``InsufficientStock``; in both cases nothing is written.
+    """
+    checkout_token = checkout_token or None
+    try:
+        with transaction.atomic():
+            return _place_order(user, shipping_address, checkout_token)
+    except IntegrityError:
+        # A concurrent request with the same token won the race
+        if checkout_token is None:
+            raise
+        return Order.objects.get(user=user, checkout_token=checkout_token), False
+
+
+def _place_order(user, shipping_address, checkout_token):
+    # The cart row lock serializes checkouts of the same cart
+    cart = Cart.objects.select_for_update().filter(user=user).first()
+
+    if checkout_token is not None:
+        existing = Order.objects.filter(user=user, checkout_token=checkout_token).first()
+        if existing is not None:
+            return existing, False
+
+    if cart is None:
+        raise EmptyCart()
+    lines = list(
+        CartItem.objects.select_for_update(of=('self',))
+        .filter(cart=cart, quantity__gt=0)
+        .select_related('item')
+    )
+    if not lines:
+        raise EmptyCart()
+
+    # Reservations normally cover every line; top up those that expired
+    reserved = dict(
+        StockReservation.objects.select_for_update()
+        .filter(cart=cart)
+        .values_list('cart_item_id', 'quantity')
+    )
+    shortfall, surplus = {}, {}
+    for line in lines:
+        difference = line.quantity - reserved.get(line.pk, 0)
+        if difference > 0:
+            shortfall[line.item_id] = shortfall.get(line.item_id, 0) + difference
+        elif difference < 0:
+            surplus[line.item_id] = surplus.get(line.item_id, 0) - difference
+    if shortfall:
+        savepoint = transaction.savepoint()
+        if not reserve_many(shortfall):
+            # Undo the items that did succeed so the stock read below is accurate
+            transaction.savepoint_rollback(savepoint)
+            raise _shortage(lines, shortfall, reserved)
+    release_many(surplus)
+
+    total = sum(line.get_total() for line in lines)
+    order = Order.objects.create(
+        user=user,
+        total_amount=total,
+        status='pending',
+        shipping_address=shipping_address,
+        checkout_token=checkout_token,
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, item_id=line.item_id, quantity=line.quantity, price=line.item.price)
+        for line in lines
+    ])
+
+    # Reservations are consumed by the order; delete them and the lines in
+    # bulk, bypassing the per-row CartItem delete handlers that would
+    # return the stock and adjust the counters one line at a time
+    delete_rows(StockReservation, 'cart', [cart.pk])
+    delete_rows(CartItem, 'cart', [cart.pk])
+    Cart.objects.filter(pk=cart.pk).update(item_count=0, total_quantity=0)
+
+    Notification.objects.create(
+        user=user,
+        notification_type='order',
+        title='Order Placed Successfully! 🛒',
+        message=f'Your order #{order.id} for ৳{int(total)} has been placed. We will process it soon and update you on delivery.',
+        link='/orders/'
+    )
+    logger.info('Order #%s placed with %d lines', order.id, len(lines))
+    return order, True
+
+
+def _shortage(lines, shortfall, reserved):
+    """Build the InsufficientStock error for the first line that cannot be filled."""
+    available = dict(StoreItem.objects.filter(pk__in=shortfall).values_list('pk', 'stock'))
+    short = [line for line in lines if line.item_id in shortfall]
+    line = next((line for line in short if available.get(line.item_id, 0) < shortfall[line.item_id]), short[0])
+    return InsufficientStock(line.item_id, line.quantity, reserved.get(line.pk, 0) + available.get(line.item_id, 0))
@@ -0,0 +1,39 @@
+"""
+WebSocket consumers.
+"""
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .notifications import group_name, unread_count_async
+
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+    """Pushes unread-count changes to the navbar badge (see core.notifications)."""
+
+    group = None
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.user_id = user.pk
+        self.group = group_name(user.pk)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+        await self.send_unread_count()
+
+    async def disconnect(self, code):
+        if self.group is not None:
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Clients may ask for the absolute count, e.g. after waking from sleep
+        if content.get('type') == 'sync':
+            await self.send_unread_count()
+
+    async def send_unread_count(self):
+        await self.send_json({'type': 'unread_count', 'count': await unread_count_async(self.user_id)})
+
+    async def notification_event(self, event):
+        await self.send_json(event['payload'])
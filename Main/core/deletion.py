@@ -0,0 +1,34 @@
+"""
+Bulk deletes that skip Django's deletion collector.
+
+``QuerySet.delete()`` fetches the rows it deletes so that it can cascade
+and send ``pre_delete``/``post_delete`` for each of them.  A few write paths
+already account for the rows they remove in bulk (checkout returns no
+stock for consumed reservations, the retention sweep publishes unread-count
+deltas per batch) and must not run the per-row handlers; they delete with
+one plain SQL statement through this module instead of Django internals.
+"""
+
+from django.db import connections, router
+
+
+def delete_rows(model, field, values):
+    """
+    ``DELETE FROM <table> WHERE <field> IN (values)`` in one statement.
+
+    No signals are sent and nothing cascades, so only use it for rows no
+    other table still references.  Returns the number of rows deleted.
+    """
+    values = list(values)
+    if not values:
+        return 0
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    column = model._meta.get_field(field).column
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})',
+            values,
+        )
+        return cursor.rowcount
@@ -0,0 +1,253 @@
+"""
+Responsive image derivatives.
+
+Catalog images are uploaded at full size, often several megabytes, while a
+card shows them a few hundred pixels wide.  For every source image this
+module writes resized copies at ``IMAGE_DERIVATIVE_WIDTHS`` (never wider
+than the source) in AVIF and WebP where Pillow can encode them, plus a JPEG
+(PNG for images with transparency) fallback:
+
+    MEDIA_ROOT/derivatives/<key[:2]>/<key>/<width>.<ext>
+    MEDIA_ROOT/derivatives/<key[:2]>/<key>/manifest.json
+
+``key`` is a hash of the source's name, size and modification time and
+of the encoding settings, so replacing a file in place or changing the
+settings gives a new key, and a derivative URL never needs invalidating.
+The manifest is written last and lists what was produced; its presence
+marks a complete set.
+
+Derivatives are built in a background thread when an image field is saved,
+on demand the first time a template asks for an image that has none (the
+page falls back to the original until they exist), and in bulk by the
+``build_image_derivatives`` command.  Templates use the
+``responsive_image`` tag (core/templatetags/image_tags.py).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps, features
+
+from .models import Catering, EventManagement, Photography, PrintingService, Service, StoreItem
+
+logger = logging.getLogger(__name__)
+
+# Bump when the resizing or encoding below changes
+DERIVATIVE_VERSION = 1
+
+# Models whose ``image`` field gets derivatives
+IMAGE_MODELS = (Service, EventManagement, Photography, Catering, PrintingService, StoreItem)
+
+# (format, MIME type, Pillow save options), best compression first
+MODERN_FORMATS = [
+    (name, mime, options)
+    for name, mime, options in (
+        ('avif', 'image/avif', {'quality': 55, 'speed': 6}),
+        ('webp', 'image/webp', {'quality': 78, 'method': 4}),
+    )
+    if features.check(name)
+]
+FALLBACK_FORMATS = {
+    'jpeg': ('image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('image/png', {'optimize': True}),
+}
+EXTENSIONS = {'jpeg': 'jpg'}
+
+MANIFEST_CACHE_SIZE = 2048
+
+
+def widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (320, 640, 960, 1280))))
+
+
+def root():
+    return Path(settings.MEDIA_ROOT) / 'derivatives'
+
+
+def is_local(name):
+    """Whether ``name`` is a file in media storage rather than an external URL."""
+    return bool(name) and not name.startswith(('http://', 'https://'))
+
+
+def source_key(name):
+    """Derivative key of the media file ``name``, or None if it does not exist."""
+    try:
+        stat = os.stat(Path(settings.MEDIA_ROOT) / name)
+    except (OSError, ValueError):
+        return None
+    formats = [format_name for format_name, _, _ in MODERN_FORMATS]
+    message = f'{name}:{stat.st_size}:{stat.st_mtime_ns}:{DERIVATIVE_VERSION}:{widths()}:{formats}'
+    return hashlib.sha256(message.encode()).hexdigest()[:32]
+
+
+def key_directory(key):
+    return root() / key[:2] / key
+
+
+def _write_atomic(path, write):
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as handle:
+            write(handle)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def generate(name, force=False):
+    """
+    Build the derivatives of the media file ``name`` and return its
+    manifest, or None if the file is missing or not an image.
+    """
+    key = source_key(name)
+    if key is None:
+        return None
+    directory = key_directory(key)
+    manifest_path = directory / 'manifest.json'
+    if manifest_path.exists() and not force:
+        return load_manifest(key)
+
+    try:
+        with Image.open(Path(settings.MEDIA_ROOT) / name) as source:
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except (OSError, Image.DecompressionBombError, SyntaxError):
+        logger.warning('Cannot build derivatives of %s', name, exc_info=True)
+        return None
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpeg'
+
+    sizes = [width for width in widths() if width < image.width] + [min(image.width, widths()[-1])]
+    formats = MODERN_FORMATS + [(fallback, *FALLBACK_FORMATS[fallback])]
+    directory.mkdir(parents=True, exist_ok=True)
+    variants = {}
+    # Largest first, each step resized from the previous one: much faster
+    # than resampling the full-size source every time, at no visible cost
+    current = image
+    for width in sorted(set(sizes), reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        current = current.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        for format_name, mime, options in formats:
+            filename = f'{width}.{EXTENSIONS.get(format_name, format_name)}'
+            _write_atomic(directory / filename, lambda handle: current.save(handle, format_name.upper(), **options))
+            variants.setdefault(format_name, []).append(
+                (width, f'derivatives/{key[:2]}/{key}/{filename}', (directory / filename).stat().st_size)
+            )
+
+    manifest = {
+        'source': name,
+        'width': image.width,
+        'height': image.height,
+        'formats': [(format_name, mime) for format_name, mime, _ in formats],
+        'variants': {format_name: sorted(entries) for format_name, entries in variants.items()},
+    }
+    _write_atomic(manifest_path, lambda handle: handle.write(json.dumps(manifest).encode()))
+    return manifest
+
+
+# ============== MANIFEST LOOKUP ==============
+
+_manifests = OrderedDict()
+_manifests_lock = threading.Lock()
+
+
+def load_manifest(key):
+    """The manifest for ``key`` if its derivatives exist, else None."""
+    with _manifests_lock:
+        manifest = _manifests.get(key)
+        if manifest is not None:
+            _manifests.move_to_end(key)
+            return manifest
+    try:
+        manifest = json.loads((key_directory(key) / 'manifest.json').read_bytes())
+    except (OSError, ValueError):
+        # Missing manifests are not cached: they appear once generated
+        return None
+    with _manifests_lock:
+        _manifests[key] = manifest
+        while len(_manifests) > MANIFEST_CACHE_SIZE:
+            _manifests.popitem(last=False)
+    return manifest
+
+
+def manifest_for(name):
+    """
+    The manifest of the media file ``name``.  When there is none yet,
+    queue its generation and return None so the caller uses the original.
+    """
+    if not is_local(name):
+        return None
+    key = source_key(name)
+    if key is None:
+        return None
+    manifest = load_manifest(key)
+    if manifest is None:
+        schedule(name)
+    return manifest
+
+
+# ============== BACKGROUND GENERATION ==============
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_THREADS', 1),
+                thread_name_prefix='image-derivatives',
+            )
+        return _executor
+
+
+def _generate_in_background(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Building the derivatives of %s failed', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+
+
+def schedule(name):
+    """Build the derivatives of ``name`` in a background thread."""
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    _get_executor().submit(_generate_in_background, name)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=EventManagement)
+@receiver(post_save, sender=Photography)
+@receiver(post_save, sender=Catering)
+@receiver(post_save, sender=PrintingService)
+@receiver(post_save, sender=StoreItem)
+def image_saved(sender, instance, update_fields=None, **kwargs):
+    if not getattr(settings, 'IMAGE_DERIVATIVES_ON_SAVE', True):
+        return
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    name = instance.image.name
+    if is_local(name):
+        transaction.on_commit(lambda: schedule(name))
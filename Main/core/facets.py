@@ -0,0 +1,389 @@
+"""
+Faceted filtering for the catalog listings.
+
+A scope (``service`` for the services page, ``storeitem`` for the store)
+declares its facets:
+
+* multi-select facets (``?type=event&type=photo``): rows matching any
+  selected value;
+* flags (``?includes_catering=1``): rows where a boolean attribute is set;
+* ranges (``?price_min=100&price_max=500``): rows within the bounds.
+
+Selections on different facets are combined with AND.
+
+Each scope keeps a ``FacetIndex`` in process memory, built from the catalog
+read model (core.catalog) with one query.  Each row gets a position, and
+every facet value maps to a bitmap (a Python int) of the positions holding
+it.  Range facets keep their values sorted with their positions, and a
+bitmap per bucket of roughly equal size.  Filtering ANDs and ORs bitmaps,
+and a count is ``(value & mask).bit_count()``, so the filter sidebar with
+its counts renders without a GROUP BY per facet.  The counts of each facet
+ignore that facet's own selection, so selecting one event type still shows
+how many rows the other types would add.  The sidebar of every category
+page with nothing else selected is computed when the index is built.
+
+Listing rows still come from the database: ``filter_q`` turns a selection
+into a Q on the scope's model, using the same indexes as the category and
+price filters.  The index is rebuilt on the first use after the catalog
+version moves (see core.catalog), so its counts can lag a change made in
+another process by up to ``VERSION_CHECK_INTERVAL`` seconds, plus the
+rebuild: one request per process rebuilds while concurrent ones keep
+counting from the previous indexes.
+"""
+
+import bisect
+import logging
+import threading
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+from . import catalog
+from .models import CatalogEntry
+
+logger = logging.getLogger(__name__)
+
+# Buckets shown for a range facet
+RANGE_BUCKETS = 5
+
+# Prefix bitmaps kept per range facet; a range filter scans at most
+# 2 / RANGE_CHECKPOINTS of the facet's rows
+RANGE_CHECKPOINTS = 32
+
+ENTRY_COLUMNS = ('pk', 'kind', 'object_id', 'category', 'category_id', 'price')
+
+
+class Facet:
+    """
+    One filterable attribute of catalog entries.
+
+    ``field`` is a CatalogEntry column or a key of ``CatalogEntry.facets``;
+    ``kinds`` limits the facet to entries of those kinds.
+    """
+
+    def __init__(self, name, label, field, type='choice', kinds=None, labels=None):
+        self.name = name
+        self.label = label
+        self.field = field
+        self.type = type
+        self.kinds = tuple(kinds) if kinds else None
+        self.labels = labels or {}
+
+    @property
+    def lookup(self):
+        return self.field if self.field in ENTRY_COLUMNS else f'facets__{self.field}'
+
+    def value(self, row, attributes):
+        if self.kinds and row[1] not in self.kinds:
+            return None
+        if self.field in ENTRY_COLUMNS:
+            return row[ENTRY_COLUMNS.index(self.field)]
+        return attributes.get(self.field)
+
+    def parse(self, params):
+        """This facet's selection in query ``params``, or None."""
+        if self.type == 'choice':
+            values = [value for value in params.getlist(self.name) if value]
+            if self.field == 'category_id':
+                values = [value for value in values if value.isdigit()]
+            return sorted(set(values)) or None
+        if self.type == 'flag':
+            return True if params.get(self.name) in ('1', 'on', 'true') else None
+        bounds = (number(params.get(f'{self.name}_min')), number(params.get(f'{self.name}_max')))
+        return bounds if bounds != (None, None) else None
+
+    def params(self, selected):
+        """Query parameters reproducing ``selected``."""
+        if self.type == 'choice':
+            return [(self.name, value) for value in selected]
+        if self.type == 'flag':
+            return [(self.name, '1')]
+        low, high = selected
+        return [(f'{self.name}_{end}', bound) for end, bound in (('min', low), ('max', high)) if bound is not None]
+
+    def q(self, selected):
+        if self.type == 'choice':
+            condition = Q(**{f'{self.lookup}__in': selected})
+        elif self.type == 'flag':
+            condition = Q(**{self.lookup: True})
+        else:
+            low, high = selected
+            condition = Q()
+            if low is not None:
+                condition &= Q(**{f'{self.lookup}__gte': low})
+            if high is not None:
+                condition &= Q(**{f'{self.lookup}__lte': high})
+        if self.kinds:
+            condition &= Q(kind__in=self.kinds)
+        return condition
+
+
+def number(value):
+    """A query parameter as an int or Decimal, or None."""
+    try:
+        parsed = Decimal(value)
+    except (TypeError, InvalidOperation):
+        return None
+    if not parsed.is_finite():
+        return None
+    return int(parsed) if parsed == parsed.to_integral_value() else parsed
+
+
+class Scope:
+    """The entries a listing shows and the facets it offers."""
+
+    def __init__(self, name, kinds, facets):
+        self.name = name
+        self.kinds = tuple(kinds)
+        self.facets = {facet.name: facet for facet in facets}
+
+    def parse(self, params):
+        """``{facet name: selection}`` for the facets set in ``params``."""
+        selection = {}
+        for name, facet in self.facets.items():
+            selected = facet.parse(params)
+            if selected is not None:
+                selection[name] = selected
+        return selection
+
+    def params(self, selection):
+        pairs = []
+        for name, selected in sorted(selection.items()):
+            pairs.extend(self.facets[name].params(selected))
+        return pairs
+
+    def filter_q(self, selection):
+        """Q restricting the listing's queryset to ``selection``."""
+        condition = Q()
+        for name, selected in selection.items():
+            condition &= self.facets[name].q(selected)
+        return condition
+
+
+KIND_LABELS = dict(CatalogEntry.KIND_CHOICES)
+
+SCOPES = {
+    'service': Scope('service', catalog.SERVICE_KINDS, [
+        Facet('type', 'Service type', 'kind', labels=KIND_LABELS),
+        Facet('category', 'Category', 'category_id', kinds=['service']),
+        Facet('event_type', 'Event type', 'category', kinds=['event']),
+        Facet('shoot_type', 'Shoot type', 'category', kinds=['photo']),
+        Facet('cuisine_type', 'Cuisine', 'category', kinds=['catering']),
+        Facet('print_type', 'Print type', 'category', kinds=['printing']),
+        Facet('price', 'Price', 'price', type='range'),
+        Facet('capacity', 'Guests', 'capacity', type='range', kinds=['event']),
+        Facet('duration', 'Duration (hours)', 'duration', type='range', kinds=['event', 'photo']),
+        Facet('includes_decoration', 'Decoration included', 'includes_decoration', type='flag', kinds=['event']),
+        Facet('includes_catering', 'Catering included', 'includes_catering', type='flag', kinds=['event']),
+        Facet('includes_editing', 'Editing included', 'includes_editing', type='flag', kinds=['photo']),
+        Facet('includes_prints', 'Prints included', 'includes_prints', type='flag', kinds=['photo']),
+        Facet('includes_serving_staff', 'Serving staff', 'includes_serving_staff', type='flag', kinds=['catering']),
+        Facet('includes_setup', 'Setup included', 'includes_setup', type='flag', kinds=['catering']),
+        Facet('includes_design', 'Design included', 'includes_design', type='flag', kinds=['printing']),
+    ]),
+    'storeitem': Scope('storeitem', ['storeitem'], [
+        Facet('category', 'Category', 'category_id'),
+        Facet('price', 'Price', 'price', type='range'),
+    ]),
+}
+
+
+def bitmap(positions, size):
+    """An int with the bits at ``positions`` set."""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class RangeColumn:
+    """
+    The values of a range facet in sorted order, with their positions.
+
+    ``prefixes[i]`` is the bitmap of the first ``i * stride`` rows in value
+    order, so the rows between two sorted offsets are the difference of two
+    prefixes plus the few rows between each offset and its checkpoint.
+    """
+
+    def __init__(self, pairs, size):
+        pairs.sort()
+        self.values = [value for value, _ in pairs]
+        self.positions = [position for _, position in pairs]
+        self.size = size
+        count = len(pairs)
+        self.stride = max(1, -(-count // RANGE_CHECKPOINTS))
+        self.prefixes = [0]
+        for start in range(0, count, self.stride):
+            block = bitmap(self.positions[start:start + self.stride], size)
+            self.prefixes.append(self.prefixes[-1] | block)
+        self.buckets = []
+        if count:
+            step = max(1, -(-count // RANGE_BUCKETS))
+            start = 0
+            while start < count:
+                # Keep equal values in one bucket
+                end = bisect.bisect_right(self.values, self.values[min(start + step, count) - 1])
+                self.buckets.append((self.values[start], self.values[end - 1], bitmap(self.positions[start:end], size)))
+                start = end
+
+    def _first(self, offset):
+        """Bitmap of the first ``offset`` rows in value order."""
+        checkpoint = offset // self.stride
+        return self.prefixes[checkpoint] | bitmap(self.positions[checkpoint * self.stride:offset], self.size)
+
+    def between(self, low, high):
+        start = 0 if low is None else bisect.bisect_left(self.values, low)
+        end = len(self.values) if high is None else bisect.bisect_right(self.values, high)
+        if start >= end:
+            return 0
+        return self._first(end) & ~self._first(start)
+
+
+class FacetIndex:
+    """Immutable bitmap index over the catalog entries of one scope."""
+
+    def __init__(self, scope, rows):
+        self.scope = scope
+        self.size = len(rows)
+        self.everything = (1 << self.size) - 1
+        self.positions = {}
+        choices = {name: {} for name, facet in scope.facets.items() if facet.type != 'range'}
+        ranges = {name: [] for name, facet in scope.facets.items() if facet.type == 'range'}
+        self.labels = {name: {} for name in choices}
+        for position, (row, attributes) in enumerate(rows):
+            self.positions[row[1], row[2]] = position
+            for name, facet in scope.facets.items():
+                value = facet.value(row, attributes)
+                if value is None or value == '':
+                    continue
+                if facet.type == 'range':
+                    ranges[name].append((value, position))
+                elif facet.type == 'flag':
+                    if value:
+                        choices[name].setdefault('1', []).append(position)
+                else:
+                    key = str(value)
+                    choices[name].setdefault(key, []).append(position)
+                    if key not in self.labels[name]:
+                        self.labels[name][key] = facet.labels.get(value, row[3] if facet.field == 'category_id' else str(value))
+        self.bitmaps = {
+            name: {key: bitmap(positions, self.size) for key, positions in values.items()}
+            for name, values in choices.items()
+        }
+        self.ranges = {name: RangeColumn(pairs, self.size) for name, pairs in ranges.items()}
+        # The sidebar of each category page, and of the unfiltered listing
+        self.category_sidebars = {(): self._sidebar({}, self.everything)}
+        for key in self.bitmaps.get('category', {}):
+            selection = {'category': [key]}
+            self.category_sidebars[(key,)] = self._sidebar(selection, self.everything)
+
+    def _matching(self, name, selected):
+        facet = self.scope.facets[name]
+        if facet.type == 'range':
+            return self.ranges[name].between(*selected)
+        values = self.bitmaps[name]
+        if facet.type == 'flag':
+            return values.get('1', 0)
+        matching = 0
+        for key in selected:
+            matching |= values.get(str(key), 0)
+        return matching
+
+    def mask(self, selection, exclude=None, matching=None):
+        """Bitmap of the rows matching ``selection``, ignoring facet ``exclude``."""
+        mask = self.everything
+        for name, selected in selection.items():
+            if name != exclude:
+                mask &= matching[name] if matching else self._matching(name, selected)
+        return mask
+
+    def restrict_to(self, pairs):
+        """Bitmap of the rows with these ``(kind, object_id)`` pairs."""
+        return bitmap([self.positions[pair] for pair in pairs if pair in self.positions], self.size)
+
+    def sidebar(self, selection, restrict=None):
+        """
+        ``(total, facets)`` for ``selection``: the number of matching rows
+        and, per facet, its values or buckets with the rows each would match.
+        ``restrict`` is a bitmap limiting every count (e.g. search results).
+        """
+        if restrict is None and set(selection) <= {'category'}:
+            cached = self.category_sidebars.get(tuple(selection.get('category', ())))
+            if cached is not None:
+                return cached
+        return self._sidebar(selection, self.everything if restrict is None else restrict)
+
+    def _sidebar(self, selection, restrict):
+        matching = {name: self._matching(name, selected) for name, selected in selection.items()}
+        total = (self.mask(selection, matching=matching) & restrict).bit_count()
+        facets = []
+        for name, facet in self.scope.facets.items():
+            mask = self.mask(selection, exclude=name, matching=matching) & restrict
+            selected = selection.get(name)
+            if facet.type == 'range':
+                buckets = [
+                    {'low': low, 'high': high, 'count': (bits & mask).bit_count()}
+                    for low, high, bits in self.ranges[name].buckets
+                ]
+                if not any(bucket['count'] for bucket in buckets):
+                    continue
+                low, high = selected or (None, None)
+                facets.append({'name': name, 'label': facet.label, 'type': facet.type,
+                               'buckets': buckets, 'low': low, 'high': high})
+                continue
+            values = []
+            for key, bits in self.bitmaps[name].items():
+                count = (bits & mask).bit_count()
+                chosen = bool(selected) and (facet.type == 'flag' or key in selected)
+                if count or chosen:
+                    values.append({'value': key, 'label': self.labels[name].get(key, facet.label),
+                                   'count': count, 'selected': chosen})
+            if values:
+                if facet.field == 'kind':
+                    order = list(KIND_LABELS)
+                    values.sort(key=lambda value: order.index(value['value']))
+                else:
+                    values.sort(key=lambda value: str(value['label']).lower())
+                facets.append({'name': name, 'label': facet.label, 'type': facet.type, 'values': values})
+        return total, facets
+
+
+def load_rows(scope):
+    rows = CatalogEntry.objects.filter(kind__in=scope.kinds).order_by('pk').values_list(*ENTRY_COLUMNS, 'facets')
+    return [(row[:-1], row[-1] or {}) for row in rows.iterator(chunk_size=5000)]
+
+
+class FacetService:
+    """Owns the index of every scope and rebuilds them when the catalog changes."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._built_version = None
+        self._build_lock = threading.Lock()
+
+    def build(self):
+        with self._build_lock:
+            return self._build()
+
+    def _build(self):
+        version = catalog.version.current()
+        self._indexes = {name: FacetIndex(scope, load_rows(scope)) for name, scope in SCOPES.items()}
+        self._built_version = version
+        logger.info('Built facet indexes: %s', {name: index.size for name, index in self._indexes.items()})
+        return self._indexes
+
+    def _stale(self):
+        return not self._indexes or self._built_version != catalog.version.current()
+
+    def index(self, scope):
+        # One request rebuilds; the others keep answering from the previous indexes
+        if self._stale() and self._build_lock.acquire(blocking=not self._indexes):
+            try:
+                if self._stale():
+                    self._build()
+            finally:
+                self._build_lock.release()
+        return self._indexes[scope]
+
+
+facets = FacetService()
@@ -0,0 +1,324 @@
+"""
+Fragment cache for catalog pages.
+
+Detail and listing pages are the same for every visitor apart from a few
+small per-user bits: the wishlist hearts, the CSRF token in forms and
+whether the visitor is signed in.  Their bodies are therefore rendered once
+and cached as HTML, and the per-user bits are left in them as markers:
+
+    <!--user:csrf-->
+    <!--user:wishlist:ID-->          (the heart on a listing card)
+    <!--user:wishlist_detail:ID-->   (the button on a detail page)
+
+``stitch`` replaces the markers for the current request.  A fragment may
+vary by audience (anonymous or signed in) but never by user.
+
+Detail fragments are keyed by a per-object version kept in the shared
+cache.  Saving a service of any type or a store item bumps its version once the
+transaction commits, deleting it drops the version, and renaming a
+category bumps the versions of its rows.  A version is only minted for a
+row that exists; a missing one is remembered as version 0 for
+``CATALOG_PAGE_CACHE_TTL`` seconds, so requests for unknown ids neither
+fill the cache with versions nor query the database each time.  Versions
+expire after ``VERSION_TIMEOUT`` seconds, long after their fragments.
+Stock levels change through UPDATEs that bypass signals, so fragments
+also expire after ``CATALOG_PAGE_CACHE_TTL`` seconds, as listing pages do
+(see core.listings, which caches its grids through ``cached``).
+
+Hits and misses are counted per fragment name in process and added to
+shared counters every ``STATS_FLUSH_INTERVAL`` seconds.  ``stats.snapshot``
+reports them, and the ``api_fragment_stats`` view exposes them to staff.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+from django.template.backends.utils import csrf_input
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from . import catalog, wishlists
+from .models import (
+    CatalogEntry, Catering, EventManagement, Photography, PrintingService,
+    Service, ServiceCategory, StoreCategory, StoreItem,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between adding the in-process hit counts to the shared counters
+STATS_FLUSH_INTERVAL = 10
+
+# Seconds a per-object version is kept; its fragments expire long before
+VERSION_TIMEOUT = 24 * 60 * 60
+
+# Version of a row that does not exist
+MISSING = 0
+
+USER_MARKER = re.compile(r'<!--user:(\w+)(?::(\d+))?-->')
+
+
+def timeout():
+    return getattr(settings, 'CATALOG_PAGE_CACHE_TTL', 60)
+
+
+# ============== STATISTICS ==============
+
+class FragmentStats:
+    """Hit and miss counters per fragment name, shared between processes."""
+
+    def __init__(self, flush_interval=STATS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending = defaultdict(lambda: [0, 0])
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, name, hit):
+        with self._lock:
+            self._pending[name][0 if hit else 1] += 1
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: [0, 0])
+            self._flushed_at = time.monotonic()
+        try:
+            for name, counts in pending.items():
+                for key, count in zip(self._keys(name), counts):
+                    if count:
+                        cache.add(key, 0, timeout=None)
+                        cache.incr(key, count)
+        except Exception:
+            logger.exception('Could not publish fragment cache statistics')
+
+    def _keys(self, name):
+        return f'fragment-stats:{name}:hits', f'fragment-stats:{name}:misses'
+
+    def snapshot(self, names):
+        """``{name: {'hits', 'misses', 'hit_ratio'}}`` across all processes."""
+        self.flush()
+        keys = {name: self._keys(name) for name in names}
+        shared = cache.get_many([key for pair in keys.values() for key in pair])
+        report = {}
+        for name, (hits_key, misses_key) in keys.items():
+            hits, misses = shared.get(hits_key, 0), shared.get(misses_key, 0)
+            report[name] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+            }
+        return report
+
+
+stats = FragmentStats()
+
+
+def cached(name, key, render):
+    """Return the fragment under ``key``, rendering and storing it on a miss."""
+    html = cache.get(key)
+    stats.record(name, html is not None)
+    if html is None:
+        # Requests that miss together wait for one render (see core.cache_backends)
+        html = cache.get_or_set(key, render, timeout())
+    return html
+
+
+# ============== PER-OBJECT VERSIONS ==============
+
+def _version_key(model, pk):
+    return f'fragment-version:{model._meta.label_lower}:{pk}'
+
+
+def object_version(model, pk):
+    """The current version of one row's fragments, or None if the row does not exist."""
+    key = _version_key(model, pk)
+    version = cache.get(key)
+    if version is None:
+        if model.objects.filter(pk=pk).exists():
+            # A fresh value, so a version lost to eviction never matches old fragments
+            cache.add(key, time.time_ns(), timeout=VERSION_TIMEOUT)
+        else:
+            cache.add(key, MISSING, timeout=timeout())
+        version = cache.get(key)
+    return None if version == MISSING else version
+
+
+def bump_versions(model, pks):
+    """Retire the cached fragments of ``pks`` once the transaction commits."""
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(
+            lambda: cache.set_many({_version_key(model, pk): time.time_ns() for pk in pks}, timeout=VERSION_TIMEOUT)
+        )
+
+
+def forget_versions(model, pks):
+    """Drop the versions of deleted rows once the transaction commits."""
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(lambda: cache.delete_many([_version_key(model, pk) for pk in pks]))
+
+
+# ============== PER-USER BITS ==============
+
+STITCHERS = {}
+
+
+def stitcher(name):
+    """Register ``func(request, argument)`` as the renderer of ``<!--user:name-->`` markers."""
+    def register(func):
+        STITCHERS[name] = func
+        return func
+    return register
+
+
+def stitch(html, request):
+    """Replace the per-user markers in a cached fragment for ``request``."""
+    return USER_MARKER.sub(lambda match: STITCHERS[match[1]](request, match[2]), html)
+
+
+@stitcher('csrf')
+def stitch_csrf(request, argument):
+    return csrf_input(request)
+
+
+@stitcher('wishlist')
+def stitch_wishlist(request, item_id):
+    if not request.user.is_authenticated:
+        return ''
+    in_wishlist = int(item_id) in wishlists.membership(request.user)
+    return get_template('store/_wishlist_button.html').render({'item_id': item_id, 'in_wishlist': in_wishlist})
+
+
+@stitcher('wishlist_detail')
+def stitch_wishlist_detail(request, item_id):
+    if not request.user.is_authenticated:
+        return ''
+    in_wishlist = int(item_id) in wishlists.membership(request.user)
+    return get_template('store/_wishlist_detail_button.html').render({'item_id': item_id, 'in_wishlist': in_wishlist})
+
+
+# ============== DETAIL PAGES ==============
+
+class Detail:
+    """A catalog detail page whose body is cached per object version."""
+
+    def __init__(self, name, model, template, context_name, title_field, related=('category',), context=None):
+        self.name = name
+        self.model = model
+        self.template = template
+        self.context_name = context_name
+        self.title_field = title_field
+        self.related = related
+        # ``context(obj)``: template variables besides the object itself
+        self.context = context
+
+
+def package_context(service):
+    """The type badge and attribute list of an event, photography, catering or printing package."""
+    source = catalog.SOURCE_BY_MODEL[type(service)]
+    attributes = []
+    for name in source.facet_fields:
+        field, value = service._meta.get_field(name), getattr(service, name)
+        label = field.help_text or field.verbose_name.capitalize()
+        if value is True:
+            attributes.append(label)
+        elif value is not False:
+            attributes.append(f'{label}: {value}')
+    return {
+        'kind': source.kind,
+        'badge': f'{dict(CatalogEntry.KIND_CHOICES)[source.kind]} · {getattr(service, source.category_field)}',
+        'attributes': attributes,
+    }
+
+
+def package_detail(kind, model):
+    return Detail(f'{kind}-detail', model, 'services/_service_detail.html', 'service', 'title', (), package_context)
+
+
+DETAILS = {
+    'service': Detail('service-detail', Service, 'services/_service_detail.html', 'service', 'title'),
+    'storeitem': Detail('storeitem-detail', StoreItem, 'store/_item_detail.html', 'item', 'name'),
+    'event': package_detail('event', EventManagement),
+    'photo': package_detail('photo', Photography),
+    'catering': package_detail('catering', Catering),
+    'printing': package_detail('printing', PrintingService),
+}
+
+
+def detail_context(request, kind, pk):
+    """
+    Template context for a detail page: ``title`` and the stitched
+    ``body``.  Raises Http404 for unknown objects.
+    """
+    detail = DETAILS[kind]
+    version = object_version(detail.model, pk)
+    if version is None:
+        stats.record(detail.name, True)
+        raise Http404(f'No {detail.model._meta.verbose_name} matches the given query.')
+    signed_in = request.user.is_authenticated
+    key = f'fragment:{detail.name}:{pk}:{int(signed_in)}:{version}'
+
+    def render():
+        queryset = detail.model.objects.all()
+        if detail.related:
+            queryset = queryset.select_related(*detail.related)
+        obj = queryset.filter(pk=pk).first()
+        if obj is None:
+            raise Http404(f'No {detail.model._meta.verbose_name} matches the given query.')
+        context = {detail.context_name: obj, 'signed_in': signed_in}
+        if detail.context:
+            context.update(detail.context(obj))
+        return {
+            'title': getattr(obj, detail.title_field),
+            'body': render_to_string(detail.template, context),
+        }
+
+    page = cached(detail.name, key, render)
+    return {'title': page['title'], 'body': mark_safe(stitch(page['body'], request))}
+
+
+def fragment_names():
+    from .listings import LISTINGS
+    return [detail.name for detail in DETAILS.values()] + [f'catalog-page:{kind}' for kind in LISTINGS]
+
+
+# ============== INVALIDATION ==============
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=EventManagement)
+@receiver(post_save, sender=Photography)
+@receiver(post_save, sender=Catering)
+@receiver(post_save, sender=PrintingService)
+@receiver(post_save, sender=StoreItem)
+def catalog_object_changed(sender, instance, **kwargs):
+    bump_versions(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=EventManagement)
+@receiver(post_delete, sender=Photography)
+@receiver(post_delete, sender=Catering)
+@receiver(post_delete, sender=PrintingService)
+@receiver(post_delete, sender=StoreItem)
+def catalog_object_deleted(sender, instance, **kwargs):
+    forget_versions(sender, [instance.pk])
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_save, sender=StoreCategory)
+def catalog_category_changed(sender, instance, created, **kwargs):
+    # Detail pages show the category name
+    if not created:
+        model = Service if sender is ServiceCategory else StoreItem
+        bump_versions(model, model.objects.filter(category=instance).values_list('pk', flat=True))
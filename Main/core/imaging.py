@@ -0,0 +1,164 @@
+"""
+Placeholder artwork for catalog entries without a photo.
+
+The one-off scripts that used to draw these (enhance_images.py,
+fix_missing_images.py, generate_images_complete.py) painted the background
+gradient with one ``draw.rectangle`` call per pixel row and loaded their
+fonts again for every image.  Here the gradient and the darkening overlay
+behind the text are computed with NumPy for all rows at once and expanded
+to the full width in a single resize, and fonts are loaded once per
+process and size.  Cards of one size share their background, which is
+drawn once per process, so the cost of a card is mostly its text.
+
+A card is described by a ``PlaceholderSpec``; ``spec_hash`` fingerprints
+one together with ``LAYOUT_VERSION`` so that callers can skip cards whose
+output is already up to date.  ``render_to_file`` is a plain function of
+picklable arguments, so it can run in a process pool (see the
+``generate_placeholders`` command).
+
+This module does not touch Django, the database or settings.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Bump when the drawing below changes so that every placeholder is redrawn
+LAYOUT_VERSION = 1
+
+TOP_COLOR = (30, 60, 114)
+BOTTOM_COLOR = (42, 82, 152)
+FONT_CANDIDATES = ('arial.ttf', 'Arial.ttf', 'DejaVuSans.ttf', 'LiberationSans-Regular.ttf')
+
+
+# Everything drawn on one placeholder card
+PlaceholderSpec = namedtuple(
+    'PlaceholderSpec', ['title', 'category', 'description', 'price', 'width', 'height'],
+    defaults=['', '', None, 1200, 800],
+)
+
+
+def cpu_count():
+    """CPUs this process may run on, the useful number of drawing processes."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def spec_hash(spec):
+    payload = json.dumps([LAYOUT_VERSION, *spec], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def font(size):
+    """A TrueType font at ``size`` points, loaded once per process."""
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def gradient_rows(height, top=TOP_COLOR, bottom=BOTTOM_COLOR):
+    """``height`` x 3 float array of row colours fading from ``top`` to ``bottom``."""
+    ratio = np.arange(height, dtype=np.float32)[:, None] / height
+    top, bottom = np.asarray(top, np.float32), np.asarray(bottom, np.float32)
+    return top + (bottom - top) * ratio
+
+
+def darken_rows(rows, band, start_opacity=100, end_opacity=150):
+    """
+    Blend the last ``band`` of ``rows`` toward black, from ``start_opacity``
+    to ``end_opacity`` (out of 255), in place.
+    """
+    if band > 0:
+        opacity = np.linspace(start_opacity, end_opacity, band, endpoint=False, dtype=np.float32) / 255
+        rows[-band:] *= (1 - opacity)[:, None]
+    return rows
+
+
+def stretch(rows, width):
+    """RGB image ``width`` pixels wide whose every row is the matching colour in ``rows``."""
+    column = np.ascontiguousarray(rows, dtype=np.float32).astype(np.uint8)
+    return Image.frombuffer('RGB', (1, len(column)), column.tobytes(), 'raw', 'RGB', 0, 1).resize(
+        (width, len(column)), Image.NEAREST,
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def background(width, height, band):
+    """The gradient card with its last ``band`` rows darkened, drawn once per process."""
+    return stretch(darken_rows(gradient_rows(height), band), width)
+
+
+def wrap(text, typeface, max_width):
+    """Split ``text`` into lines no wider than ``max_width`` pixels."""
+    # Each word is measured once; a line is as wide as its words and spaces
+    space = typeface.getlength(' ')
+    lines, line, line_width = [], [], 0
+    for word in text.split():
+        width = typeface.getlength(word)
+        if line and line_width + space + width > max_width:
+            lines.append(' '.join(line))
+            line, line_width = [], 0
+        line_width += (space if line else 0) + width
+        line.append(word)
+    if line:
+        lines.append(' '.join(line))
+    return lines
+
+
+def render(spec):
+    """Draw ``spec`` and return it as a PIL image."""
+    width, height = spec.width, spec.height
+    scale = width / 1200
+    # (text, font, colour, line advance), laid out bottom-up so that long
+    # titles push the block upward instead of off the image
+    title_font = font(round(64 * scale))
+    lines = [(line, title_font, (255, 255, 255), 80) for line in wrap(spec.title, title_font, width - 100 * scale)]
+    if spec.category:
+        lines.append((spec.category, font(round(40 * scale)), (150, 200, 255), 70))
+    if spec.price:
+        lines.append((f'BDT {spec.price}', font(round(48 * scale)), (100, 200, 100), 70))
+    if spec.description:
+        text = spec.description[:50] + '...' if len(spec.description) > 50 else spec.description
+        lines.append((text, font(round(32 * scale)), (200, 200, 200), 50))
+
+    block = round((40 + sum(advance for *_, advance in lines)) * scale)
+
+    # Every pixel row is one colour, so the gradient and the darkened band
+    # behind the text (however many lines it takes) are computed for one
+    # column and stretched to the full width.  Cards of one size differ
+    # only in the height of the band, so each background is drawn once
+    band = min(height, max(min(height // 2, round(300 * scale)), block + round(30 * scale)))
+    image = background(width, height, band).copy()
+    draw = ImageDraw.Draw(image)
+    y = height - block
+    for text, typeface, fill, advance in lines:
+        draw.text((width / 2, y), text, fill=fill, font=typeface, anchor='ma')
+        y += round(advance * scale)
+    return image
+
+
+def render_to_file(spec, path, quality=85):
+    """Render ``spec`` to the JPEG at ``path`` and return ``spec_hash(spec)``."""
+    image = render(spec)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as handle:
+            image.save(handle, 'JPEG', quality=quality)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return spec_hash(spec)
@@ -0,0 +1,221 @@
+"""
+Stock reservation engine.
+
+Every change to ``StoreItem.stock`` goes through this module as a single
+conditional UPDATE, so concurrent requests cannot lose each other's
+writes and stock can never go negative:
+
+    UPDATE core_storeitem SET stock = stock - n WHERE id = %s AND stock >= n
+
+Adding an item to a cart reserves stock immediately and records a
+``StockReservation`` for the cart line with an expiry time
+(``STOCK_RESERVATION_TTL`` seconds, refreshed whenever the cart is viewed).
+Expired reservations are released in bulk by ``release_expired`` (run from
+the ``release_expired_reservations`` command, and opportunistically when a
+reservation cannot be satisfied).  At checkout ``core.checkout.place_order``
+turns the reservations into sold stock: lines whose reservation expired are
+topped up with ``reserve_many`` and the reservations are deleted, without
+decrementing the stock again.
+
+Invariant: stock + reserved quantities + sold quantities stays constant
+apart from deliberate restocking.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import StockReservation, StoreItem
+
+logger = logging.getLogger(__name__)
+
+# Conditional UPDATEs attempted before reserve_up_to gives up under contention
+MAX_ATTEMPTS = 5
+
+
+class InsufficientStock(Exception):
+    """Raised when a cart line cannot be fully reserved at checkout."""
+
+    def __init__(self, item_id, requested, available):
+        self.item_id = item_id
+        self.requested = requested
+        self.available = available
+        super().__init__(f'Only {available} of {requested} units of item #{item_id} are available')
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 30 * 60))
+
+
+def reserve(item_id, quantity):
+    """Take ``quantity`` units from stock if, and only if, all are available."""
+    if quantity <= 0:
+        return True
+    return StoreItem.objects.filter(pk=item_id, stock__gte=quantity).update(stock=F('stock') - quantity) == 1
+
+
+def release(item_id, quantity):
+    """Return ``quantity`` units to stock."""
+    if quantity > 0:
+        StoreItem.objects.filter(pk=item_id).update(stock=F('stock') + quantity)
+
+
+def release_many(quantities):
+    """Return stock for several items in one UPDATE; ``quantities`` maps item id to units."""
+    quantities = {item_id: quantity for item_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    StoreItem.objects.filter(pk__in=quantities).update(stock=F('stock') + Case(
+        *[When(pk=item_id, then=Value(quantity)) for item_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+def reserve_many(quantities):
+    """
+    Take stock for several items in one conditional UPDATE.
+
+    Returns True only if every item had enough stock.  On False some rows
+    may already have been decremented, so callers must run inside a
+    transaction and roll it back.
+    """
+    quantities = {item_id: quantity for item_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return True
+    wanted = Case(
+        *[When(pk=item_id, then=Value(quantity)) for item_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = StoreItem.objects.filter(pk__in=quantities, stock__gte=wanted).update(stock=F('stock') - wanted)
+    return updated == len(quantities)
+
+
+def reserve_up_to(item_id, quantity):
+    """
+    Reserve as many of ``quantity`` units as are available and return that number.
+
+    The first attempt optimistically asks for everything; after that the
+    request is shrunk to the stock last seen.  Each attempt is one
+    conditional UPDATE, so no lock is held between the read and the write.
+    """
+    if quantity <= 0:
+        return 0
+    wanted = quantity
+    swept = False
+    for _ in range(MAX_ATTEMPTS):
+        if reserve(item_id, wanted):
+            return wanted
+        available = StoreItem.objects.filter(pk=item_id).values_list('stock', flat=True).first() or 0
+        if available < quantity and not swept:
+            # Abandoned carts may be holding the stock we need
+            swept = True
+            if release_expired(item_ids=[item_id]):
+                continue
+        if available <= 0:
+            return 0
+        wanted = min(quantity, available)
+    return 0
+
+
+# ============== CART LINES ==============
+
+def reserve_for_cart_item(cart_item):
+    """
+    Adjust the reservation of a cart line to its requested quantity.
+
+    Called from CartItem pre_save.  Clamps ``cart_item.quantity`` to what
+    could be reserved; the reservation row itself is written by
+    ``hold_for_cart_item`` once the line has a primary key.
+    """
+    reserved = 0
+    if cart_item.pk is not None:
+        reserved = (
+            StockReservation.objects.filter(cart_item_id=cart_item.pk)
+            .values_list('quantity', flat=True).first()
+        ) or 0
+    difference = cart_item.quantity - reserved
+    if difference > 0:
+        cart_item.quantity = reserved + reserve_up_to(cart_item.item_id, difference)
+    elif difference < 0:
+        release(cart_item.item_id, -difference)
+
+
+def hold_for_cart_item(cart_item):
+    """Create or refresh the reservation row of a saved cart line."""
+    if cart_item.quantity <= 0:
+        StockReservation.objects.filter(cart_item_id=cart_item.pk).delete()
+        return
+    reservation = StockReservation(
+        cart_item_id=cart_item.pk,
+        cart_id=cart_item.cart_id,
+        item_id=cart_item.item_id,
+        quantity=cart_item.quantity,
+        expires_at=timezone.now() + reservation_ttl(),
+    )
+    # Single-statement upsert (INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE)
+    options = {'update_conflicts': True, 'update_fields': ['quantity', 'expires_at']}
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['cart_item']
+    StockReservation.objects.bulk_create([reservation], **options)
+
+
+def release_cart_item(cart_item):
+    """Give back the stock reserved by a cart line that is being removed."""
+    reservation = (
+        StockReservation.objects.filter(cart_item_id=cart_item.pk)
+        .values_list('pk', 'item_id', 'quantity').first()
+    )
+    if reservation is None:
+        return
+    pk, item_id, quantity = reservation
+    # Only the request that actually deleted the row returns the stock
+    deleted, _ = StockReservation.objects.filter(pk=pk).delete()
+    if deleted:
+        release(item_id, quantity)
+
+
+def extend_cart(cart):
+    """Push back the expiry of every reservation held by ``cart``."""
+    return StockReservation.objects.filter(cart=cart).update(expires_at=timezone.now() + reservation_ttl())
+
+
+# ============== EXPIRY ==============
+
+def release_expired(now=None, item_ids=None, batch_size=1000):
+    """
+    Release every reservation that expired before ``now``.
+
+    Works in batches: each batch locks its expired rows (skipping rows other
+    sweepers hold), deletes them and returns their stock with a single
+    UPDATE per batch.  Returns the number of reservations released.
+    """
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(expires_at__lte=now)
+    if item_ids is not None:
+        expired = expired.filter(item_id__in=item_ids)
+    lock_options = {'skip_locked': True} if connection.features.has_select_for_update_skip_locked else {}
+    released = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                expired.select_for_update(**lock_options)
+                .order_by('expires_at')
+                .values_list('pk', 'item_id', 'quantity')[:batch_size]
+            )
+            if not rows:
+                return released
+            totals = defaultdict(int)
+            for _, item_id, quantity in rows:
+                totals[item_id] += quantity
+            StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            release_many(totals)
+        released += len(rows)
+        logger.info('Released %d expired stock reservations', len(rows))
+        if len(rows) < batch_size:
+            return released
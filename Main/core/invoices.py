@@ -0,0 +1,253 @@
+"""
+PDF invoices.
+
+An invoice is rendered from ``invoice_data``: the order's number, date,
+status, total, customer name, address and lines.  It is rendered once per
+distinct content and kept as a file:
+
+    MEDIA_ROOT/invoices/<order id>/<key>.pdf
+
+``key`` is a keyed hash of that data and ``LAYOUT_VERSION``, so it names
+the file and doubles as the download's ETag.  Anything that changes what
+the invoice shows (a status update, a renamed item or customer) gives a new
+key, and the stale file is removed when the new one is written.  The hash
+is keyed with the secret key, because media files can be served publicly
+and order ids are guessable.
+
+Invoices are pre-rendered in a small background thread pool once an order
+is placed (``prerender``), rendered on first download otherwise, and
+rendered in bulk across processes by the ``render_invoices`` command.  The
+reportlab style sheet is built once per process.
+"""
+
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.crypto import salted_hmac
+
+from .models import Order
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+except ImportError:  # pragma: no cover - optional dependency
+    AVAILABLE = False
+else:
+    AVAILABLE = True
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout below changes so that cached invoices are re-rendered
+LAYOUT_VERSION = 1
+
+
+def invoice_data(order):
+    """Everything the invoice of ``order`` shows, as JSON-serializable values."""
+    return {
+        'id': order.pk,
+        'date': order.created_at.strftime('%B %d, %Y'),
+        'status': order.get_status_display(),
+        'total': f'{order.total_amount:,.2f}',
+        'customer': order.user.get_full_name() or order.user.username,
+        'address': order.shipping_address,
+        'lines': [
+            [line.item.name[:30], line.quantity, f'{line.price:,.2f}', f'{line.get_total():,.2f}']
+            for line in order.order_items.all()
+        ],
+    }
+
+
+def invoice_key(data):
+    message = json.dumps([LAYOUT_VERSION, data], sort_keys=True, ensure_ascii=False)
+    return salted_hmac('core.invoices', message, algorithm='sha256').hexdigest()[:32]
+
+
+def invoice_directory(order_id):
+    return Path(settings.MEDIA_ROOT) / 'invoices' / str(order_id)
+
+
+def invoice_path(data):
+    return invoice_directory(data['id']) / f'{invoice_key(data)}.pdf'
+
+
+def invoice_orders():
+    """Orders with everything ``invoice_data`` reads loaded up front"""
+    return Order.objects.select_related('user').prefetch_related('order_items__item')
+
+
+@functools.lru_cache(maxsize=None)
+def _styles():
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle', parent=styles['Heading1'], fontSize=24,
+            textColor=colors.HexColor('#7C3AED'), spaceAfter=12, alignment=1,
+        ),
+        'header': ParagraphStyle(
+            'Header', parent=styles['Normal'], fontSize=11,
+            textColor=colors.HexColor('#666666'), spaceAfter=6,
+        ),
+        'heading': styles['Heading3'],
+        'footer': ParagraphStyle(
+            'Footer', parent=styles['Normal'], fontSize=9, textColor=colors.grey, alignment=1,
+        ),
+        'info_table': TableStyle([
+            ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#333333')),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ]),
+        'items_table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7C3AED')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#F3E8FF')),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#F9F5FF')]),
+        ]),
+    }
+
+
+def render_pdf(data):
+    """Return the invoice described by ``invoice_data`` as PDF bytes."""
+    styles = _styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    elements = [Paragraph("INVOICE", styles['title']), Spacer(1, 0.2*inch)]
+
+    info_table = Table([
+        [f"Invoice #: {data['id']}", f"Date: {data['date']}"],
+        [f"Status: {data['status']}", f"Amount: ৳{data['total']}"],
+    ], colWidths=[3*inch, 3*inch])
+    info_table.setStyle(styles['info_table'])
+    elements += [info_table, Spacer(1, 0.3*inch)]
+
+    customer_info = f"{data['customer']}<br/>{data['address']}"
+    elements += [
+        Paragraph("Bill To:", styles['heading']),
+        Paragraph(customer_info, styles['header']),
+        Spacer(1, 0.2*inch),
+        Paragraph("Order Items", styles['heading']),
+    ]
+
+    item_data = [['Product', 'Quantity', 'Price', 'Total']]
+    for name, quantity, price, total in data['lines']:
+        item_data.append([name, str(quantity), f"৳{price}", f"৳{total}"])
+    item_data.append(['', '', 'Total:', f"৳{data['total']}"])
+    items_table = Table(item_data, colWidths=[2.5*inch, 1*inch, 1.5*inch, 1.5*inch])
+    items_table.setStyle(styles['items_table'])
+    elements += [items_table, Spacer(1, 0.3*inch)]
+
+    elements.append(Paragraph(
+        "Thank you for your order! <br/>EventNest - Event Management Platform",
+        styles['footer']
+    ))
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def write_invoice(data):
+    """Render the invoice of ``data`` to its file and return the PDF bytes."""
+    path = invoice_path(data)
+    content = render_pdf(data)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary name and rename, so readers never see a partial file
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as handle:
+            handle.write(content)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    for stale in path.parent.glob('*.pdf'):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return content
+
+
+def open_invoice(data):
+    """
+    Open the invoice of ``data`` for reading, rendering it first if it has
+    no file yet.  A file can also vanish between the lookup and the open,
+    removed as stale by a concurrent render; it is then rendered again.
+    """
+    try:
+        return invoice_path(data).open('rb')
+    except FileNotFoundError:
+        return BytesIO(write_invoice(data))
+
+
+def render_orders(order_ids, force=False):
+    """Render the missing invoices of ``order_ids``; returns how many were written."""
+    rendered = 0
+    for order in invoice_orders().filter(pk__in=order_ids):
+        data = invoice_data(order)
+        if force or not invoice_path(data).exists():
+            write_invoice(data)
+            rendered += 1
+    return rendered
+
+
+# ============== BACKGROUND PRE-RENDERING ==============
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'INVOICE_RENDER_THREADS', 2),
+                thread_name_prefix='invoice-render',
+            )
+        return _executor
+
+
+def _prerender(order_id):
+    close_old_connections()
+    try:
+        render_orders([order_id])
+    except Exception:
+        logger.exception('Pre-rendering the invoice of order #%s failed', order_id)
+    finally:
+        with _lock:
+            _pending.discard(order_id)
+        close_old_connections()
+
+
+def prerender(order_id):
+    """Render ``order_id``'s invoice in the background once the transaction commits."""
+    if not AVAILABLE or not getattr(settings, 'INVOICE_PRERENDER', True):
+        return
+
+    def submit():
+        with _lock:
+            if order_id in _pending:
+                return
+            _pending.add(order_id)
+        _get_executor().submit(_prerender, order_id)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,250 @@
+"""
+Catalog listing pages (all services, all store items, and both narrowed
+by the facet filters of core.facets).
+
+The services page lists the catalog entries (core.catalog) of every
+service type; the store lists StoreItem rows.  Listings are
+keyset-paginated (see core.pagination) on
+(created_at, id) or (price, id), so rendering page 1 or page 10,000 reads
+``CATALOG_PAGE_SIZE`` rows through an index whatever the catalog size,
+and nothing counts the whole table.
+
+The rendered grid of a page is cached under a key made from the listing,
+its filters, sort and cursor, and the catalog version; saving or deleting
+a service of any type, store item or category bumps the version (see
+core.versioning) once the transaction commits, which retires every cached
+page at once.  Stock levels change through
+UPDATEs that bypass signals, so cached pages also expire after
+``CATALOG_PAGE_CACHE_TTL`` seconds.
+
+Cached grids are the same for every visitor.  The per-user wishlist
+buttons are left as ``<!--user:wishlist:ID-->`` markers and filled in for
+the current user by ``core.fragments.stitch``, which also counts the
+grid cache's hits and misses.
+
+Search results are ranked by relevance rather than a sort key, capped at
+``SEARCH_RESULT_LIMIT`` rows and rendered uncached.  On the services page
+plain services are ranked by the full-text backend (core.search) and the
+specialised service types, which it does not index, follow as catalog
+substring matches.  The facet filters narrow the matches in SQL before the
+cap, and the facet counts are limited to the unfiltered results.
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+
+from . import catalog, fragments
+from .facets import SCOPES, facets
+from .models import (
+    CatalogEntry, Catering, EventManagement, Photography, PrintingService,
+    Service, ServiceCategory, StoreCategory, StoreItem,
+)
+from .pagination import InvalidCursor, decode_cursor, keyset_page
+from .search import filtered_ids, result_limit, search_ids, search_store_items
+from .versioning import VersionStamp
+
+logger = logging.getLogger(__name__)
+
+# Orderings offered on listing pages; each ends with the primary key
+SORTS = {
+    'newest': ('-created_at', '-id'),
+    'price': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+DEFAULT_SORT = 'newest'
+SORT_LABELS = [('newest', 'Newest'), ('price', 'Price: Low to High'), ('price_desc', 'Price: High to Low')]
+
+catalog_version = VersionStamp('catalog-listings')
+
+
+class Listing:
+    """
+    A paginated catalog listing and the template fragment for its grid.
+
+    Listings of catalog entries give the entry ``kinds`` they show; other
+    listings show ``model`` rows, whose fields the scope's facets must share.
+    """
+
+    def __init__(self, kind, model, template, search, kinds=None):
+        self.kind = kind
+        self.model = model
+        self.template = template
+        self.search = search
+        self.kinds = kinds
+        self.scope = SCOPES[kind]
+
+    def queryset(self, selection=None):
+        if self.kinds:
+            queryset = catalog.entries(self.kinds)
+        else:
+            queryset = self.model.objects.select_related('category')
+        if selection:
+            queryset = queryset.filter(self.scope.filter_q(selection))
+        return queryset
+
+    def pair(self, row):
+        """The ``(kind, object_id)`` of a listed row in the facet index."""
+        if self.kinds:
+            return row.kind, row.object_id
+        return self.kind, row.pk
+
+
+def search_catalog_services(query, queryset, filtered=False):
+    """
+    Catalog entries of ``queryset`` matching ``query``: plain services in
+    full-text rank order, then the specialised services matching by title
+    or category.  ``filtered`` applies ``queryset`` before the limit.
+    """
+    limit = result_limit()
+    services = queryset.filter(kind='service')
+    if filtered:
+        ids = filtered_ids('service', query, services, field='object_id', limit=limit)
+    else:
+        ids = search_ids('service', query, limit)
+    entries = {entry.object_id: entry for entry in services.filter(object_id__in=ids)}
+    ranked = [entries[pk] for pk in ids if pk in entries]
+    if len(ranked) >= limit:
+        return ranked
+    specialised = queryset.filter(kind__in=catalog.SPECIALISED_KINDS)
+    return ranked + list(catalog.search(query, queryset=specialised, limit=limit - len(ranked)))
+
+
+def search_store_listing(query, queryset, filtered=False):
+    return search_store_items(query, queryset, filtered=filtered)
+
+
+LISTINGS = {
+    'service': Listing(
+        'service', CatalogEntry, 'services/_service_grid.html', search_catalog_services,
+        kinds=catalog.SERVICE_KINDS,
+    ),
+    'storeitem': Listing('storeitem', StoreItem, 'store/_item_grid.html', search_store_listing),
+}
+
+
+def page_size():
+    return getattr(settings, 'CATALOG_PAGE_SIZE', 24)
+
+
+def fragment_key(kind, selection, sort, after, before):
+    raw = repr((catalog_version.current(), sorted(selection.items()), sort, after, before, page_size()))
+    return f'catalog-page:{kind}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _page_url(listing, selection, sort, **cursor):
+    params = listing.scope.params(selection)
+    if sort != DEFAULT_SORT:
+        params.append(('sort', sort))
+    params.extend((name, value) for name, value in cursor.items() if value)
+    return '?' + urlencode(params)
+
+
+def search_rows(kind, query, selection):
+    """
+    ``(rows, restrict)``: the search results matching ``selection`` and the
+    facet index bitmap of all the results, which limits the facet counts.
+    """
+    listing = LISTINGS[kind]
+    hits = list(listing.search(query, listing.queryset()))
+    restrict = facets.index(kind).restrict_to([listing.pair(hit) for hit in hits])
+    if not selection:
+        return hits, restrict
+    # Filtered in SQL before the limit, so matches past the cap still show
+    return list(listing.search(query, listing.queryset(selection), filtered=True)), restrict
+
+
+def render_grid(kind, selection=None, sort=None, after=None, before=None, query='', rows=None):
+    """
+    Return the HTML of one listing page's grid and pager.
+
+    ``selection`` must come from the listing scope's ``parse``; unknown
+    sorts fall back to the default and cursors that do not decode to the
+    first page.  With a ``query``, ``rows`` are the search results to show.
+    """
+    listing = LISTINGS[kind]
+    selection = selection or {}
+    if query:
+        if rows is None:
+            rows, _ = search_rows(kind, query, selection)
+        return render_to_string(listing.template, {'page': rows, 'query': query})
+
+    if sort not in SORTS:
+        sort = DEFAULT_SORT
+    ordering = SORTS[sort]
+    try:
+        for cursor in (after, before):
+            if cursor:
+                decode_cursor(cursor, listing.model, ordering)
+    except InvalidCursor:
+        after = before = None
+    after = after or None
+    before = None if after else (before or None)
+
+    def render():
+        page = keyset_page(listing.queryset(selection), ordering, page_size(), after=after, before=before)
+        return render_to_string(listing.template, {
+            'page': page,
+            'next_url': _page_url(listing, selection, sort, after=page.next_cursor) if page.next_cursor else '',
+            'previous_url': _page_url(listing, selection, sort, before=page.previous_cursor) if page.previous_cursor else '',
+        })
+
+    return fragments.cached(f'catalog-page:{kind}', fragment_key(kind, selection, sort, after, before), render)
+
+
+def listing_context(request, kind):
+    """Template context for a listing page: the grid, the facet sidebar and the sort state."""
+    listing = LISTINGS[kind]
+    query = request.GET.get('q', '').strip()
+    selection = listing.scope.parse(request.GET)
+    sort = request.GET.get('sort')
+    sort = sort if sort in SORTS else DEFAULT_SORT
+    rows = restrict = None
+    if query:
+        rows, restrict = search_rows(kind, query, selection)
+    grid = render_grid(
+        kind, selection, sort,
+        after=request.GET.get('after'), before=request.GET.get('before'), query=query, rows=rows,
+    )
+    total, sidebar = facets.index(kind).sidebar(selection, restrict)
+    categories = selection.get('category', [])
+    return {
+        'grid': mark_safe(fragments.stitch(grid, request)),
+        'query': query,
+        'category_id': categories[0] if len(categories) == 1 else '',
+        'facets': sidebar,
+        'total': total,
+        'filtered': bool(selection),
+        # Query string of the current filters, for links that change the sort
+        'filter_query': urlencode(listing.scope.params(selection) + ([('q', query)] if query else [])),
+        'sort': sort,
+        'sorts': SORT_LABELS,
+    }
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=EventManagement)
+@receiver(post_save, sender=Photography)
+@receiver(post_save, sender=Catering)
+@receiver(post_save, sender=PrintingService)
+@receiver(post_save, sender=StoreItem)
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_save, sender=StoreCategory)
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=EventManagement)
+@receiver(post_delete, sender=Photography)
+@receiver(post_delete, sender=Catering)
+@receiver(post_delete, sender=PrintingService)
+@receiver(post_delete, sender=StoreItem)
+@receiver(post_delete, sender=ServiceCategory)
+@receiver(post_delete, sender=StoreCategory)
+def invalidate_catalog_pages(sender, **kwargs):
+    """Cached listing pages show these rows; retire them all once the change commits."""
+    transaction.on_commit(catalog_version.bump)
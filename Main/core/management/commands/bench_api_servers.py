@@ -0,0 +1,338 @@
+"""
+Management command to load-test the JSON API under WSGI and under ASGI.
+
+Seeds a throwaway file database, then for each scenario forks a real HTTP
+server onto it and drives it over TCP with ``--concurrency`` concurrent
+clients for ``--duration`` seconds.  Requests cycle through the API
+endpoints: cart count, notification list, order items, both searches and
+marking a notification read.
+
+Scenarios (server / views):
+
+* wsgi / sync:   Django's threaded WSGI server (the one runserver uses, a
+                 thread per connection) with the API views of core.views
+* wsgi / async:  the same server with the async variants of those views
+                 kept below, which Django runs in a fresh event loop per
+                 request
+* asgi / sync:   daphne with the views of core.views; each one runs in a
+                 sync_to_async worker thread
+* asgi / async:  daphne with the async variants
+
+The API views stay sync until the async variants win on the deployed
+server: with Django 5.2's async ORM every query still hops to the
+request's sync thread, so an async view pays one hop per query instead of
+one per view.
+
+Reports requests per second, latency percentiles, errors and the server
+process's thread count (peak and mean, sampled from /proc; Linux only).
+
+Usage:
+    python manage.py bench_api_servers [--concurrency 32] [--duration 5] [--json]
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from daphne.testing import DaphneProcess
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.http import JsonResponse
+from django.test import Client
+from django.urls import clear_url_caches, path
+from django.views.decorators.http import require_POST
+
+from core import notifications as notifications_push, views
+from core.benchmarking import benchmark_database, make_rng, phrase, summarize
+from core.models import (
+    Cart, Notification, Order, OrderItem, Service, ServiceCategory, StoreCategory, StoreItem,
+)
+from core.search import search_services, search_store_items
+
+CSRF_TOKEN = 'b' * 32
+
+
+# ============== ASYNC VARIANTS ==============
+# The API views written against the async ORM, kept to re-measure them
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+@login_required(login_url='login')
+async def api_cart_count(request):
+    user = await request.auser()
+    count = await Cart.objects.filter(user=user).values_list('total_quantity', flat=True).afirst()
+    return JsonResponse({'count': count or 0})
+
+
+async def api_services_search(request):
+    query = request.GET.get('q', '')
+    # The search backend may query the database itself
+    services = await sync_to_async(search_services)(query, limit=10) if query else Service.objects.all()[:10]
+    return JsonResponse(await alist(services.values('id', 'title', 'price')), safe=False)
+
+
+async def api_items_search(request):
+    query = request.GET.get('q', '')
+    items = await sync_to_async(search_store_items)(query, limit=10) if query else StoreItem.objects.all()[:10]
+    return JsonResponse(await alist(items.values('id', 'name', 'price')), safe=False)
+
+
+@login_required(login_url='login')
+async def api_notifications(request):
+    user = await request.auser()
+    user_notifications, unread_count = await asyncio.gather(
+        alist(Notification.objects.filter(user=user).order_by('-created_at')[:10]),
+        Notification.objects.filter(user=user, is_read=False).acount(),
+    )
+    return JsonResponse({
+        'notifications': [notifications_push.serialize(n) for n in user_notifications],
+        'unread_count': unread_count,
+    })
+
+
+@login_required(login_url='login')
+@require_POST
+async def mark_notification_read(request, notification_id):
+    user = await request.auser()
+    try:
+        notification = await Notification.objects.aget(id=notification_id, user=user)
+    except Notification.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Notification not found'}, status=404)
+    notification.is_read = True
+    await notification.asave()
+    return JsonResponse({'success': True})
+
+
+@login_required(login_url='login')
+async def api_order_items(request, order_id):
+    user = await request.auser()
+    found, lines = await asyncio.gather(
+        Order.objects.filter(id=order_id, user=user).aexists(),
+        alist(OrderItem.objects.filter(order_id=order_id, order__user=user).select_related('item')),
+    )
+    if not found:
+        return JsonResponse({'success': False, 'error': 'Order not found'}, status=404)
+    items = [
+        {'id': line.item.id, 'name': line.item.name, 'quantity': line.quantity, 'price': str(line.price)}
+        for line in lines
+    ]
+    return JsonResponse({'success': True, 'items': items, 'order_id': order_id})
+
+
+# ROOT_URLCONF of the servers running the async variants
+urlpatterns = [
+    path('api/cart-count/', api_cart_count),
+    path('api/services-search/', api_services_search),
+    path('api/items-search/', api_items_search),
+    path('api/notifications/', api_notifications),
+    path('api/notifications/<int:notification_id>/read/', mark_notification_read),
+    path('api/order/<int:order_id>/items/', api_order_items),
+    path('login/', views.login_view, name='login'),
+]
+
+
+# ============== SERVERS ==============
+
+def use_views(kind):
+    if kind == 'async':
+        settings.ROOT_URLCONF = __name__
+        clear_url_caches()
+
+
+def make_asgi_application(kind):
+    from django.core.handlers.asgi import ASGIHandler
+    use_views(kind)
+    return ASGIHandler()
+
+
+class WSGIServerProcess(multiprocessing.Process):
+    """Runs Django's threaded WSGI server in a forked child, like DaphneProcess."""
+
+    def __init__(self, host, kind):
+        super().__init__()
+        self.host = host
+        self.kind = kind
+        self.port = multiprocessing.Value('i')
+        self.ready = multiprocessing.Event()
+
+    def run(self):
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+        use_views(self.kind)
+        server = ThreadedWSGIServer((self.host, 0), QuietHandler, allow_reuse_address=False)
+        server.set_app(WSGIHandler())
+        self.port.value = server.server_address[1]
+        self.ready.set()
+        server.serve_forever()
+
+
+def thread_count(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Load-test the JSON API on a WSGI and an ASGI server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients (default: 32)')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per scenario (default: 5)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        if multiprocessing.get_start_method() != 'fork':
+            raise CommandError('The servers are forked onto the benchmark database; this needs the fork start method')
+        with benchmark_database(threads=True):
+            requests = self.seed()
+            connections.close_all()
+            results = []
+            for server in ('wsgi', 'asgi'):
+                for kind in ('sync', 'async'):
+                    row = self.run_scenario(server, kind, requests, options)
+                    results.append(row)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('\n=== JSON API load test ==='))
+        self.stdout.write(f"{options['concurrency']} concurrent clients, {options['duration']}s per scenario")
+        self.stdout.write(
+            f"{'server':6} {'views':5} | {'req/s':>8} | {'p50 ms':>8} {'p99 ms':>8} | {'errors':>6} | "
+            f"{'threads peak':>12} {'mean':>6}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['server']:6} {row['views']:5} | {row['requests_per_second']:8.0f} | "
+                f"{row['latency']['p50_ms']:8.2f} {row['latency']['p99_ms']:8.2f} | {row['errors']:6} | "
+                f"{row['threads_peak'] or '-':>12} {row['threads_mean'] or '-':>6}"
+            )
+
+    def seed(self):
+        rng = make_rng()
+        user = User.objects.create_user('bench-api', password='x')
+        service_category = ServiceCategory.objects.create(name='Bench services')
+        store_category = StoreCategory.objects.create(name='Bench store')
+        Service.objects.bulk_create([
+            Service(category=service_category, title=phrase(rng, 2, 4), description=phrase(rng, 8, 20),
+                    price=rng.randint(1000, 90000), image='services/placeholder.jpg')
+            for _ in range(500)
+        ])
+        items = StoreItem.objects.bulk_create([
+            StoreItem(category=store_category, name=phrase(rng, 2, 4), description=phrase(rng, 8, 20),
+                      price=rng.randint(100, 5000), image='store/placeholder.jpg', stock=100)
+            for _ in range(500)
+        ])
+        order = Order.objects.create(user=user, total_amount=0, shipping_address='Bench street')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, item=item, quantity=1, price=item.price) for item in items[:5]
+        ])
+        notification_ids = [
+            Notification.objects.create(
+                user=user, notification_type='order', title=phrase(rng, 2, 5), message=phrase(rng, 5, 20),
+            ).pk
+            for _ in range(40)
+        ]
+
+        client = Client()
+        client.force_login(user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; csrftoken={CSRF_TOKEN}'
+        plan = [
+            ('GET', '/api/cart-count/'),
+            ('GET', '/api/notifications/'),
+            ('GET', f'/api/order/{order.pk}/items/'),
+            ('GET', '/api/services-search/?q=wedding'),
+            ('GET', '/api/items-search/?q=rose'),
+            ('POST', f'/api/notifications/{notification_ids[0]}/read/'),
+        ]
+        return [
+            (
+                f'{method} {url} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n'
+                f'X-CSRFToken: {CSRF_TOKEN}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+            ).encode()
+            for method, url in plan
+        ]
+
+    def run_scenario(self, server, kind, requests, options):
+        if server == 'asgi':
+            process = DaphneProcess('127.0.0.1', partial(make_asgi_application, kind))
+        else:
+            process = WSGIServerProcess('127.0.0.1', kind)
+        process.start()
+        try:
+            if not process.ready.wait(30):
+                raise CommandError(f'{server} server did not start')
+            port = process.port.value
+            # Warm up: search indexes, URL resolver, database connections
+            asyncio.run(self.load(port, requests, 4, 1.0, process.pid))
+            row = asyncio.run(self.load(port, requests, options['concurrency'], options['duration'], process.pid))
+        finally:
+            process.terminate()
+            process.join()
+        return {'server': server, 'views': kind, **row}
+
+    async def load(self, port, requests, concurrency, duration, pid):
+        samples, errors, threads = [], 0, []
+        deadline = time.perf_counter() + duration
+        stop = asyncio.Event()
+
+        async def sample_threads():
+            while not stop.is_set():
+                count = thread_count(pid)
+                if count is not None:
+                    threads.append(count)
+                await asyncio.sleep(0.02)
+
+        async def client(number):
+            nonlocal errors
+            position = number
+            while time.perf_counter() < deadline:
+                request = requests[position % len(requests)]
+                position += 1
+                start = time.perf_counter()
+                try:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                    writer.write(request)
+                    response = await reader.read()
+                    writer.close()
+                except OSError:
+                    errors += 1
+                    continue
+                if response[9:12] != b'200':
+                    errors += 1
+                    continue
+                samples.append(time.perf_counter() - start)
+
+        sampler = asyncio.ensure_future(sample_threads())
+        started = time.perf_counter()
+        await asyncio.gather(*(client(number) for number in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+        return {
+            'requests_per_second': round(len(samples) / elapsed, 1),
+            'latency': summarize(samples),
+            'errors': errors,
+            'threads_peak': max(threads) if threads else None,
+            'threads_mean': round(sum(threads) / len(threads), 1) if threads else None,
+        }
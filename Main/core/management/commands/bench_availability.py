@@ -0,0 +1,255 @@
+"""
+Management command to benchmark booking availability against a large history.
+
+Seeds a throwaway database with ``--services`` services and ``--bookings``
+bookings spread over the past ``--history-days`` days and the booking
+horizon, then measures:
+
+* free slots: core.availability.free_slots over the whole horizon for
+  random services (one query plus interval arithmetic), against the
+  per-slot approach it replaces (one query for each slot of the grid)
+* reserve: core.availability.reserve_slot at random future slots, with the
+  share of requests rejected as conflicts
+* race: ``--threads`` customers booking the same slots of one service at
+  once; the run fails if any slot ends up booked more than its capacity
+
+Usage:
+    python manage.py bench_availability [--services 1000] [--bookings 1000000]
+        [--history-days 1095] [--repeat 50] [--threads 8] [--json]
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import availability
+from core.benchmarking import benchmark_database, make_rng, phrase, summarize, timed
+from core.models import Booking, Service, ServiceCategory
+
+BATCH_SIZE = 10000
+
+USERS = 200
+
+
+def free_slots_per_slot(service_type, service_id, start, days, duration):
+    """The per-slot baseline: read the bookings around every slot separately."""
+    opens, closes = availability.opening_hours()
+    slots = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        base = day.toordinal() * availability.MINUTES_PER_DAY
+        free = []
+        for at in range(opens, closes, availability.slot_minutes()):
+            begin = base + at
+            intervals = [
+                (availability.minute(booked, slot), availability.minute(booked, slot) + minutes)
+                for booked, slot, minutes in availability.bookings(service_type, service_id, day, day + timedelta(days=1))
+            ]
+            if availability.Calendar(intervals, availability.capacity(service_type)).is_free(begin, begin + duration):
+                free.append(at)
+        slots[day] = free
+    return slots
+
+
+class Command(BaseCommand):
+    help = 'Benchmark free-slot lookups and conflict checks over a large booking history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=1000, help='Bookable services (default: 1000)')
+        parser.add_argument('--bookings', type=int, default=1000000, help='Bookings seeded (default: 1000000)')
+        parser.add_argument('--history-days', type=int, default=3 * 365, help='Days of past bookings (default: 1095)')
+        parser.add_argument('--repeat', type=int, default=50, help='Measurements per operation (default: 50)')
+        parser.add_argument('--threads', type=int, default=8, help='Customers in the race (default: 8)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        rng = make_rng()
+        with benchmark_database(threads=True):
+            seconds, _ = timed(self.seed, rng, options)
+            if not options['json']:
+                self.stdout.write(f"Seeded {options['bookings']} bookings in {seconds:.1f}s")
+            results = {
+                'bookings': options['bookings'],
+                'services': options['services'],
+                'seed_s': round(seconds, 1),
+                'free_slots': self.measure_free_slots(rng, options),
+                'reserve': self.measure_reserve(rng, options),
+                'race': self.race(options),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results)
+        if results['race']['overbooked']:
+            raise CommandError(f"{results['race']['overbooked']} minutes were booked beyond capacity")
+
+    def seed(self, rng, options):
+        category = ServiceCategory.objects.create(name='Bench')
+        Service.objects.bulk_create([
+            Service(category=category, title=phrase(rng, 2, 4), description='', price=rng.randint(500, 50000))
+            for _ in range(options['services'])
+        ])
+        self.service_ids = list(Service.objects.values_list('pk', flat=True))
+        User.objects.bulk_create([User(username=f'bench{number}') for number in range(USERS + options['threads'])])
+        self.user_ids = list(User.objects.values_list('pk', flat=True))
+
+        today = timezone.localdate()
+        opens, closes = availability.opening_hours()
+        hours = range(opens // 60, closes // 60)
+        batch = []
+        for _ in range(options['bookings']):
+            day = today + timedelta(days=rng.randint(-options['history_days'], availability.horizon_days()))
+            status = rng.choice(('pending', 'confirmed', 'cancelled')) if day >= today else rng.choice(('completed', 'cancelled'))
+            batch.append(Booking(
+                user_id=rng.choice(self.user_ids[:USERS]),
+                service_type='service',
+                service_id=rng.choice(self.service_ids),
+                date=day,
+                time_slot=datetime.min.time().replace(hour=rng.choice(hours)),
+                duration_minutes=rng.choice((60, 120, 180)),
+                status=status,
+                total_amount=0,
+            ))
+            if len(batch) == BATCH_SIZE:
+                Booking.objects.bulk_create(batch)
+                batch = []
+        Booking.objects.bulk_create(batch)
+
+    def measure_free_slots(self, rng, options):
+        # From tomorrow, so the slots already past today do not differ
+        start = timezone.localdate() + timedelta(days=1)
+        days = availability.horizon_days()
+        index_times, baseline_times, queries, slots = [], [], [], []
+        for number in range(options['repeat']):
+            service_id = rng.choice(self.service_ids)
+            # The per-slot baseline fills the query log past its limit
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                seconds, free = timed(availability.free_slots, 'service', service_id, start=start, days=days, duration=120)
+            index_times.append(seconds)
+            queries.append(len(captured))
+            slots.append(sum(len(times) for times in free.values()))
+            if number < max(1, options['repeat'] // 10):
+                seconds, baseline = timed(free_slots_per_slot, 'service', service_id, start, days, 120)
+                baseline_times.append(seconds)
+                if [len(times) for times in baseline.values()] != [len(times) for times in free.values()]:
+                    raise CommandError(f'Free slots of service {service_id} differ from the per-slot baseline')
+        opens, closes = availability.opening_hours()
+        return {
+            'index': summarize(index_times),
+            'per_slot': summarize(baseline_times),
+            'queries': max(queries),
+            'per_slot_queries': days * len(range(opens, closes, availability.slot_minutes())),
+            'free_slots_mean': round(sum(slots) / len(slots), 1),
+        }
+
+    def measure_reserve(self, rng, options):
+        today = timezone.localdate()
+        opens, closes = availability.opening_hours()
+        times, rejected = [], 0
+        for _ in range(options['repeat']):
+            booking = Booking(
+                user_id=rng.choice(self.user_ids[:USERS]),
+                service_type='service',
+                service_id=rng.choice(self.service_ids),
+                date=today + timedelta(days=rng.randint(1, availability.horizon_days())),
+                time_slot=datetime.min.time().replace(hour=rng.randrange(opens // 60, closes // 60)),
+                total_amount=0,
+            )
+            start = time.perf_counter()
+            try:
+                availability.reserve_slot(booking)
+            except availability.SlotUnavailable:
+                rejected += 1
+            times.append(time.perf_counter() - start)
+        return {'latency': summarize(times), 'rejected': rejected, 'attempts': options['repeat']}
+
+    def race(self, options):
+        """Every thread tries to book every slot of one day of a fresh service."""
+        category = ServiceCategory.objects.get(name='Bench')
+        service = Service.objects.create(category=category, title='Race', description='', price=1000)
+        day = timezone.localdate() + timedelta(days=1)
+        opens, closes = availability.opening_hours()
+        hours = list(range(opens // 60, closes // 60))
+        threads = options['threads']
+        user_ids = self.user_ids[USERS:]
+        results = [None] * threads
+        barrier = threading.Barrier(threads)
+
+        def customer(number):
+            close_old_connections()
+            booked = rejected = errors = 0
+            try:
+                barrier.wait()
+                for hour in hours[number % len(hours):] + hours[:number % len(hours)]:
+                    booking = Booking(
+                        user_id=user_ids[number], service_type='service', service_id=service.pk, date=day,
+                        time_slot=datetime.min.time().replace(hour=hour), total_amount=0,
+                    )
+                    try:
+                        availability.reserve_slot(booking)
+                        booked += 1
+                    except availability.SlotUnavailable:
+                        rejected += 1
+                    except Exception:
+                        errors += 1
+            finally:
+                connections.close_all()
+            results[number] = (booked, rejected, errors)
+
+        workers = [threading.Thread(target=customer, args=(number,)) for number in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        calendar = availability.calendar('service', service.pk, day, day)
+        intervals = Counter()
+        for booked, slot, minutes in availability.bookings('service', service.pk, day, day):
+            begin = availability.minute(booked, slot)
+            for at in range(begin, begin + minutes):
+                intervals[at] += 1
+        limit = availability.capacity('service')
+        return {
+            'threads': threads,
+            'booked': sum(result[0] for result in results),
+            'rejected': sum(result[1] for result in results),
+            'errors': sum(result[2] for result in results),
+            'overbooked': sum(1 for load in intervals.values() if load > limit),
+            'busy_intervals': len(calendar.starts),
+            'seconds': round(elapsed, 2),
+        }
+
+    def report(self, results):
+        free, reserve, race = results['free_slots'], results['reserve'], results['race']
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== Availability: {results['bookings']} bookings over {results['services']} services ==="
+        ))
+        self.stdout.write(f"{'operation':24} | {'queries':>7} | {'p50 ms':>8} | {'p95 ms':>8}")
+        self.stdout.write(
+            f"{'free slots (index)':24} | {free['queries']:7} | {free['index']['p50_ms']:8.2f} | {free['index']['p95_ms']:8.2f}"
+        )
+        self.stdout.write(
+            f"{'free slots (per slot)':24} | {free['per_slot_queries']:7} | {free['per_slot']['p50_ms']:8.2f} | "
+            f"{free['per_slot']['p95_ms']:8.2f}"
+        )
+        self.stdout.write(
+            f"{'reserve':24} | {'':7} | {reserve['latency']['p50_ms']:8.2f} | {reserve['latency']['p95_ms']:8.2f}"
+        )
+        self.stdout.write(f"Free slots per service over the horizon: {free['free_slots_mean']}")
+        self.stdout.write(f"Reservations rejected as conflicts: {reserve['rejected']} of {reserve['attempts']}")
+        self.stdout.write(
+            f"Race: {race['threads']} threads booked {race['booked']} slots, rejected {race['rejected']}, "
+            f"errors {race['errors']}, overbooked minutes {race['overbooked']} ({race['seconds']}s)"
+        )
@@ -0,0 +1,142 @@
+"""
+Management command to benchmark notification broadcasts.
+
+Seeds a throwaway database with ``--users`` active users, then:
+
+* per-row:    creates the notification of the first ``--baseline`` users one
+              INSERT at a time, as create_notification does, for the rate a
+              loop over every user would reach
+* broadcast:  sends a broadcast to every user with core.broadcasts.run and
+              reports its throughput
+* resume:     sends a second broadcast, stops it half way, marks it as a
+              worker that died (stale heartbeat) and resumes it, under
+              tracemalloc; checks that every user got it exactly once and
+              reports the peak memory the broadcast allocated
+
+Usage:
+    python manage.py bench_broadcast [--users 1000000] [--batch-size 1000] [--baseline 2000] [--json]
+"""
+
+import json
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core import broadcasts
+from core.benchmarking import benchmark_database, timed
+from core.models import Broadcast, Notification
+
+SEED_BATCH = 10000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark broadcasting a notification to every user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000, help='Users seeded (default: 1000000)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=broadcasts.batch_size(),
+            help=f'Recipients per INSERT (default: {broadcasts.batch_size()})',
+        )
+        parser.add_argument('--baseline', type=int, default=2000, help='Users notified one row at a time (default: 2000)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        users, size = options['users'], options['batch_size']
+        # DEBUG keeps the last 9000 statements, batch INSERTs included, in memory
+        with benchmark_database(), override_settings(DEBUG=False):
+            seconds, _ = timed(self.seed, users)
+            if not options['json']:
+                self.stdout.write(f'Seeded {users} users in {seconds:.1f}s')
+            results = {
+                'users': users,
+                'batch_size': size,
+                'per_row': self.per_row(min(options['baseline'], users)),
+                'broadcast': self.broadcast(size),
+                'resume': self.resume(users, size),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results)
+        if not results['resume']['exactly_once']:
+            raise CommandError('The resumed broadcast did not reach every user exactly once')
+
+    def seed(self, count):
+        for start in range(0, count, SEED_BATCH):
+            User.objects.bulk_create([
+                User(username=f'user{number}', email=f'user{number}@example.com')
+                for number in range(start, min(start + SEED_BATCH, count))
+            ])
+
+    def per_row(self, count):
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True)[:count])
+        started = time.perf_counter()
+        for user_id in user_ids:
+            Notification.objects.create(
+                user_id=user_id, notification_type='promo', title='Per row', message='One INSERT per user',
+            )
+        elapsed = time.perf_counter() - started
+        Notification.objects.filter(title='Per row').delete()
+        return {'users': count, 'seconds': round(elapsed, 2), 'per_second': round(count / elapsed)}
+
+    def broadcast(self, size):
+        created = Broadcast.objects.create(notification_type='promo', title='Broadcast', message='Bulk')
+        seconds, broadcast = timed(broadcasts.run, created.pk, size=size)
+        return {
+            'status': broadcast.status,
+            'sent': broadcast.sent,
+            'seconds': round(seconds, 2),
+            'per_second': round(broadcast.sent / seconds),
+        }
+
+    def resume(self, users, size):
+        created = Broadcast.objects.create(notification_type='promo', title='Resumed', message='Interrupted')
+        batches = -(-users // size)
+        tracemalloc.start()
+        try:
+            first = broadcasts.run(created.pk, size=size, max_batches=batches // 2)
+            # As if the worker had died: still running, heartbeat past the lease
+            Broadcast.objects.filter(pk=created.pk).update(
+                status='running', heartbeat_at=timezone.now() - broadcasts.lease() - timedelta(seconds=1),
+            )
+            second = broadcasts.run(created.pk, size=size)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        delivered = Notification.objects.filter(title='Resumed').aggregate(
+            rows=Count('pk'), users=Count('user', distinct=True),
+        )
+        return {
+            'sent_before_interruption': first.sent,
+            'status': second.status,
+            'sent': second.sent,
+            'rows': delivered['rows'],
+            'exactly_once': delivered['rows'] == delivered['users'] == users == second.sent,
+            'peak_mb': round(peak / 1024 / 1024, 1),
+        }
+
+    def report(self, results):
+        per_row, bulk, resume = results['per_row'], results['broadcast'], results['resume']
+        self.stdout.write(self.style.SUCCESS(f"\n=== Broadcast to {results['users']} users ==="))
+        self.stdout.write(
+            f"Per-row INSERTs:  {per_row['per_second']:8} notifications/s "
+            f"(~{results['users'] / per_row['per_second']:.0f}s for every user)"
+        )
+        self.stdout.write(
+            f"Broadcast:        {bulk['per_second']:8} notifications/s "
+            f"({bulk['sent']} in {bulk['seconds']}s, batches of {results['batch_size']})"
+        )
+        self.stdout.write(
+            f"Resumed after {resume['sent_before_interruption']}: {resume['status']}, {resume['rows']} rows, "
+            f"exactly once: {resume['exactly_once']}, peak traced memory {resume['peak_mb']} MB"
+        )
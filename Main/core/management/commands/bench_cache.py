@@ -0,0 +1,167 @@
+"""
+Management command to benchmark the cache backends production can use.
+
+Runs the same workload against each backend:
+
+* database:     DatabaseCache, the former production backend, on a
+                throwaway copy of the configured database
+* tiered/database: core.cache_backends.TieredCache in front of it, the
+                production default without CACHE_URL
+* file:         FileBasedCache on its own
+* tiered/file:  TieredCache in front of FileBasedCache
+* redis, tiered/redis: the same for Redis, with ``--redis-url``
+
+Workload: ``--ops`` operations on ``--keys`` keys picked with a skewed
+(Pareto) distribution, as catalog pages are, of which ``--writes`` is the
+share of writes.  Values are a mix of counters and HTML-sized strings.
+Reports read and write latency and the tiered backends' hit ratios.
+
+Stampede: ``--threads`` threads miss the same key at once and call
+``get_or_set`` with a value that takes ``--compute-ms`` to compute; the
+number of computations shows whether the backend coalesces them.
+
+With the default SQLite database the ``database`` numbers leave out the
+network round trip a remote MySQL server adds to every operation.
+
+Usage:
+    python manage.py bench_cache [--ops 20000] [--keys 500] [--writes 0.02]
+                                 [--threads 16] [--compute-ms 50] [--redis-url URL] [--json]
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import Command as CreateCacheTable
+from django.db import DEFAULT_DB_ALIAS
+
+from core.benchmarking import benchmark_database, make_rng, phrase, summarize
+from core.cache_backends import TieredCache
+
+CACHE_TABLE = 'bench_cache_table'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the database, file, Redis and tiered cache backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=20000, help='Operations per backend (default: 20000)')
+        parser.add_argument('--keys', type=int, default=500, help='Distinct keys (default: 500)')
+        parser.add_argument('--writes', type=float, default=0.02, help='Share of writes (default: 0.02)')
+        parser.add_argument('--threads', type=int, default=16, help='Threads in the stampede test (default: 16)')
+        parser.add_argument('--compute-ms', type=float, default=50, help='Cost of a recomputed value (default: 50)')
+        parser.add_argument('--redis-url', default='', help='Also benchmark Redis at this URL')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        rng = make_rng()
+        values = [
+            number if number % 4 == 0 else phrase(rng, 200, 1500)
+            for number in range(options['keys'])
+        ]
+        workload = []
+        for _ in range(options['ops']):
+            index = min(int(rng.paretovariate(1.2)) - 1, options['keys'] - 1)
+            workload.append((rng.random() < options['writes'], f'bench:{index}', values[index]))
+
+        results = []
+        with benchmark_database(), tempfile.TemporaryDirectory() as directory:
+            create_table = CreateCacheTable()
+            create_table.verbosity = 0
+            create_table.create_table(DEFAULT_DB_ALIAS, CACHE_TABLE, dry_run=False)
+            for name, backend in self.backends(directory, options['redis_url']):
+                results.append({
+                    'backend': name,
+                    **self.run_workload(backend, workload),
+                    'stampede_computations': self.stampede(backend, options['threads'], options['compute_ms'] / 1000),
+                })
+                backend.clear()
+                backend.close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== Cache backends ({options['ops']} ops, {options['keys']} keys, {options['writes']:.0%} writes) ==="
+        ))
+        self.stdout.write(
+            f"{'backend':15} | {'read p50':>9} | {'read p99':>9} | {'write p50':>9} | {'ops/s':>8} | "
+            f"{'L1 hits':>7} | {'stampede':>8}"
+        )
+        for row in results:
+            l1 = row['l1_hit_ratio']
+            self.stdout.write(
+                f"{row['backend']:15} | {row['reads']['p50_ms']:9.3f} | {row['reads']['p99_ms']:9.3f} | "
+                f"{row['writes']['p50_ms']:9.3f} | {row['ops_per_second']:8.0f} | "
+                f"{'-' if l1 is None else f'{l1:.0%}':>7} | {row['stampede_computations']:8}"
+            )
+
+    def backends(self, directory, redis_url):
+        file_options = {'OPTIONS': {'MAX_ENTRIES': 10000}}
+        yield 'database', DatabaseCache(CACHE_TABLE, {})
+        yield 'tiered/database', TieredCache('', {'OPTIONS': {'L2': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': CACHE_TABLE,
+        }}})
+        yield 'file', FileBasedCache(os.path.join(directory, 'file'), file_options)
+        yield 'tiered/file', TieredCache('', {'OPTIONS': {'L2': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(directory, 'tiered'),
+            **file_options,
+        }}})
+        if redis_url:
+            from django.core.cache.backends.redis import RedisCache
+            yield 'redis', RedisCache(redis_url, {})
+            yield 'tiered/redis', TieredCache('', {'OPTIONS': {'L2': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': redis_url,
+            }}})
+
+    def run_workload(self, backend, workload):
+        reads, writes = [], []
+        started = time.perf_counter()
+        for write, key, value in workload:
+            before = time.perf_counter()
+            if write:
+                backend.set(key, value, 300)
+                writes.append(time.perf_counter() - before)
+            elif backend.get(key) is None:
+                backend.set(key, value, 300)
+                reads.append(time.perf_counter() - before)
+            else:
+                reads.append(time.perf_counter() - before)
+        elapsed = time.perf_counter() - started
+        stats = backend.stats() if hasattr(backend, 'stats') else {}
+        return {
+            'reads': summarize(reads),
+            'writes': summarize(writes),
+            'ops_per_second': round(len(workload) / elapsed, 1),
+            'l1_hit_ratio': stats.get('l1_hit_ratio'),
+        }
+
+    def stampede(self, backend, threads, compute_seconds):
+        computations = []
+        barrier = threading.Barrier(threads)
+
+        def compute():
+            computations.append(1)
+            time.sleep(compute_seconds)
+            return 'value'
+
+        def request():
+            barrier.wait()
+            backend.get_or_set('bench:stampede', compute, 300)
+
+        backend.delete('bench:stampede')
+        workers = [threading.Thread(target=request) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return len(computations)
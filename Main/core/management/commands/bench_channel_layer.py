@@ -0,0 +1,128 @@
+"""
+Management command to benchmark channel-layer group fan-out.
+
+For each layer, N consumer channels join one group held by a subscriber
+layer instance.  A separate publisher instance then calls group_send
+repeatedly; after each message every consumer channel is drained.
+Reported per layer and N:
+
+* group_send latency (mean/p50/p99): time until the call returns
+* fan-out latency (p99): time until the last consumer has the message
+* msgs/s: consumer deliveries per second
+
+Layers: channels' InMemoryChannelLayer (publisher and subscriber are the
+same instance, the only way it works), PubSubChannelLayer through the
+bundled broker on a Unix socket and on TCP (the Redis stand-in), and
+against a real Redis server when --redis-url is given.
+
+InMemoryChannelLayer.receive() scans every channel and group on each call
+to expire old messages, so draining N consumers through it is O(N^2) per
+message; its queues are therefore drained directly here.  Real consumers
+do pay that scan on every message they receive.
+
+Usage:
+    python manage.py bench_channel_layer [--consumers 1000,10000,50000] [--messages 20] [--redis-url redis://localhost:6379/0] [--json]
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from core.benchmarking import summarize
+from core.channel_layers import Broker, PubSubChannelLayer
+
+GROUP = 'bench'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark group_send fan-out of the channel layers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumers', default='1000,10000,50000', help='Comma-separated consumer counts')
+        parser.add_argument('--messages', type=int, default=20, help='group_send calls per run (default: 20)')
+        parser.add_argument('--redis-url', default='', help='Also benchmark against this Redis server')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        counts = [int(count) for count in options['consumers'].split(',')]
+        results = asyncio.run(self.run(counts, options['messages'], options['redis_url']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('\n=== Channel layer fan-out ==='))
+        self.stdout.write(
+            f"{'layer':12} {'consumers':>9} | {'send p50 ms':>11} {'send p99 ms':>11} | "
+            f"{'fan-out p99 ms':>14} | {'msgs/s':>10}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['layer']:12} {row['consumers']:9} | {row['send']['p50_ms']:11.3f} "
+                f"{row['send']['p99_ms']:11.3f} | {row['fanout']['p99_ms']:14.3f} | {row['msgs_per_second']:10.0f}"
+            )
+
+    async def run(self, counts, messages, redis_url):
+        socket_path = os.path.join(tempfile.mkdtemp(prefix='bench-channels-'), 'broker.sock')
+        unix_broker, tcp_broker = Broker(), Broker()
+        await unix_broker.start(socket_path=socket_path)
+        await tcp_broker.start(port=0)
+
+        def in_memory():
+            layer = InMemoryChannelLayer(capacity=messages + 1)
+            return layer, layer
+
+        def pubsub(url):
+            return lambda: (PubSubChannelLayer(url=url), PubSubChannelLayer(url=url, capacity=messages + 1))
+
+        layers = {'in-memory': in_memory, 'unix-broker': pubsub(unix_broker.address), 'tcp-broker': pubsub(tcp_broker.address)}
+        if redis_url:
+            layers['redis'] = pubsub(redis_url)
+
+        results = []
+        try:
+            for name, factory in layers.items():
+                for count in counts:
+                    publisher, subscriber = factory()
+                    results.append({'layer': name, 'consumers': count, **await self.measure(publisher, subscriber, count, messages)})
+                    for layer in {publisher, subscriber}:
+                        await (layer.close() if isinstance(layer, PubSubChannelLayer) else layer.flush())
+        finally:
+            await unix_broker.close()
+            await tcp_broker.close()
+        return results
+
+    async def measure(self, publisher, subscriber, count, messages):
+        channels = [await subscriber.new_channel() for _ in range(count)]
+        for channel in channels:
+            await subscriber.group_add(GROUP, channel)
+        await asyncio.sleep(0.1)  # let subscriptions reach the broker
+
+        send_samples, fanout_samples = [], []
+        started = time.perf_counter()
+        for number in range(messages):
+            start = time.perf_counter()
+            await publisher.group_send(GROUP, {'type': 'notification.event', 'payload': {'number': number}})
+            send_samples.append(time.perf_counter() - start)
+            for channel in channels:
+                await self.take(subscriber, channel)
+            fanout_samples.append(time.perf_counter() - start)
+        elapsed = time.perf_counter() - started
+
+        for channel in channels:
+            await subscriber.group_discard(GROUP, channel)
+        return {
+            'send': summarize(send_samples),
+            'fanout': summarize(fanout_samples),
+            'msgs_per_second': round(count * messages / elapsed),
+        }
+
+    async def take(self, layer, channel):
+        if isinstance(layer, InMemoryChannelLayer):
+            return layer.channels[channel].get_nowait()
+        return await layer.receive(channel)
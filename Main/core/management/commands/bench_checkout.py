@@ -0,0 +1,107 @@
+"""
+Management command to benchmark checkout round trips per order size.
+
+Seeds a throwaway database, fills carts of increasing size and checks each
+out twice: once with the per-line pipeline the checkout view used to run
+(one INSERT per order line, one signal-driven DELETE per cart line) and
+once with ``core.checkout.place_order``.  Reports the database round trips
+and wall time of each.
+
+Usage:
+    python manage.py bench_checkout [--sizes 1,5,10,25,50,100] [--repeat 5] [--json]
+"""
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.benchmarking import benchmark_database, commit_cart, make_rng, phrase, summarize, timed
+from core.checkout import place_order
+from core.models import Cart, CartItem, Notification, Order, OrderItem, StoreCategory, StoreItem
+
+
+def per_line_checkout(user, shipping_address):
+    """The former view body, kept here as the baseline."""
+    cart = Cart.objects.get(user=user)
+    cart_items = cart.items.all().select_related('item')
+    total = sum(item.get_total() for item in cart_items)
+    with transaction.atomic():
+        commit_cart(cart_items)
+        order = Order.objects.create(
+            user=user, total_amount=total, status='pending', shipping_address=shipping_address,
+        )
+        for cart_item in cart_items:
+            OrderItem.objects.create(
+                order=order, item=cart_item.item, quantity=cart_item.quantity, price=cart_item.item.price,
+            )
+        cart_items.delete()
+        Notification.objects.create(
+            user=user, notification_type='order', title='Order Placed Successfully! 🛒',
+            message=f'Your order #{order.id} has been placed.', link='/orders/',
+        )
+    return order
+
+
+class Command(BaseCommand):
+    help = 'Benchmark checkout round trips per order size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,25,50,100', help='Comma-separated cart sizes')
+        parser.add_argument('--repeat', type=int, default=5, help='Checkouts per size and pipeline (default: 5)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        with benchmark_database():
+            self.seed(max(sizes))
+            results = [self.measure(size, options['repeat']) for size in sizes]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('\n=== Checkout benchmark ==='))
+        self.stdout.write(f"{'lines':>6} | {'per-line queries':>16} {'mean ms':>9} | {'bulk queries':>12} {'mean ms':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['lines']:6} | {row['per_line']['queries']:16} {row['per_line']['mean_ms']:9.2f} | "
+                f"{row['bulk']['queries']:12} {row['bulk']['mean_ms']:9.2f}"
+            )
+
+    def seed(self, count):
+        rng = make_rng()
+        category = StoreCategory.objects.create(name='Bench')
+        self.items = StoreItem.objects.bulk_create([
+            StoreItem(
+                category=category, name=phrase(rng, 2, 4), description='', price=rng.randint(100, 5000),
+                image='store/placeholder.jpg', stock=10 ** 6,
+            )
+            for _ in range(count)
+        ])
+        self.user = User.objects.create_user('bench-checkout', password='x')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, size):
+        for item in self.items[:size]:
+            CartItem.objects.create(cart=self.cart, item=item, quantity=2)
+
+    def measure(self, size, repeat):
+        row = {'lines': size}
+        pipelines = {
+            'per_line': lambda: per_line_checkout(self.user, 'Bench street'),
+            'bulk': lambda: place_order(self.user, 'Bench street'),
+        }
+        for name, pipeline in pipelines.items():
+            samples, queries = [], 0
+            for _ in range(repeat):
+                self.fill_cart(size)
+                connection.queries_log.clear()  # the log keeps at most 9000 entries
+                with CaptureQueriesContext(connection) as captured:
+                    elapsed, _ = timed(pipeline)
+                samples.append(elapsed)
+                queries = len(captured)
+            row[name] = {'queries': queries, **summarize(samples)}
+        return row
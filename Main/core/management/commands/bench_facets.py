@@ -0,0 +1,177 @@
+"""
+Management command to benchmark the facet sidebar of the services listing.
+
+Seeds a throwaway database with catalog entries of every service type,
+growing it through each of ``--sizes``, and at every size computes the
+sidebar (the row count per value of every facet, under random filter
+selections) two ways:
+
+* index:  core.facets bitmap index, after building it once
+* sql:    one GROUP BY per multi-select facet and one MIN/MAX per range
+          facet, each filtered by the other facets' selections, which is
+          what the sidebar would cost without the index
+
+and checks that both agree on every multi-select count.  Reports the
+index build time and milliseconds per sidebar (p50/p95).
+
+Usage:
+    python manage.py bench_facets [--sizes 1000,10000,100000] [--repeat 50] [--json]
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, FloatField, Max, Min
+from django.db.models.functions import Cast
+from django.db.models.fields.json import KT
+from django.http import QueryDict
+from django.utils import timezone
+
+from core import catalog
+from core.benchmarking import benchmark_database, make_rng, phrase, summarize
+from core.facets import SCOPES, FacetIndex, load_rows
+from core.models import CatalogEntry
+
+BATCH_SIZE = 5000
+
+TYPES = {
+    'event': ['wedding', 'corporate', 'birthday', 'anniversary', 'reception'],
+    'photo': ['wedding', 'portrait', 'event', 'product'],
+    'catering': ['Bengali', 'Chinese', 'Continental', 'Indian', 'Thai'],
+    'printing': ['invitation', 'business card', 'banner', 'brochure'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark facet sidebar counts from the bitmap index against GROUP BY queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000', help='Catalog sizes to measure (comma separated)')
+        parser.add_argument('--repeat', type=int, default=50, help='Sidebars computed per size (default: 50)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        rng = make_rng()
+        scope = SCOPES['service']
+        selections = [scope.parse(self.random_params(rng)) for _ in range(options['repeat'])]
+        results = []
+        with benchmark_database():
+            seeded = 0
+            for size in sizes:
+                self.seed(rng, seeded, size)
+                seeded = size
+                started = time.perf_counter()
+                index = FacetIndex(scope, load_rows(scope))
+                build = time.perf_counter() - started
+
+                index_times, sql_times, mismatches = [], [], 0
+                for selection in selections:
+                    started = time.perf_counter()
+                    _, sidebar = index._sidebar(selection, index.everything)
+                    index_times.append(time.perf_counter() - started)
+                    started = time.perf_counter()
+                    counts = self.sql_sidebar(scope, selection)
+                    sql_times.append(time.perf_counter() - started)
+                    mismatches += self.compare(sidebar, counts)
+
+                results.append({
+                    'entries': size,
+                    'build_ms': round(build * 1000, 1),
+                    'index': summarize(index_times),
+                    'sql': summarize(sql_times),
+                    'mismatches': mismatches,
+                })
+                if not options['json']:
+                    self.stdout.write(f'  {size} entries measured')
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('\n=== Facet sidebar (ms per sidebar) ==='))
+        self.stdout.write(
+            f"{'entries':>8} | {'build':>8} | {'index p50':>9} | {'index p95':>9} | "
+            f"{'sql p50':>9} | {'sql p95':>9} | {'mismatch':>8}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['entries']:8} | {row['build_ms']:8.1f} | {row['index']['p50_ms']:9.3f} | "
+                f"{row['index']['p95_ms']:9.3f} | {row['sql']['p50_ms']:9.3f} | {row['sql']['p95_ms']:9.3f} | "
+                f"{row['mismatches']:8}"
+            )
+
+    def random_params(self, rng):
+        params = QueryDict(mutable=True)
+        if rng.random() < 0.5:
+            params.setlist('type', rng.sample(list(catalog.SERVICE_KINDS), rng.randint(1, 2)))
+        if rng.random() < 0.3:
+            params.setlist('event_type', rng.sample(TYPES['event'], 2))
+        if rng.random() < 0.4:
+            params['price_min'] = str(rng.randint(0, 5000))
+        if rng.random() < 0.3:
+            params['price_max'] = str(rng.randint(5000, 50000))
+        if rng.random() < 0.2:
+            params['capacity_min'] = str(rng.randint(20, 400))
+        if rng.random() < 0.2:
+            params['includes_catering'] = '1'
+        return params
+
+    def seed(self, rng, start, end):
+        now = timezone.now()
+        batch = []
+        for number in range(start, end):
+            kind = rng.choice(catalog.SERVICE_KINDS)
+            if kind == 'service':
+                category, category_id, facets = rng.choice(['Venues', 'Music', 'Lighting', 'Decor']), rng.randint(1, 4), {}
+            else:
+                category, category_id = rng.choice(TYPES[kind]), None
+                facets = {
+                    'event': {'capacity': rng.randint(20, 500), 'duration': rng.randint(2, 12),
+                              'includes_decoration': rng.random() < 0.5, 'includes_catering': rng.random() < 0.3},
+                    'photo': {'duration': rng.randint(1, 10), 'includes_editing': rng.random() < 0.8,
+                              'number_of_photos': rng.randint(50, 800), 'includes_prints': rng.random() < 0.4},
+                    'catering': {'min_order_quantity': rng.randint(20, 300), 'includes_serving_staff': rng.random() < 0.5,
+                                 'includes_setup': rng.random() < 0.5},
+                    'printing': {'paper_type': 'matte', 'min_order_quantity': rng.randint(50, 1000),
+                                 'includes_design': rng.random() < 0.5, 'delivery_time': rng.randint(1, 14)},
+                }[kind]
+            batch.append(CatalogEntry(
+                kind=kind, object_id=number + 1, title=phrase(rng, 2, 5), price=rng.randint(100, 50000),
+                category=category, category_id=category_id, facets=facets, created_at=now,
+            ))
+            if len(batch) == BATCH_SIZE:
+                CatalogEntry.objects.bulk_create(batch)
+                batch = []
+        CatalogEntry.objects.bulk_create(batch)
+
+    def sql_sidebar(self, scope, selection):
+        counts = {}
+        base = catalog.entries(scope.kinds)
+        for name, facet in scope.facets.items():
+            others = {other: selected for other, selected in selection.items() if other != name}
+            queryset = base.filter(scope.filter_q(others))
+            if facet.kinds:
+                queryset = queryset.filter(kind__in=facet.kinds)
+            # KT reads JSON keys as text; JSON values cannot be grouped or compared directly
+            column = facet.field == facet.lookup
+            if facet.type == 'range':
+                value = F(facet.lookup) if column else Cast(KT(facet.lookup), FloatField())
+                queryset.aggregate(low=Min(value), high=Max(value))
+                continue
+            value = F(facet.lookup) if column else KT(facet.lookup)
+            rows = queryset.annotate(value=value).values('value').annotate(count=Count('pk')).order_by()
+            counts[name] = {
+                ('1' if facet.type == 'flag' else str(value)): count
+                for value, count in rows.values_list('value', 'count')
+                if value not in (None, '', False, 0, 'false')
+            }
+        return counts
+
+    def compare(self, sidebar, counts):
+        found = {
+            facet['name']: {value['value']: value['count'] for value in facet['values'] if value['count']}
+            for facet in sidebar if facet['type'] != 'range'
+        }
+        return sum(1 for name, values in counts.items() if values != found.get(name, {}))
@@ -0,0 +1,438 @@
+"""
+Management command to benchmark EventNest's hot paths end to end.
+
+Seeds a throwaway file database with a synthetic catalog, then requests
+every endpoint below twice over:
+
+* client: through the Django test client, ``--repeat`` times each after a
+  warm-up, one at a time.  Reports latency percentiles, queries and
+  database time per request, and the peak Python memory one request
+  allocates (tracemalloc, measured on a separate request).
+* asgi: on a real daphne server forked onto the same database, driven
+  over TCP by ``--concurrency`` clients (each signed in as its own user)
+  for ``--duration`` seconds per endpoint.  Reports requests per second,
+  latency percentiles, errors and the server's resident memory.
+
+Endpoints: home, search, the service and store listings, a store item,
+the cart, checkout (two items are added to the cart before each timed
+request), order history, my bookings and the JSON APIs (cart count,
+notifications, order items, both searches, autocomplete).
+
+Row counts are ``--scale`` times the defaults below; each count can also
+be set on its own.  Seeding is deterministic, so two runs at the same
+scale see the same data.  ``--output`` writes the results as JSON with a
+stable layout, to be diffed between commits.
+
+Usage:
+    python manage.py bench_hot_paths [--scale 1] [--services N] [--items N] [--users N]
+                                     [--orders N] [--bookings N] [--notifications N]
+                                     [--repeat 50] [--concurrency 16] [--duration 3]
+                                     [--no-server] [--output results.json] [--json]
+"""
+
+import asyncio
+import datetime
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+
+import django
+from daphne.testing import DaphneProcess
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.utils.http import urlencode
+
+from core import catalog
+from core.benchmarking import benchmark_database, make_rng, phrase, summarize
+from core.models import (
+    Booking, Cart, CartItem, Notification, Order, OrderItem, Service, ServiceCategory, StoreCategory, StoreItem,
+)
+from core.search import get_backend
+
+# Rows seeded at --scale 1
+DEFAULT_ROWS = {
+    'services': 200,
+    'items': 1000,
+    'users': 100,
+    'orders': 1000,
+    'bookings': 1000,
+    'notifications': 5000,
+}
+BATCH_SIZE = 2000
+WARMUP = 3
+CSRF_TOKEN = 'b' * 32
+CHECKOUT_FORM = {'address': 'House 1, Road 2', 'city': 'Dhaka', 'zip_code': '1207'}
+
+
+class Endpoint:
+    """One request to benchmark; ``prepare`` runs untimed before each one."""
+
+    def __init__(self, name, path, method='GET', data=None, status=200, prepare=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data or {}
+        self.status = status
+        self.prepare = prepare or []  # (method, path, data) requests
+
+
+def memory_mb(pid, field):
+    """``VmRSS``/``VmHWM`` of a process in MB, from /proc (Linux only)."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith(f'{field}:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class QueryTimer:
+    """``execute_wrapper`` counting queries and their time; cheaper than CaptureQueriesContext."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def make_asgi_application():
+    from django.core.handlers.asgi import ASGIHandler
+    return ASGIHandler()
+
+
+def commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hot pages and JSON APIs through the test client and a real ASGI server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1, help='Multiplier for every row count (default: 1)')
+        for name, count in DEFAULT_ROWS.items():
+            parser.add_argument(f'--{name}', type=int, help=f'{name.capitalize()} to seed (default: {count} x scale)')
+        parser.add_argument('--repeat', type=int, default=50, help='Test client requests per endpoint (default: 50)')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent ASGI clients (default: 16)')
+        parser.add_argument('--duration', type=float, default=3, help='Seconds per endpoint on the server (default: 3)')
+        parser.add_argument('--no-server', action='store_true', help='Only use the test client')
+        parser.add_argument('--output', help='Write the JSON results to this file')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        server = not options['no_server']
+        if server and multiprocessing.get_start_method() != 'fork':
+            raise CommandError('The server is forked onto the benchmark database; use --no-server on this platform')
+        rows = {
+            name: max(1, options[name] if options[name] is not None else round(count * options['scale']))
+            for name, count in DEFAULT_ROWS.items()
+        }
+        rows['users'] = max(rows['users'], options['concurrency'] + 1)
+
+        with benchmark_database(threads=True):
+            cache.clear()
+            started = time.perf_counter()
+            users, endpoints = self.seed(rows)
+            seed_seconds = time.perf_counter() - started
+            self.stderr.write(f'Seeded {rows} in {seed_seconds:.1f}s')
+            results = {
+                'meta': {
+                    'commit': commit(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'rows': rows,
+                    'repeat': options['repeat'],
+                    'concurrency': options['concurrency'] if server else None,
+                    'duration': options['duration'] if server else None,
+                    'seed_seconds': round(seed_seconds, 1),
+                },
+                'client': self.run_client(users[0], endpoints, options['repeat']),
+            }
+            if server:
+                connections.close_all()
+                results['asgi'] = self.run_server(users[1:options['concurrency'] + 1], endpoints, options)
+        results['meta']['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+                handle.write('\n')
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.report(results)
+
+    # ============== SEEDING ==============
+
+    def seed(self, rows):
+        rng = make_rng()
+        service_categories = ServiceCategory.objects.bulk_create([
+            ServiceCategory(name=f'{phrase(rng, 1, 2)} {number}') for number in range(8)
+        ])
+        store_categories = StoreCategory.objects.bulk_create([
+            StoreCategory(name=f'{phrase(rng, 1, 2)} {number}') for number in range(8)
+        ])
+        services = Service.objects.bulk_create([
+            Service(category=rng.choice(service_categories), title=phrase(rng, 2, 5), description=phrase(rng, 10, 40),
+                    price=rng.randint(1000, 90000), image='services/placeholder.jpg')
+            for _ in range(rows['services'])
+        ], batch_size=BATCH_SIZE)
+        items = StoreItem.objects.bulk_create([
+            StoreItem(category=rng.choice(store_categories), name=phrase(rng, 2, 5), description=phrase(rng, 10, 40),
+                      price=rng.randint(100, 5000), image='store/placeholder.jpg', stock=10 ** 6)
+            for _ in range(rows['items'])
+        ], batch_size=BATCH_SIZE)
+
+        password = make_password('bench')
+        users = User.objects.bulk_create([
+            User(username=f'bench-{number}', password=password) for number in range(rows['users'])
+        ], batch_size=BATCH_SIZE)
+
+        orders = Order.objects.bulk_create([
+            Order(user=users[number % len(users)], total_amount=0, shipping_address='Bench street', status='delivered')
+            for number in range(rows['orders'])
+        ], batch_size=BATCH_SIZE)
+        lines = []
+        for order in orders:
+            for item in rng.sample(items, min(3, len(items))):
+                lines.append(OrderItem(order=order, item=item, quantity=rng.randint(1, 3), price=item.price))
+        OrderItem.objects.bulk_create(lines, batch_size=BATCH_SIZE)
+
+        today = datetime.date.today()
+        Booking.objects.bulk_create([
+            Booking(
+                user=users[number % len(users)], service_type='service', service_id=service.pk,
+                date=today + datetime.timedelta(days=rng.randint(1, 90)), time_slot=datetime.time(rng.randint(9, 20)),
+                status='confirmed', total_amount=service.price,
+            )
+            for number, service in enumerate(rng.choice(services) for _ in range(rows['bookings']))
+        ], batch_size=BATCH_SIZE)
+        Notification.objects.bulk_create([
+            Notification(
+                user=users[number % len(users)], notification_type=rng.choice(['order', 'booking', 'promo']),
+                title=phrase(rng, 2, 5), message=phrase(rng, 5, 20), is_read=rng.random() < 0.7,
+            )
+            for number in range(rows['notifications'])
+        ], batch_size=BATCH_SIZE)
+
+        # Every benchmark user has a cart; saved one by one for the counters
+        for user in users[:rows['users']]:
+            cart = Cart.objects.create(user=user)
+            for item in rng.sample(items, min(3, len(items))):
+                CartItem.objects.create(cart=cart, item=item, quantity=1)
+        # bulk_create skips the signals that maintain these
+        get_backend().rebuild()
+        catalog.rebuild()
+
+        word = services[0].title.split()[0].lower()
+        add = [('POST', f'/cart/add/{item.pk}/', {'quantity': 1}) for item in items[:2]]
+        endpoints = [
+            Endpoint('home', '/'),
+            Endpoint('search', f'/search/?{urlencode({"q": word})}'),
+            Endpoint('services', '/services/'),
+            Endpoint('store', '/store/'),
+            Endpoint('store_item', f'/store/{items[0].pk}/'),
+            Endpoint('cart', '/cart/'),
+            Endpoint('checkout', '/checkout/', 'POST', CHECKOUT_FORM, status=302, prepare=add),
+            Endpoint('order_history', '/orders/'),
+            Endpoint('my_bookings', '/my-bookings/'),
+            Endpoint('api_cart_count', '/api/cart-count/'),
+            Endpoint('api_notifications', '/api/notifications/'),
+            Endpoint('api_order_items', '/api/order/{order}/items/'),
+            Endpoint('api_services_search', f'/api/services-search/?{urlencode({"q": word})}'),
+            Endpoint('api_items_search', f'/api/items-search/?{urlencode({"q": word})}'),
+            Endpoint('api_autocomplete', f'/api/autocomplete/?{urlencode({"q": word[:3]})}'),
+        ]
+        return users, endpoints
+
+    def first_order(self, user):
+        return Order.objects.filter(user=user).values_list('pk', flat=True).first() or 0
+
+    # ============== TEST CLIENT ==============
+
+    def run_client(self, user, endpoints, repeat):
+        client = Client()
+        client.force_login(user)
+        order = self.first_order(user)
+        results = []
+        for endpoint in endpoints:
+            path = endpoint.path.format(order=order)
+
+            def call():
+                for method, prepare_path, data in endpoint.prepare:
+                    getattr(client, method.lower())(prepare_path, data)
+                queries = QueryTimer()
+                with connection.execute_wrapper(queries):
+                    started = time.perf_counter()
+                    response = getattr(client, endpoint.method.lower())(path, endpoint.data)
+                    elapsed = time.perf_counter() - started
+                if response.status_code != endpoint.status:
+                    raise CommandError(f'{endpoint.name}: {path} returned {response.status_code}')
+                return elapsed, queries
+
+            for _ in range(WARMUP):
+                call()
+            samples, counts, db_times = [], [], []
+            for _ in range(repeat):
+                elapsed, queries = call()
+                samples.append(elapsed)
+                counts.append(queries.count)
+                db_times.append(queries.seconds)
+            tracemalloc.start()
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append({
+                'endpoint': endpoint.name,
+                'method': endpoint.method,
+                'latency': summarize(samples),
+                'queries_mean': round(sum(counts) / len(counts), 2),
+                'queries_max': max(counts),
+                'db_ms_mean': round(1000 * sum(db_times) / len(db_times), 3),
+                'alloc_peak_kb': round(peak / 1024, 1),
+            })
+        return results
+
+    # ============== ASGI SERVER ==============
+
+    def run_server(self, users, endpoints, options):
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; csrftoken={CSRF_TOKEN}'
+            clients.append((cookie, self.first_order(user)))
+        connections.close_all()
+
+        process = DaphneProcess('127.0.0.1', make_asgi_application)
+        process.start()
+        try:
+            if not process.ready.wait(30):
+                raise CommandError('daphne did not start')
+            port = process.port.value
+            results = []
+            for endpoint in endpoints:
+                plans = [self.raw_requests(endpoint, cookie, order) for cookie, order in clients]
+                # Warm up: URL resolver, templates, database connections
+                asyncio.run(self.load(port, plans, endpoint.status, 1.0))
+                row = asyncio.run(self.load(port, plans, endpoint.status, options['duration']))
+                results.append({
+                    'endpoint': endpoint.name,
+                    'method': endpoint.method,
+                    **row,
+                    'server_rss_mb': memory_mb(process.pid, 'VmRSS'),
+                })
+            peak = memory_mb(process.pid, 'VmHWM')
+        finally:
+            process.terminate()
+            process.join()
+        for row in results:
+            row['server_peak_rss_mb'] = peak
+        return results
+
+    def raw_requests(self, endpoint, cookie, order):
+        """``(prepare requests, timed request)`` as raw HTTP/1.1 bytes."""
+        def raw(method, path, data):
+            body = urlencode(data).encode() if method == 'POST' else b''
+            return (
+                f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\nX-CSRFToken: {CSRF_TOKEN}\r\n'
+                f'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'
+            ).encode() + body
+
+        prepare = [raw(method, path, data) for method, path, data in endpoint.prepare]
+        return prepare, raw(endpoint.method, endpoint.path.format(order=order), endpoint.data)
+
+    async def load(self, port, plans, status, duration):
+        samples, errors = [], 0
+        expected = str(status).encode()
+        deadline = time.perf_counter() + duration
+
+        async def send(request):
+            """Send one request on a new connection and return its status code."""
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            response = await reader.read()
+            writer.close()
+            return response[9:12]
+
+        async def client(prepare, request):
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                try:
+                    for step in prepare:
+                        await send(step)
+                    start = time.perf_counter()
+                    code = await send(request)
+                except OSError:
+                    errors += 1
+                    continue
+                if code == expected:
+                    samples.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(prepare, request) for prepare, request in plans))
+        elapsed = time.perf_counter() - started
+        return {
+            'requests_per_second': round(len(samples) / elapsed, 1),
+            'latency': summarize(samples),
+            'errors': errors,
+        }
+
+    # ============== REPORT ==============
+
+    def report(self, results):
+        meta = results['meta']
+        self.stdout.write(self.style.SUCCESS('\n=== Hot paths: test client ==='))
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in meta['rows'].items()))
+        self.stdout.write(
+            f"{'endpoint':20} | {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} | {'queries':>7} {'db ms':>7} | {'alloc KB':>8}"
+        )
+        for row in results['client']:
+            self.stdout.write(
+                f"{row['endpoint']:20} | {row['latency']['p50_ms']:8.2f} {row['latency']['p95_ms']:8.2f} "
+                f"{row['latency']['p99_ms']:8.2f} | {row['queries_mean']:7.1f} {row['db_ms_mean']:7.2f} | "
+                f"{row['alloc_peak_kb']:8.0f}"
+            )
+        if 'asgi' in results:
+            self.stdout.write(self.style.SUCCESS(
+                f"\n=== Hot paths: daphne, {meta['concurrency']} clients, {meta['duration']}s each ==="
+            ))
+            self.stdout.write(
+                f"{'endpoint':20} | {'req/s':>8} | {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} | {'errors':>6} | {'RSS MB':>7}"
+            )
+            for row in results['asgi']:
+                self.stdout.write(
+                    f"{row['endpoint']:20} | {row['requests_per_second']:8.0f} | {row['latency']['p50_ms']:8.2f} "
+                    f"{row['latency']['p95_ms']:8.2f} {row['latency']['p99_ms']:8.2f} | {row['errors']:6} | "
+                    f"{row['server_rss_mb'] or '-':>7}"
+                )
+            self.stdout.write(f"Server peak RSS: {results['asgi'][-1]['server_peak_rss_mb']} MB")
+        self.stdout.write(f"Benchmark process peak RSS: {meta['max_rss_mb']} MB")
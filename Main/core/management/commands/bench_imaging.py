@@ -0,0 +1,236 @@
+"""
+Management command to benchmark placeholder image generation.
+
+Draws ``--count`` placeholder cards with each implementation and reports
+images per second:
+
+* enhance_images:    the drawing function of enhance_images.py (1200x800)
+* fix_missing:       the drawing function of fix_missing_images.py (800x600)
+* generate_complete: the drawing function of generate_images_complete.py
+                     (800x600)
+* imaging:           core.imaging in this process, at both sizes
+* imaging pool:      core.imaging over ``--workers`` processes (1200x800),
+                     only with two or more workers
+
+The former functions are copied below unchanged, except that their error
+handling is dropped and they load the TrueType file core.imaging uses
+instead of arial.ttf.  Without Arial they would fall back to a tiny
+bitmap font, which is not comparable.  Images are written to a temporary
+directory.
+
+Usage:
+    python manage.py bench_imaging [--count 100] [--workers N] [--json]
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageFont
+
+from core import imaging
+from core.benchmarking import make_rng, phrase
+
+
+# ============== BASELINES ==============
+# Font file the baselines load for every image; set to core.imaging's font
+FONT_FILE = 'arial.ttf'
+
+
+def enhance_images(title, category, description_snippet, filename, width=1200, height=800, price=None, is_service=True):
+    img = Image.new('RGB', (width, height), color=(30, 60, 114))
+    draw = ImageDraw.Draw(img)
+    for i in range(height):
+        ratio = i / height
+        r = int(30 + (42 - 30) * ratio)
+        g = int(60 + (82 - 60) * ratio)
+        b = int(114 + (152 - 114) * ratio)
+        draw.rectangle([(0, i), (width, i+1)], fill=(r, g, b))
+    overlay_height = min(height // 2, 300)
+    for i in range(overlay_height):
+        draw.rectangle([(0, height - overlay_height + i), (width, height - overlay_height + i + 1)], fill=(0, 0, 0))
+    try:
+        font_title = ImageFont.truetype(FONT_FILE, 64)
+        font_category = ImageFont.truetype(FONT_FILE, 40)
+        font_description = ImageFont.truetype(FONT_FILE, 32)
+        font_price = ImageFont.truetype(FONT_FILE, 48)
+    except OSError:
+        font_title = font_category = font_description = font_price = ImageFont.load_default()
+    y_pos = height - 280
+    line = ""
+    for word in title.split():
+        test_line = line + " " + word if line else word
+        bbox = draw.textbbox((0, 0), test_line, font=font_title)
+        if (bbox[2] - bbox[0]) > (width - 100):
+            if line:
+                bbox = draw.textbbox((0, 0), line, font=font_title)
+                draw.text(((width - (bbox[2] - bbox[0])) // 2, y_pos), line, fill=(255, 255, 255), font=font_title)
+                y_pos += 80
+            line = word
+        else:
+            line = test_line
+    if line:
+        bbox = draw.textbbox((0, 0), line, font=font_title)
+        draw.text(((width - (bbox[2] - bbox[0])) // 2, y_pos), line, fill=(255, 255, 255), font=font_title)
+        y_pos += 80
+    bbox = draw.textbbox((0, 0), category, font=font_category)
+    draw.text(((width - (bbox[2] - bbox[0])) // 2, y_pos), category, fill=(150, 200, 255), font=font_category)
+    y_pos += 70
+    if price and not is_service:
+        price_text = f"BDT {int(price)}"
+        bbox = draw.textbbox((0, 0), price_text, font=font_price)
+        draw.text(((width - (bbox[2] - bbox[0])) // 2, y_pos), price_text, fill=(100, 200, 100), font=font_price)
+        y_pos += 70
+    if description_snippet:
+        desc_text = description_snippet[:50] + "..." if len(description_snippet) > 50 else description_snippet
+        bbox = draw.textbbox((0, 0), desc_text, font=font_description)
+        draw.text(((width - (bbox[2] - bbox[0])) // 2, y_pos), desc_text, fill=(200, 200, 200), font=font_description)
+    img.save(filename, quality=95)
+
+
+def fix_missing(title, category, filename, width=800, height=600, price=None):
+    img = Image.new('RGB', (width, height), color=(30, 60, 114))
+    draw = ImageDraw.Draw(img)
+    for i in range(height):
+        ratio = i / height
+        r = int(30 + (42 - 30) * ratio)
+        g = int(60 + (82 - 60) * ratio)
+        b = int(114 + (152 - 114) * ratio)
+        draw.rectangle([(0, i), (width, i+1)], fill=(r, g, b))
+    try:
+        font_large = ImageFont.truetype(FONT_FILE, 48)
+        font_small = ImageFont.truetype(FONT_FILE, 32)
+    except OSError:
+        font_large = font_small = ImageFont.load_default()
+    y_pos = 150
+    title_words = title.split()
+    for i in range(0, len(title_words), 3):
+        line = ' '.join(title_words[i:i+3])
+        bbox = draw.textbbox((0, 0), line, font=font_large)
+        draw.text(((width - (bbox[2] - bbox[0])) // 2, y_pos), line, fill=(255, 255, 255), font=font_large)
+        y_pos += 60
+    bbox = draw.textbbox((0, 0), category, font=font_small)
+    draw.text(((width - (bbox[2] - bbox[0])) // 2, y_pos + 40), category, fill=(200, 200, 200), font=font_small)
+    if price:
+        price_text = f"BDT {price}"
+        bbox = draw.textbbox((0, 0), price_text, font=font_small)
+        draw.text(((width - (bbox[2] - bbox[0])) // 2, y_pos + 100), price_text, fill=(100, 200, 100), font=font_small)
+    img.save(filename)
+
+
+def generate_complete(text, filename, width=800, height=600):
+    img = Image.new('RGB', (width, height), color=(30, 60, 114))
+    draw = ImageDraw.Draw(img)
+    for i in range(height):
+        ratio = i / height
+        r = int(30 + (42 - 30) * ratio)
+        g = int(60 + (82 - 60) * ratio)
+        b = int(114 + (152 - 114) * ratio)
+        draw.rectangle([(0, i), (width, i+1)], fill=(r, g, b))
+    try:
+        font = ImageFont.truetype(FONT_FILE, 40)
+    except OSError:
+        font = ImageFont.load_default()
+    words = text.split()
+    lines = []
+    current_line = []
+    for word in words:
+        current_line.append(word)
+        if len(current_line) > 4:
+            lines.append(' '.join(current_line[:-1]))
+            current_line = [word]
+    if current_line:
+        lines.append(' '.join(current_line))
+    y = (height - len(lines) * 50) // 2
+    for line in lines:
+        bbox = draw.textbbox((0, 0), line, font=font)
+        draw.text(((width - (bbox[2] - bbox[0])) // 2, y), line, fill=(255, 255, 255), font=font)
+        y += 50
+    img.save(filename)
+
+
+# ============== BENCHMARK ==============
+
+class Command(BaseCommand):
+    help = 'Benchmark placeholder image generation against the former scripts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100, help='Images per scenario (default: 100)')
+        parser.add_argument('--workers', type=int, default=imaging.cpu_count(), help='Pool processes (default: CPUs)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        global FONT_FILE
+        count, workers = options['count'], options['workers']
+        FONT_FILE = getattr(imaging.font(64), 'path', FONT_FILE)
+        rng = make_rng()
+        cards = [
+            (phrase(rng, 2, 6).title(), phrase(rng, 1, 2).title(), phrase(rng, 8, 16), rng.randint(100, 50000))
+            for _ in range(count)
+        ]
+
+        with tempfile.TemporaryDirectory() as directory:
+            def path(scenario, number):
+                return os.path.join(directory, scenario, f'{number}.jpg')
+
+            for scenario in ('enhance', 'fix', 'complete', 'imaging', 'pool'):
+                os.makedirs(os.path.join(directory, scenario))
+
+            def large(title, category, description, price):
+                return imaging.PlaceholderSpec(title, category, description, str(price))
+
+            scenarios = [
+                ('enhance_images', '1200x800', lambda: [
+                    enhance_images(title, category, description, path('enhance', number), price=price, is_service=False)
+                    for number, (title, category, description, price) in enumerate(cards)
+                ]),
+                ('fix_missing', '800x600', lambda: [
+                    fix_missing(title, category, path('fix', number), price=price)
+                    for number, (title, category, description, price) in enumerate(cards)
+                ]),
+                ('generate_complete', '800x600', lambda: [
+                    generate_complete(f'{title}\n{category}\nBDT {price}', path('complete', number))
+                    for number, (title, category, description, price) in enumerate(cards)
+                ]),
+                ('imaging', '1200x800', lambda: [
+                    imaging.render_to_file(large(*card), path('imaging', number))
+                    for number, card in enumerate(cards)
+                ]),
+                ('imaging', '800x600', lambda: [
+                    imaging.render_to_file(large(*card)._replace(width=800, height=600), path('imaging', number))
+                    for number, card in enumerate(cards)
+                ]),
+            ]
+            if workers > 1:
+                scenarios.append((f'imaging pool x{workers}', '1200x800', lambda: self.pool(
+                    workers, [large(*card) for card in cards], [path('pool', number) for number in range(count)],
+                )))
+            results = []
+            for name, size, func in scenarios:
+                started = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - started
+                results.append({
+                    'implementation': name, 'size': size, 'images': count,
+                    'seconds': round(elapsed, 3), 'images_per_second': round(count / elapsed, 1),
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('\n=== Placeholder image generation ==='))
+        self.stdout.write(f"{'implementation':20} {'size':9} | {'images/s':>9} | {'ms/image':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['implementation']:20} {row['size']:9} | {row['images_per_second']:9.1f} | "
+                f"{1000 * row['seconds'] / row['images']:9.2f}"
+            )
+
+    def pool(self, workers, specs, paths):
+        # Pool start-up is part of the cost a command run pays
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(imaging.render_to_file, specs, paths, chunksize=max(1, len(specs) // (workers * 4))))
@@ -0,0 +1,130 @@
+"""
+Management command to benchmark the store listing's time to first byte as
+the catalog grows.
+
+Seeds a throwaway database with store items, growing it through each of
+``--sizes``, and at every size requests /store/ as a signed-in user:
+
+* first:  page 1, page cache cleared before every request
+* deep:   the page at the middle of the catalog, reached by its cursor,
+          page cache cleared before every request
+* cached: page 1 again with the rendered page cached
+* legacy: the former view body, every item rendered on one page (only up
+          to ``--legacy-max`` items; it grows linearly)
+
+Reports milliseconds per request (p50/p95) and queries per request.
+
+Usage:
+    python manage.py bench_listings [--sizes 50,5000,50000,500000] [--repeat 20] [--legacy-max 5000] [--json]
+"""
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core.benchmarking import benchmark_database, make_rng, phrase, summarize, timed
+from core.listings import SORTS
+from core.models import StoreCategory, StoreItem
+from core.pagination import encode_cursor
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark store listing response times from small to very large catalogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50,5000,50000,500000', help='Comma-separated catalog sizes')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per scenario (default: 20)')
+        parser.add_argument('--legacy-max', type=int, default=5000, help='Largest catalog to render unpaginated (default: 5000)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        results = []
+        with benchmark_database():
+            self.setup()
+            for size in sizes:
+                self.grow(size)
+                results.append(self.measure(size, options))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('\n=== Store listing benchmark ==='))
+        self.stdout.write(f"{'items':>8} | {'scenario':8} | {'p50 ms':>9} {'p95 ms':>9} | {'queries':>7}")
+        for row in results:
+            for name in ('first', 'deep', 'cached', 'legacy'):
+                if name in row:
+                    timing = row[name]
+                    self.stdout.write(
+                        f"{row['items']:8} | {name:8} | {timing['p50_ms']:9.2f} {timing['p95_ms']:9.2f} | {timing['queries']:7}"
+                    )
+
+    def setup(self):
+        self.rng = make_rng()
+        self.categories = [StoreCategory.objects.create(name=f'Bench {number}') for number in range(8)]
+        user = User.objects.create_user('bench-listings', password='x')
+        self.client = Client()
+        self.client.force_login(user)
+
+    def grow(self, size):
+        missing = size - StoreItem.objects.count()
+        while missing > 0:
+            batch = min(missing, BATCH_SIZE)
+            StoreItem.objects.bulk_create([
+                StoreItem(
+                    category=self.rng.choice(self.categories), name=phrase(self.rng, 2, 4),
+                    description=phrase(self.rng, 8, 20), price=self.rng.randint(100, 50000),
+                    image='store/placeholder.jpg', stock=self.rng.randint(0, 50),
+                )
+                for _ in range(batch)
+            ])
+            missing -= batch
+
+    def request(self, url, clear_cache):
+        if clear_cache:
+            cache.clear()
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as captured:
+            elapsed, response = timed(self.client.get, url)
+        assert response.status_code == 200, response.status_code
+        return elapsed, len(captured)
+
+    def scenario(self, repeat, func):
+        samples, queries = [], 0
+        for _ in range(repeat):
+            elapsed, queries = func()
+            samples.append(elapsed)
+        return {'queries': queries, **summarize(samples)}
+
+    def measure(self, size, options):
+        repeat = options['repeat']
+        ordering = SORTS['newest']
+        middle = StoreItem.objects.order_by(*ordering).values_list('created_at', 'id')[size // 2]
+        deep_url = f'/store/?after={encode_cursor(middle)}'
+
+        row = {'items': size}
+        row['first'] = self.scenario(repeat, lambda: self.request('/store/', clear_cache=True))
+        row['deep'] = self.scenario(repeat, lambda: self.request(deep_url, clear_cache=True))
+        self.request('/store/', clear_cache=True)
+        row['cached'] = self.scenario(repeat, lambda: self.request('/store/', clear_cache=False))
+        if size <= options['legacy_max']:
+            row['legacy'] = self.scenario(repeat, self.legacy)
+        return row
+
+    def legacy(self):
+        """Render the whole catalog as the view did before pagination."""
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as captured:
+            elapsed, _ = timed(
+                lambda: render_to_string('store/_item_grid.html', {'page': StoreItem.objects.all()})
+            )
+        return elapsed, len(captured)
@@ -0,0 +1,215 @@
+"""
+Management command to benchmark notification reads and retention at scale.
+
+Seeds a throwaway database with ``--notifications`` notifications over
+``--history-days`` days, a ``--heavy`` share of them belonging to one user,
+then measures what the notification pages run (the unread count, the
+newest 50 and the newest 10 of a user):
+
+* with the former standalone ``is_read`` index in place of (user, is_read)
+* with the current indexes, before pruning
+* after ``core.retention.prune`` has removed the expired notifications
+
+The prune itself runs with archiving on while a reader thread keeps
+counting unread notifications, and reports rows deleted per second, the
+longest batch transaction, the reader's latency meanwhile and the archive's
+compression ratio.
+
+Usage:
+    python manage.py bench_notification_retention [--notifications 1000000] [--users 10000]
+        [--history-days 730] [--heavy 0.1] [--repeat 200] [--json]
+"""
+
+import json
+import threading
+import time
+import zlib
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections, models
+from django.db.models import Sum
+from django.db.models.functions import Length
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core import retention
+from core.benchmarking import benchmark_database, make_rng, phrase, summarize, timed
+from core.models import Notification, NotificationArchive
+
+BATCH_SIZE = 1000
+
+TYPES = ['promo', 'promo', 'promo', 'system', 'welcome', 'booking', 'order', 'order']
+
+
+def page_queries(user_id):
+    """The queries of the notifications page, the dropdown and the badge."""
+    Notification.objects.filter(user_id=user_id, is_read=False).count()
+    list(Notification.objects.filter(user_id=user_id).order_by('-created_at')[:50])
+    list(Notification.objects.filter(user_id=user_id).order_by('-created_at')[:10])
+
+
+class Command(BaseCommand):
+    help = 'Benchmark notification page queries and retention pruning over a large history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notifications', type=int, default=1000000, help='Notifications seeded (default: 1000000)')
+        parser.add_argument('--users', type=int, default=10000, help='Users (default: 10000)')
+        parser.add_argument('--history-days', type=int, default=730, help='Days of history (default: 730)')
+        parser.add_argument('--heavy', type=float, default=0.1, help='Share of notifications of one user (default: 0.1)')
+        parser.add_argument('--repeat', type=int, default=200, help='Page measurements per layout (default: 200)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        rng = make_rng()
+        # DEBUG keeps the last 9000 statements in memory
+        with benchmark_database(threads=True), override_settings(DEBUG=False):
+            seconds, _ = timed(self.seed, rng, options)
+            if not options['json']:
+                self.stdout.write(f"Seeded {options['notifications']} notifications in {seconds:.1f}s")
+            results = {'notifications': options['notifications'], 'heavy_rows': self.heavy_rows}
+            self.swap_indexes(legacy=True)
+            results['is_read_index'] = self.measure(rng, options['repeat'])
+            self.swap_indexes(legacy=False)
+            results['user_is_read_index'] = self.measure(rng, options['repeat'])
+            results['prune'] = self.prune()
+            results['after_prune'] = self.measure(rng, options['repeat'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results)
+
+    def seed(self, rng, options):
+        User.objects.bulk_create([User(username=f'user{number}') for number in range(options['users'])])
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        self.heavy_user, self.user_ids = user_ids[0], user_ids[1:]
+        now = timezone.now()
+        total = options['notifications']
+        titles = [phrase(rng, 3, 6) for _ in range(50)]
+        self.heavy_rows = 0
+        # Oldest first, one timestamp per batch, as ids grow with time
+        for start in range(0, total, BATCH_SIZE):
+            age = options['history_days'] * (1 - start / total)
+            batch = []
+            for _ in range(min(BATCH_SIZE, total - start)):
+                heavy = rng.random() < options['heavy']
+                self.heavy_rows += heavy
+                batch.append(Notification(
+                    user_id=self.heavy_user if heavy else rng.choice(self.user_ids),
+                    notification_type=rng.choice(TYPES),
+                    title=rng.choice(titles),
+                    message=phrase(rng, 10, 25),
+                    link='/services/',
+                    # Old notifications have mostly been read
+                    is_read=rng.random() < min(0.95, age / 30),
+                ))
+            created = Notification.objects.bulk_create(batch)
+            # created_at is auto_now_add, so backdate the batch afterwards
+            Notification.objects.filter(pk__gte=created[0].pk, pk__lte=created[-1].pk).update(
+                created_at=now - timedelta(days=age),
+            )
+
+    def swap_indexes(self, legacy):
+        """Put the former ``is_read`` index in place of (user, is_read), or back."""
+        current = next(index for index in Notification._meta.indexes if index.fields == ['user', 'is_read'])
+        former = models.Index(fields=['is_read'], name='core_notifi_is_read_127eae_idx')
+        with connection.schema_editor() as editor:
+            if legacy:
+                editor.remove_index(Notification, current)
+                editor.add_index(Notification, former)
+            else:
+                editor.remove_index(Notification, former)
+                editor.add_index(Notification, current)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def measure(self, rng, repeat):
+        heavy, typical = [], []
+        for _ in range(repeat):
+            heavy.append(timed(page_queries, self.heavy_user)[0])
+            typical.append(timed(page_queries, rng.choice(self.user_ids))[0])
+        return {
+            'rows': Notification.objects.count(),
+            'heavy_user_rows': Notification.objects.filter(user_id=self.heavy_user).count(),
+            'heavy_user': summarize(heavy),
+            'typical_user': summarize(typical),
+        }
+
+    def prune(self):
+        stop = threading.Event()
+        reads = []
+
+        def reader():
+            close_old_connections()
+            try:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    Notification.objects.filter(user_id=self.heavy_user, is_read=False).count()
+                    reads.append(time.perf_counter() - start)
+                    time.sleep(0.005)
+            finally:
+                connections.close_all()
+
+        batches = []
+        last = [time.perf_counter()]
+
+        def progress(notification_type, deleted):
+            now = time.perf_counter()
+            batches.append(now - last[0])
+            last[0] = now
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        try:
+            seconds, results = timed(retention.prune, archive=True, progress=progress)
+        finally:
+            stop.set()
+            thread.join()
+        deleted = sum(results.values())
+        stored = NotificationArchive.objects.aggregate(bytes=Sum(Length('payload')))['bytes'] or 0
+        raw = sum(
+            len(zlib.decompress(bytes(payload)))
+            for payload in NotificationArchive.objects.values_list('payload', flat=True).iterator()
+        )
+        return {
+            'deleted': results,
+            'seconds': round(seconds, 2),
+            'per_second': round(deleted / seconds) if seconds else 0,
+            'batch': summarize(batches),
+            'reader': summarize(reads),
+            'archives': NotificationArchive.objects.count(),
+            'archive_mb': round(stored / 1024 / 1024, 1),
+            'compression': round(raw / stored, 1) if stored else 0,
+        }
+
+    def report(self, results):
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== Notification pages: {results['notifications']} notifications, "
+            f"{results['heavy_rows']} of one user ==="
+        ))
+        self.stdout.write(f"{'layout':22} | {'rows':>8} | {'heavy p50':>9} | {'heavy p95':>9} | {'typical p50':>11}")
+        for label, key in (
+            ('is_read index', 'is_read_index'),
+            ('(user, is_read) index', 'user_is_read_index'),
+            ('after prune', 'after_prune'),
+        ):
+            row = results[key]
+            self.stdout.write(
+                f"{label:22} | {row['rows']:8} | {row['heavy_user']['p50_ms']:9.2f} | "
+                f"{row['heavy_user']['p95_ms']:9.2f} | {row['typical_user']['p50_ms']:11.2f}"
+            )
+        prune = results['prune']
+        self.stdout.write(self.style.SUCCESS('\n=== Prune (archiving) ==='))
+        self.stdout.write(f"Deleted: {prune['deleted']}")
+        self.stdout.write(
+            f"{prune['per_second']} rows/s over {prune['seconds']}s; batch transaction p50 "
+            f"{prune['batch']['p50_ms']:.1f} ms, max {prune['batch']['max_ms']:.1f} ms"
+        )
+        self.stdout.write(
+            f"Unread count meanwhile: p50 {prune['reader']['p50_ms']:.2f} ms, p95 {prune['reader']['p95_ms']:.2f} ms"
+        )
+        self.stdout.write(
+            f"Archive: {prune['archives']} rows, {prune['archive_mb']} MB, {prune['compression']}x smaller than JSON"
+        )
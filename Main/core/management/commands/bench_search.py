@@ -0,0 +1,132 @@
+"""
+Management command to benchmark catalog search.
+
+Seeds a throwaway database with synthetic services and store items, then
+times the indexed search backends against the ``icontains`` Q-object scan
+the views used to run.
+
+Usage:
+    python manage.py bench_search [--rows 100000] [--repeat 20] [--limit 10] [--json]
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from core import search
+from core.benchmarking import LONG_TAIL, benchmark_database, make_rng, phrase, summarize, timed
+from core.models import Service, ServiceCategory, StoreCategory, StoreItem
+
+# Common terms (hit a large share of rows), long-tail terms of falling
+# frequency, a prefix, and a miss
+QUERIES = [
+    'wedding', 'biryani kebab', 'deco',
+    LONG_TAIL[2], LONG_TAIL[40], LONG_TAIL[900], f'{LONG_TAIL[7]} wedding',
+    LONG_TAIL[300][:5], 'nothingmatches',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark indexed search backends against the icontains scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Rows per model to seed (default: 100000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query (default: 20)')
+        parser.add_argument('--limit', type=int, default=10, help='Results fetched per query (default: 10)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.seed(options['rows'])
+            results = self.run(options['repeat'], options['limit'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"\n=== Search benchmark ({options['rows']} rows per model) ==="))
+        for row in results['timings']:
+            self.stdout.write(
+                f"{row['strategy']:12} {row['kind']:10} {row['query']!r:24} "
+                f"hits={row['hits']:4} p50={row['p50_ms']:9.3f}ms p95={row['p95_ms']:9.3f}ms"
+            )
+        for strategy, total in results['totals'].items():
+            self.stdout.write(f'{strategy:12} mean over all queries: {total:.3f}ms')
+
+    def seed(self, rows):
+        rng = make_rng()
+        service_categories = ServiceCategory.objects.bulk_create(
+            [ServiceCategory(name=phrase(rng, 1, 2)) for _ in range(20)]
+        )
+        store_categories = StoreCategory.objects.bulk_create(
+            [StoreCategory(name=phrase(rng, 1, 2)) for _ in range(20)]
+        )
+        batch = 5000
+        for start in range(0, rows, batch):
+            count = min(batch, rows - start)
+            Service.objects.bulk_create([
+                Service(
+                    category=rng.choice(service_categories),
+                    title=phrase(rng, 2, 5, rare=0.5),
+                    description=phrase(rng, 10, 30, rare=0.5),
+                    price=rng.randint(1000, 500000),
+                    image='services/placeholder.jpg',
+                )
+                for _ in range(count)
+            ])
+            StoreItem.objects.bulk_create([
+                StoreItem(
+                    category=rng.choice(store_categories),
+                    name=phrase(rng, 2, 5, rare=0.5),
+                    description=phrase(rng, 10, 30, rare=0.5),
+                    price=rng.randint(100, 50000),
+                    stock=rng.randint(0, 500),
+                    image='store/placeholder.jpg',
+                )
+                for _ in range(count)
+            ])
+
+    def strategies(self):
+        """Yield (name, backend) for every backend usable on this database."""
+        yield 'inprocess', search.InProcessSearchBackend()
+        if connection.vendor == 'sqlite' and search.sqlite_has_fts5():
+            yield 'fts5', search.SQLiteFTS5Backend()
+        if connection.vendor == 'mysql':
+            yield 'mysql', search.MySQLFullTextBackend()
+
+    def run(self, repeat, limit):
+        scans = {
+            'service': lambda q: list(Service.objects.filter(
+                Q(title__icontains=q) | Q(description__icontains=q) | Q(category__name__icontains=q)
+            ).values_list('pk', flat=True)[:limit]),
+            'storeitem': lambda q: list(StoreItem.objects.filter(
+                Q(name__icontains=q) | Q(description__icontains=q) | Q(category__name__icontains=q)
+            ).values_list('pk', flat=True)[:limit]),
+        }
+        runners = [('icontains', scans)]
+        for name, backend in self.strategies():
+            build_time, _ = timed(backend.rebuild)
+            self.stdout.write(f'Built {name} index in {build_time:.2f}s')
+            runners.append((name, {
+                kind: (lambda q, kind=kind, backend=backend: backend.search(kind, q, limit))
+                for kind in search.INDEXED_MODELS
+            }))
+
+        timings = []
+        totals = {}
+        for name, by_kind in runners:
+            means = []
+            for kind, run_query in by_kind.items():
+                for query in QUERIES:
+                    run_query(query)  # warm up caches
+                    samples = []
+                    for _ in range(repeat):
+                        elapsed, hits = timed(run_query, query)
+                        samples.append(elapsed)
+                    summary = summarize(samples)
+                    means.append(summary['mean_ms'])
+                    timings.append({'strategy': name, 'kind': kind, 'query': query, 'hits': len(hits), **summary})
+            totals[name] = sum(means) / len(means)
+        return {'vendor': connection.vendor, 'timings': timings, 'totals': totals}
@@ -0,0 +1,184 @@
+"""
+Management command to benchmark a WebSocket connect storm.
+
+Seeds a throwaway database with signed-in sessions, then opens and closes
+``--connections`` WebSockets, ``--concurrency`` at a time, against a
+consumer that only checks ``scope['user']``, so the numbers measure user
+resolution.  Scenarios:
+
+* legacy:     the former WebSocketMiddleware (session key in the query
+              string, two queries per connect on the shared sync thread)
+* auth-stack: channels' AuthMiddlewareStack on the session cookie, which
+              browsers went through before
+* cold:       WebSocketMiddleware with an empty session-to-user cache
+* warm:       the same again with the cache filled
+
+Every query is delayed by ``--db-latency`` milliseconds to stand in for the
+network round trip to a database server.  Reports connections per second,
+connect latency percentiles and cache hits/misses.
+
+Usage:
+    python manage.py bench_websocket_connect [--users 500] [--connections 5000] [--concurrency 200] [--db-latency 1.0] [--json]
+"""
+
+import asyncio
+import json
+import time
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.middleware import BaseMiddleware
+from channels.routing import URLRouter
+from channels.sessions import CookieMiddleware
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.backends.signals import connection_created
+from django.urls import path
+
+from core.benchmarking import benchmark_database, summarize
+from core.middleware import WebSocketMiddleware
+from core.websocket_auth import session_users
+
+
+class AuthCheckConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        if self.scope['user'].is_authenticated:
+            await self.accept()
+        else:
+            await self.close()
+
+
+class LegacyWebSocketMiddleware(BaseMiddleware):
+    """The middleware as it was before core.websocket_auth, kept as the baseline."""
+
+    async def __call__(self, scope, receive, send):
+        close_old_connections()
+        session_key = scope['query_string'].decode().split('session_key=')[-1].split('&')[0]
+        scope['user'] = await self.get_user_from_session(session_key) or AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+    @database_sync_to_async
+    def get_user_from_session(self, session_key):
+        try:
+            session = Session.objects.get(session_key=session_key)
+            user_id = session.get_decoded().get('_auth_user_id')
+            return User.objects.get(id=user_id)
+        except (Session.DoesNotExist, User.DoesNotExist):
+            return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark WebSocket connects per second with and without the session cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Signed-in sessions (default: 500)')
+        parser.add_argument('--connections', type=int, default=5000, help='Connects per scenario (default: 5000)')
+        parser.add_argument('--concurrency', type=int, default=200, help='Connects in flight (default: 200)')
+        parser.add_argument('--db-latency', type=float, default=1.0, help='Milliseconds added to every query (default: 1.0)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        latency = options['db_latency'] / 1000
+
+        def delay(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            # The wrapper list outlives reconnects of the same connection
+            if delay not in connection.execute_wrappers:
+                connection.execute_wrappers.append(delay)
+
+        with benchmark_database(threads=True):
+            session_keys = self.seed(options['users'])
+            if latency:
+                connection_created.connect(add_latency)
+            try:
+                results = asyncio.run(self.run(session_keys, options))
+            finally:
+                connection_created.disconnect(add_latency)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('\n=== WebSocket connect storm ==='))
+        self.stdout.write(
+            f"{options['connections']} connects over {options['users']} sessions, "
+            f"{options['concurrency']} concurrent, {options['db_latency']}ms per query"
+        )
+        self.stdout.write(
+            f"{'scenario':10} | {'conn/s':>8} | {'p50 ms':>8} {'p99 ms':>8} | {'hits':>6} {'misses':>6}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['scenario']:10} | {row['connections_per_second']:8.0f} | {row['latency']['p50_ms']:8.2f} "
+                f"{row['latency']['p99_ms']:8.2f} | {row.get('hits', '-'):>6} {row.get('misses', '-'):>6}"
+            )
+
+    def seed(self, count):
+        User.objects.bulk_create([User(username=f'socket{number}', password='!') for number in range(count)])
+        session_keys = []
+        for user in User.objects.filter(username__startswith='socket'):
+            store = SessionStore()
+            store[SESSION_KEY] = str(user.pk)
+            store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            store.create()
+            session_keys.append(store.session_key)
+        return session_keys
+
+    async def run(self, session_keys, options):
+        router = URLRouter([path('ws/', AuthCheckConsumer.as_asgi())])
+        scenarios = [
+            ('legacy', LegacyWebSocketMiddleware(router), 'query'),
+            ('auth-stack', AuthMiddlewareStack(router), 'cookie'),
+            ('cold', CookieMiddleware(WebSocketMiddleware(router)), 'cookie'),
+            ('warm', CookieMiddleware(WebSocketMiddleware(router)), 'cookie'),
+        ]
+        session_users.clear()
+        results = []
+        for name, application, transport in scenarios:
+            before = dict(session_users.stats)
+            row = await self.storm(application, transport, session_keys, options)
+            row['scenario'] = name
+            if name in ('cold', 'warm'):
+                row['hits'] = session_users.stats['hits'] - before['hits']
+                row['misses'] = session_users.stats['misses'] - before['misses']
+            results.append(row)
+        return results
+
+    async def storm(self, application, transport, session_keys, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        samples = []
+
+        async def connect(number):
+            session_key = session_keys[number % len(session_keys)]
+            if transport == 'query':
+                communicator = WebsocketCommunicator(application, f'/ws/?session_key={session_key}')
+            else:
+                cookie = f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode()
+                communicator = WebsocketCommunicator(application, '/ws/', headers=[(b'cookie', cookie)])
+            async with semaphore:
+                start = time.perf_counter()
+                connected, _ = await communicator.connect(timeout=60)
+                samples.append(time.perf_counter() - start)
+                await communicator.disconnect()
+            return connected
+
+        start = time.perf_counter()
+        connected = await asyncio.gather(*(connect(number) for number in range(options['connections'])))
+        elapsed = time.perf_counter() - start
+        if not all(connected):
+            raise CommandError(f'{connected.count(False)} connects were refused')
+        return {
+            'connections_per_second': round(len(connected) / elapsed, 1),
+            'latency': summarize(samples),
+        }
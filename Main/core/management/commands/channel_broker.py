@@ -0,0 +1,52 @@
+"""
+Management command to run the channel-layer broker.
+
+Multi-process deployments on a single host point every worker at this
+broker (see core.channel_layers) so notifications published by one worker
+reach WebSockets held by the others, without running Redis.
+
+Usage:
+    python manage.py channel_broker [--socket /run/eventnest/channels.sock]
+    python manage.py channel_broker --port 6380 [--host 127.0.0.1]
+
+Options:
+    --socket:  Listen on this Unix socket (default)
+    --host:    Listen on TCP at this address instead
+    --port:    TCP port; the broker speaks the Redis protocol, so it can
+               also stand in for redis-server during tests
+"""
+
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from core.channel_layers import Broker
+
+
+class Command(BaseCommand):
+    help = 'Run the pub/sub broker used by the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default='/tmp/eventnest-channels.sock',
+            help='Unix socket path (default: /tmp/eventnest-channels.sock)',
+        )
+        parser.add_argument('--host', default='127.0.0.1', help='TCP address (used with --port)')
+        parser.add_argument('--port', type=int, help='Listen on TCP instead of a Unix socket')
+
+    def handle(self, *args, **options):
+        try:
+            asyncio.run(self.serve(options))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, options):
+        broker = Broker()
+        if options['port']:
+            await broker.start(host=options['host'], port=options['port'])
+        else:
+            await broker.start(socket_path=options['socket'])
+        self.stdout.write(self.style.SUCCESS(f'Channel broker listening on {broker.address}'))
+        async with broker.server:
+            await broker.server.serve_forever()
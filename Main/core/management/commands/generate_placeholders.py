@@ -0,0 +1,123 @@
+"""
+Management command to draw placeholder images for services and store items.
+
+Supersedes enhance_images.py, fix_missing_images.py and
+generate_images_complete.py.  A placeholder (see core/imaging.py) is drawn
+for every service and store item that:
+
+* has no image: the new file is named after the row and saved on it;
+* points at a file that does not exist;
+* shows a placeholder this command drew earlier whose inputs (title,
+  category, description, price, size, layout version) have changed since.
+
+Uploaded photos are never overwritten.  The input hash of every placeholder
+drawn is kept in MEDIA_ROOT/placeholders.json, so unchanged placeholders
+are skipped on the next run.  Drawing is spread over a pool of worker
+processes when more than one CPU is available; with one, the pool would
+only add its start-up and pickling cost, so cards are drawn in process.
+
+Usage:
+    python manage.py generate_placeholders [--workers N] [--force] [--dry-run]
+
+Options:
+    --workers:  Worker processes (default: CPUs available to the command)
+    --force:    Redraw every placeholder, changed or not
+    --dry-run:  List what would be drawn without drawing it
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.text import slugify
+
+from core.imaging import PlaceholderSpec, cpu_count, render_to_file, spec_hash
+from core.models import Service, StoreItem
+
+
+class Command(BaseCommand):
+    help = 'Draw placeholder images for catalog rows without a usable image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=cpu_count(), help='Worker processes (default: CPUs)')
+        parser.add_argument('--force', action='store_true', help='Redraw unchanged placeholders too')
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be drawn')
+
+    def handle(self, *args, **options):
+        media_root = Path(settings.MEDIA_ROOT)
+        manifest_path = media_root / 'placeholders.json'
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except (OSError, ValueError):
+            manifest = {}
+
+        rows = [
+            (service, service.title, PlaceholderSpec(
+                service.title, service.category.name, service.description[:100],
+            ), 'services', 'service')
+            for service in Service.objects.select_related('category')
+        ] + [
+            (item, item.name, PlaceholderSpec(
+                item.name, item.category.name, item.description[:100], f'{item.price:.0f}',
+            ), 'store', 'product')
+            for item in StoreItem.objects.select_related('category')
+        ]
+
+        jobs, renamed = [], []
+        for row, label, spec, folder, suffix in rows:
+            name = row.image.name if row.image else ''
+            if not name:
+                name = f'{folder}/{slugify(label)[:80]}-{suffix}-{row.pk}.jpg'
+                row.image.name = name
+                renamed.append(row)
+            elif name.startswith(('http://', 'https://')):
+                continue
+            elif (media_root / name).exists():
+                if name not in manifest:
+                    continue  # an uploaded photo
+                if manifest[name] == spec_hash(spec) and not options['force']:
+                    continue
+            jobs.append((name, spec, str(media_root / name)))
+
+        if options['dry_run']:
+            for name, spec, _ in jobs:
+                self.stdout.write(f'{name}: {spec.title}')
+            self.stdout.write(f'{len(jobs)} placeholders would be drawn')
+            return
+        if not jobs:
+            self.stdout.write('All placeholders are up to date.')
+            return
+
+        workers = max(1, min(options['workers'], len(jobs)))
+        self.stdout.write(f'Drawing {len(jobs)} placeholders with {workers} worker(s)...')
+        started = time.perf_counter()
+        names, specs, paths = zip(*jobs)
+        if workers == 1:
+            hashes = list(map(render_to_file, specs, paths))
+        else:
+            # core.imaging does not need Django, so any start method works
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                hashes = list(pool.map(render_to_file, specs, paths, chunksize=max(1, len(jobs) // (workers * 4))))
+        elapsed = time.perf_counter() - started
+
+        manifest.update(zip(names, hashes))
+        self.write_manifest(manifest_path, manifest)
+        # Saved one by one so that the listing cache and image derivatives follow
+        for row in renamed:
+            row.save(update_fields=['image'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Drew {len(hashes)} placeholders in {elapsed:.1f}s ({len(hashes) / elapsed:.0f} images/s); '
+            f'{len(renamed)} rows got a new image'
+        ))
+
+    def write_manifest(self, path, manifest):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as handle:
+            json.dump(manifest, handle, indent=1, sort_keys=True)
+        os.replace(temporary, path)
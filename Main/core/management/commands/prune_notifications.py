@@ -0,0 +1,80 @@
+"""
+Management command to delete notifications past their retention period.
+
+Each notification type is kept for the days set in core/retention.py
+(DEFAULT_RETENTION_DAYS, overridden by NOTIFICATION_RETENTION_DAYS).  Run
+this command from cron, e.g. nightly; it deletes expired notifications in
+short batches so the pages reading notifications keep running alongside it,
+optionally archiving each batch compressed.
+
+Usage:
+    python manage.py prune_notifications [--dry-run] [--type TYPE ...] [--batch-size 1000] [--archive] [--pause 0]
+
+Options:
+    --dry-run:     Report expired notifications without deleting them
+    --type:        Prune only this notification type; may be repeated
+    --batch-size:  Notifications deleted per transaction
+    --archive:     Copy pruned notifications into NotificationArchive first
+                   (the default when NOTIFICATION_ARCHIVE is set)
+    --pause:       Seconds to sleep between batches
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import retention
+from core.models import Notification
+
+
+class Command(BaseCommand):
+    help = 'Delete notifications older than their retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report expired notifications without deleting them')
+        parser.add_argument(
+            '--type',
+            action='append',
+            choices=[choice for choice, _ in Notification.NOTIFICATION_TYPE_CHOICES],
+            help='Prune only this type (may be repeated)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=retention.batch_size(),
+            help=f'Notifications deleted per transaction (default: {retention.batch_size()})',
+        )
+        parser.add_argument(
+            '--archive',
+            action='store_true',
+            default=getattr(settings, 'NOTIFICATION_ARCHIVE', False),
+            help='Archive pruned notifications, compressed',
+        )
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches (default: 0)')
+
+    def handle(self, *args, **options):
+        cutoffs = retention.cutoffs(types=options['type'])
+        started = time.perf_counter()
+        if options['dry_run']:
+            results = {
+                notification_type: retention.expired(notification_type, cutoff).count()
+                for notification_type, cutoff in cutoffs.items()
+            }
+        else:
+            results = retention.prune(
+                types=options['type'], size=options['batch_size'], archive=options['archive'], pause=options['pause'],
+            )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS('\n=== Notification Retention Summary ==='))
+        days = retention.retention_days()
+        for notification_type, count in results.items():
+            self.stdout.write(f'{notification_type:8} | Kept {days[notification_type]:4} days | Expired: {count:8}')
+        total = sum(results.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('\n⚠️  DRY RUN: No changes were made to the database.'))
+            self.stdout.write('Run without --dry-run to apply changes.')
+        else:
+            archived = ' and archived' if options['archive'] else ''
+            self.stdout.write(f'{total} notifications deleted{archived} in {elapsed:.2f}s')
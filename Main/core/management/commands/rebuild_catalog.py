@@ -0,0 +1,52 @@
+"""
+Management command to rebuild the unified catalog read model.
+
+CatalogEntry rows are kept up to date by signal handlers (see
+core/catalog.py).  Writes that bypass signals (bulk_create, raw SQL,
+restores from backup) leave them stale; this command rewrites the entries
+from the six source tables, upserting ``--batch-size`` rows per statement,
+and deletes entries whose source row is gone.
+
+Usage:
+    python manage.py rebuild_catalog [--kind KIND ...] [--batch-size 1000]
+
+Options:
+    --kind:        Rebuild only these kinds (service, event, photo,
+                   catering, printing, storeitem); may be repeated
+    --batch-size:  Rows read and upserted per batch
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import catalog
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the catalog read model from the service and store tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            action='append',
+            choices=list(catalog.SOURCES),
+            help='Rebuild only this kind (may be repeated)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=catalog.DEFAULT_BATCH_SIZE,
+            help=f'Rows read and upserted per batch (default: {catalog.DEFAULT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        results = catalog.rebuild(options['kind'], batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS('\n=== Catalog Rebuild Summary ==='))
+        for kind, (written, deleted) in results.items():
+            self.stdout.write(f'{kind:10} | Written: {written:7} | Stale deleted: {deleted:6}')
+        total = sum(written for written, _ in results.values())
+        self.stdout.write(f'{total} entries in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s)')
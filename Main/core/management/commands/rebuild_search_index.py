@@ -0,0 +1,51 @@
+"""
+Management command to rebuild the full-text search index.
+
+The search backends are kept up to date by signal handlers (see
+core/search.py), but only the backend in use at the time of a write
+receives it: after switching SEARCH_BACKEND, or after writes that bypass
+signals (bulk_create, raw SQL, restores from backup), the index is stale.
+This command rewrites it from the catalog tables and bumps the search
+index version so that the in-process indexes of running workers reload.
+
+Usage:
+    python manage.py rebuild_search_index [--backend core.search.SQLiteFTS5Backend]
+
+Options:
+    --backend:  Dotted path of the backend to rebuild (default: the
+                configured one, see SEARCH_BACKEND)
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from django.utils.module_loading import import_string
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index from the service and store tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', help='Dotted path of the backend to rebuild (default: the configured one)')
+
+    def handle(self, *args, **options):
+        if options['backend']:
+            try:
+                backend = import_string(options['backend'])()
+            except ImportError as exc:
+                raise CommandError(f"Unknown search backend {options['backend']}: {exc}")
+        else:
+            backend = search.get_backend()
+
+        started = time.perf_counter()
+        try:
+            backend.rebuild()
+        except DatabaseError as exc:
+            raise CommandError(f'Could not rebuild the {type(backend).__name__} index: {exc}')
+        search.index_version.bump()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the {type(backend).__name__} index in {elapsed:.2f}s'))
@@ -0,0 +1,119 @@
+"""
+Management command to reconcile the materialized cart and wishlist counters.
+
+Cart.item_count, Cart.total_quantity and Wishlist.item_count are kept up to
+date by signal handlers.  Writes that bypass signals (raw SQL, bulk
+deletes, restores from backup) can make them drift; this command
+recomputes them from CartItem and the wishlist items relation and fixes
+any row that disagrees.
+
+Usage:
+    python manage.py reconcile_counters [--dry-run] [--verbose] [--batch-size 1000]
+
+Options:
+    --dry-run:     Report drift without changing anything
+    --verbose:     List every drifting row
+    --batch-size:  Rows compared and updated per batch
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from core.models import Cart, CartItem, Wishlist
+
+
+def counted(queryset, aggregate):
+    """Correlated subquery returning ``aggregate`` over ``queryset``, or 0."""
+    return Coalesce(
+        Subquery(queryset.annotate(value=aggregate).values('value'), output_field=IntegerField()),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recompute cart and wishlist counters and fix rows that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without changing anything',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='List every drifting row',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows compared and updated per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.verbose = options['verbose']
+        self.batch_size = options['batch_size']
+
+        lines = CartItem.objects.filter(cart_id=OuterRef('pk')).values('cart_id')
+        carts = Cart.objects.annotate(
+            actual_item_count=counted(lines, Count('pk')),
+            actual_total_quantity=counted(lines, Sum('quantity')),
+        )
+        self.stdout.write(self.style.SUCCESS('Reconciling carts...'))
+        cart_stats = self.reconcile(carts, ['item_count', 'total_quantity'])
+
+        entries = Wishlist.items.through.objects.filter(wishlist_id=OuterRef('pk')).values('wishlist_id')
+        wishlists = Wishlist.objects.annotate(actual_item_count=counted(entries, Count('pk')))
+        self.stdout.write(self.style.SUCCESS('Reconciling wishlists...'))
+        wishlist_stats = self.reconcile(wishlists, ['item_count'])
+
+        self.stdout.write(self.style.SUCCESS('\n=== Counter Reconciliation Summary ==='))
+        for name, stats in (('cart', cart_stats), ('wishlist', wishlist_stats)):
+            self.stdout.write(f"{name:10} | Checked: {stats['checked']:6} | Drifted: {stats['drifted']:6}")
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('\n⚠️  DRY RUN: No changes were made to the database.'))
+            self.stdout.write('Run without --dry-run to apply changes.')
+
+    def reconcile(self, queryset, fields):
+        """Compare stored and recomputed values batch by batch, fixing drift."""
+        stats = {'checked': 0, 'drifted': 0}
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:self.batch_size])
+            if not batch:
+                return stats
+            last_pk = batch[-1].pk
+            stats['checked'] += len(batch)
+
+            drifted = []
+            for obj in batch:
+                stale = {
+                    field: (getattr(obj, field), getattr(obj, f'actual_{field}'))
+                    for field in fields
+                    if getattr(obj, field) != getattr(obj, f'actual_{field}')
+                }
+                if not stale:
+                    continue
+                if self.verbose:
+                    changes = ', '.join(f'{field}: {old} -> {new}' for field, (old, new) in stale.items())
+                    self.stdout.write(f'  {obj._meta.model_name} #{obj.pk}: {changes}')
+                drifted.append(obj)
+
+            stats['drifted'] += len(drifted)
+            if drifted and not self.dry_run:
+                with transaction.atomic():
+                    # Recount under a row lock so concurrent signal updates are not lost
+                    model = queryset.model
+                    locked = {
+                        obj.pk: obj
+                        for obj in queryset.filter(pk__in=[obj.pk for obj in drifted]).select_for_update()
+                    }
+                    for obj in locked.values():
+                        for field in fields:
+                            setattr(obj, field, getattr(obj, f'actual_{field}'))
+                    model.objects.bulk_update(locked.values(), fields)
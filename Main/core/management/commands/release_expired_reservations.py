@@ -0,0 +1,60 @@
+"""
+Management command to return the stock held by expired cart reservations.
+
+Adding an item to a cart reserves its stock for STOCK_RESERVATION_TTL
+seconds (extended whenever the cart is viewed).  Run this command from
+cron every few minutes so abandoned carts give their stock back; the
+cart lines themselves are kept and re-reserved at checkout.
+
+Usage:
+    python manage.py release_expired_reservations [--dry-run] [--batch-size 1000]
+
+Options:
+    --dry-run:     Report expired reservations without releasing them
+    --batch-size:  Reservations released per transaction
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from core.inventory import release_expired
+from core.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = 'Return the stock held by expired cart reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report expired reservations without releasing them',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Reservations released per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = StockReservation.objects.filter(expires_at__lte=now).aggregate(
+            reservations=Count('pk'), units=Sum('quantity'), items=Count('item', distinct=True),
+        )
+
+        if options['dry_run']:
+            released = 0
+        else:
+            released = release_expired(now=now, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS('\n=== Reservation Release Summary ==='))
+        self.stdout.write(f"Expired reservations: {expired['reservations']}")
+        self.stdout.write(f"Units held:           {expired['units'] or 0}")
+        self.stdout.write(f"Store items affected: {expired['items']}")
+        self.stdout.write(f'Released:             {released}')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('\n⚠️  DRY RUN: No changes were made to the database.'))
+            self.stdout.write('Run without --dry-run to apply changes.')
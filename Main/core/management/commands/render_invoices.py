@@ -0,0 +1,85 @@
+"""
+Management command to render PDF invoices in bulk.
+
+Renders the invoice of every order that has no file for its current
+content yet (see core/invoices.py), spreading the orders over a pool of
+worker processes, since rendering is CPU-bound Python and threads would
+share one interpreter lock.  Each worker checks its orders' cached files
+itself, as the cache key needs the order lines.  Useful after deploying a layout change
+(bump ``LAYOUT_VERSION``) or restoring orders from a backup.
+
+Usage:
+    python manage.py render_invoices [--workers N] [--batch-size 100] [--force] [--since 2024-01-01]
+
+Options:
+    --workers:     Worker processes (default: number of CPUs)
+    --batch-size:  Orders handed to a worker at a time
+    --force:       Re-render invoices that are already cached
+    --since:       Only orders updated on or after this date
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.dateparse import parse_date
+
+from core import invoices
+from core.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Render missing PDF invoices in parallel worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: CPUs)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Orders per worker task (default: 100)')
+        parser.add_argument('--force', action='store_true', help='Re-render cached invoices')
+        parser.add_argument('--since', help='Only orders updated on or after this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        if not invoices.AVAILABLE:
+            raise CommandError('reportlab is not installed')
+
+        orders = Order.objects.order_by('pk')
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid date: {options['since']}")
+            orders = orders.filter(updated_at__date__gte=since)
+        pending = list(orders.values_list('pk', flat=True))
+        if not pending:
+            self.stdout.write('There are no orders to render.')
+            return
+
+        size = options['batch_size']
+        batches = [pending[start:start + size] for start in range(0, len(pending), size)]
+        workers = max(1, min(options['workers'], len(batches)))
+        self.stdout.write(f'Checking {len(pending)} invoices with {workers} worker(s)...')
+
+        started = time.perf_counter()
+        rendered = 0
+        if workers == 1:
+            for batch in batches:
+                rendered += invoices.render_orders(batch, force=options['force'])
+        else:
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                raise CommandError('Parallel rendering needs the fork start method; use --workers 1')
+            # Children must open their own database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = [pool.submit(invoices.render_orders, batch, options['force']) for batch in batches]
+                for future in futures:
+                    rendered += future.result()
+        elapsed = time.perf_counter() - started
+
+        if not rendered:
+            self.stdout.write('All invoices are up to date.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} invoices in {elapsed:.1f}s ({rendered / elapsed:.0f}/s)'
+        ))
@@ -0,0 +1,80 @@
+"""
+Management command to send notification broadcasts.
+
+Broadcasts normally run on a background thread of the web process that
+created them (see core/broadcasts.py).  This command is the worker for
+everything else: it sends pending broadcasts (all of them when
+NOTIFICATION_BROADCAST_THREADS is 0), and resumes broadcasts whose process
+died mid-way from their last committed batch.  Run it from cron, or keep
+it running with ``--loop``.
+
+Usage:
+    python manage.py run_broadcasts [--id ID] [--retry-failed] [--batch-size 1000] [--loop] [--interval 5]
+
+Options:
+    --id:            Send only this broadcast (pending, failed or stalled)
+    --retry-failed:  Also resume broadcasts that stopped on an error
+    --batch-size:    Recipients written per INSERT
+    --loop:          Keep polling for broadcasts instead of exiting
+    --interval:      Seconds between polls with --loop
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import broadcasts
+from core.models import Broadcast
+
+
+class Command(BaseCommand):
+    help = 'Send pending notification broadcasts and resume interrupted ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--id', type=int, help='Send only this broadcast')
+        parser.add_argument('--retry-failed', action='store_true', help='Also resume broadcasts that failed')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=broadcasts.batch_size(),
+            help=f'Recipients written per INSERT (default: {broadcasts.batch_size()})',
+        )
+        parser.add_argument('--loop', action='store_true', help='Keep polling for broadcasts')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls (default: 5)')
+
+    def handle(self, *args, **options):
+        while True:
+            if options['id']:
+                ids = [options['id']]
+            else:
+                ids = list(broadcasts.runnable())
+                if options['retry_failed']:
+                    ids += Broadcast.objects.filter(status='failed').order_by('created_at').values_list('pk', flat=True)
+            for broadcast_id in ids:
+                self.send(broadcast_id, options['batch_size'])
+            if not options['loop'] or options['id']:
+                break
+            time.sleep(options['interval'])
+
+    def send(self, broadcast_id, batch_size):
+        started = time.perf_counter()
+        last_report = [started]
+
+        def progress(broadcast):
+            now = time.perf_counter()
+            if now - last_report[0] >= 5:
+                last_report[0] = now
+                self.stdout.write(f'  #{broadcast.pk}: {broadcast.sent}/{broadcast.recipients} sent')
+
+        broadcast = broadcasts.run(broadcast_id, size=batch_size, progress=progress)
+        if broadcast is None:
+            self.stdout.write(self.style.WARNING(f'Broadcast #{broadcast_id} is not runnable or another worker has it'))
+            return
+        elapsed = time.perf_counter() - started
+        style = self.style.SUCCESS if broadcast.status == 'completed' else self.style.ERROR
+        self.stdout.write(style(
+            f'Broadcast #{broadcast.pk} {broadcast.status}: {broadcast.sent}/{broadcast.recipients} sent, '
+            f'{elapsed:.1f}s this run, {broadcast.throughput()} notifications/s overall'
+        ))
+        if broadcast.error:
+            self.stdout.write(f'  Error: {broadcast.error}')
@@ -0,0 +1,225 @@
+"""
+Management command to stress-test stock reservations on one hot store item.
+
+Runs in a throwaway database.  Many threads, each with its own customer and
+cart, repeatedly add the same item to their cart, change or remove the
+line, and check out, while a sweeper thread releases expired reservations
+(the TTL is shortened so expiry and re-reservation at checkout happen
+constantly).  Afterwards the stock is audited:
+
+    stock + reserved units + sold units == initial stock, and stock >= 0
+
+The same load is then replayed with the read-modify-write pattern the
+CartItem/OrderItem handlers used before core.inventory, to show the lost
+updates and overselling it allowed.
+
+Usage:
+    python manage.py stress_inventory [--threads 16] [--operations 200] [--stock 500] [--ttl 0.2] [--json]
+"""
+
+import json
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.models import Sum
+from django.test.utils import override_settings
+
+from core import inventory
+from core.benchmarking import benchmark_database, commit_cart, make_rng, summarize
+from core.models import Cart, CartItem, StockReservation, StoreCategory, StoreItem
+
+
+class Command(BaseCommand):
+    help = 'Hammer one store item from many threads and audit the stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent customers (default: 16)')
+        parser.add_argument('--operations', type=int, default=200, help='Operations per thread (default: 200)')
+        parser.add_argument('--stock', type=int, default=500, help='Initial stock of the hot item (default: 500)')
+        parser.add_argument('--ttl', type=float, default=0.2, help='Reservation TTL in seconds during the run (default: 0.2)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        with benchmark_database(threads=True), override_settings(STOCK_RESERVATION_TTL=options['ttl']):
+            item = self.seed(options['threads'], options['stock'])
+            reservations = self.run_reservations(item, options)
+            legacy = self.run_legacy(item, options)
+
+        results = {'reservations': reservations, 'legacy': legacy}
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results, options)
+        if not reservations['consistent']:
+            raise CommandError('Stock audit failed for the reservation engine')
+
+    def seed(self, threads, stock):
+        category = StoreCategory.objects.create(name='Stress')
+        for number in range(threads):
+            user = User.objects.create_user(f'stress{number}', password='x')
+            Cart.objects.create(user=user)
+        return StoreItem.objects.create(
+            category=category, name='Hot item', description='', price=100,
+            image='store/placeholder.jpg', stock=stock,
+        )
+
+    def run_threads(self, threads, target):
+        """Run ``target(number)`` in ``threads`` threads; return (results, seconds)."""
+        results = [None] * threads
+        barrier = threading.Barrier(threads)
+
+        def worker(number):
+            close_old_connections()
+            try:
+                barrier.wait()
+                results[number] = target(number)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results, time.perf_counter() - start
+
+    def run_reservations(self, item, options):
+        StoreItem.objects.filter(pk=item.pk).update(stock=options['stock'])
+        stop = threading.Event()
+
+        def sweeper():
+            released = 0
+            try:
+                while not stop.is_set():
+                    released += inventory.release_expired()
+                    time.sleep(options['ttl'] / 4)
+            finally:
+                connections.close_all()
+            sweeps.append(released)
+
+        sweeps = []
+        sweep_thread = threading.Thread(target=sweeper)
+        sweep_thread.start()
+
+        def customer(number):
+            rng = make_rng(number)
+            cart = Cart.objects.get(user__username=f'stress{number}')
+            stats = {'sold': 0, 'rejected': 0, 'errors': 0, 'latencies': []}
+            for _ in range(options['operations']):
+                start = time.perf_counter()
+                try:
+                    roll = rng.random()
+                    line = CartItem.objects.filter(cart=cart, item_id=item.pk).first()
+                    if roll < 0.55:
+                        if line is None:
+                            CartItem.objects.create(cart=cart, item_id=item.pk, quantity=rng.randint(1, 3))
+                        else:
+                            line.quantity += rng.randint(1, 3)
+                            line.save()
+                    elif roll < 0.7 and line is not None:
+                        line.quantity = rng.randint(1, 4)
+                        line.save()
+                    elif roll < 0.8 and line is not None:
+                        line.delete()
+                    elif line is not None and line.quantity:
+                        if rng.random() < 0.3:
+                            time.sleep(options['ttl'])  # let the reservation expire first
+                        try:
+                            commit_cart([line])
+                        except inventory.InsufficientStock:
+                            stats['rejected'] += 1
+                        else:
+                            stats['sold'] += line.quantity
+                            CartItem.objects.filter(pk=line.pk).delete()
+                except Exception:
+                    stats['errors'] += 1
+                stats['latencies'].append(time.perf_counter() - start)
+            return stats
+
+        try:
+            per_thread, elapsed = self.run_threads(options['threads'], customer)
+        finally:
+            stop.set()
+            sweep_thread.join()
+
+        stock = StoreItem.objects.values_list('stock', flat=True).get(pk=item.pk)
+        reserved = StockReservation.objects.filter(item_id=item.pk).aggregate(total=Sum('quantity'))['total'] or 0
+        sold = sum(stats['sold'] for stats in per_thread)
+        operations = options['threads'] * options['operations']
+        return {
+            'operations': operations,
+            'ops_per_second': round(operations / elapsed, 1),
+            'latency': summarize([sample for stats in per_thread for sample in stats['latencies']]),
+            'initial_stock': options['stock'],
+            'final_stock': stock,
+            'reserved': reserved,
+            'sold': sold,
+            'rejected_checkouts': sum(stats['rejected'] for stats in per_thread),
+            'expired_released': sum(sweeps),
+            'errors': sum(stats['errors'] for stats in per_thread),
+            'consistent': stock >= 0 and stock + reserved + sold == options['stock'],
+        }
+
+    def run_legacy(self, item, options):
+        """Replay the same demand with read-modify-write stock updates."""
+        StoreItem.objects.filter(pk=item.pk).update(stock=options['stock'])
+
+        def customer(number):
+            rng = make_rng(number)
+            stats = {'taken': 0, 'errors': 0}
+            for _ in range(options['operations']):
+                try:
+                    quantity = rng.randint(1, 3)
+                    hot = StoreItem.objects.get(pk=item.pk)
+                    if hot.stock >= quantity:
+                        hot.stock = max(0, hot.stock - quantity)
+                        hot.save(update_fields=['stock'])
+                        stats['taken'] += quantity
+                except Exception:
+                    stats['errors'] += 1
+            return stats
+
+        per_thread, elapsed = self.run_threads(options['threads'], customer)
+        stock = StoreItem.objects.values_list('stock', flat=True).get(pk=item.pk)
+        taken = sum(stats['taken'] for stats in per_thread)
+        return {
+            'initial_stock': options['stock'],
+            'final_stock': stock,
+            'taken': taken,
+            'lost_updates': stock - (options['stock'] - taken),
+            'oversold': max(0, taken - options['stock']),
+            'errors': sum(stats['errors'] for stats in per_thread),
+        }
+
+    def report(self, results, options):
+        current = results['reservations']
+        legacy = results['legacy']
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== Inventory stress test ({options['threads']} threads x {options['operations']} operations) ==="
+        ))
+        self.stdout.write(
+            f"Throughput: {current['ops_per_second']} ops/s | "
+            f"p50={current['latency']['p50_ms']}ms p99={current['latency']['p99_ms']}ms"
+        )
+        self.stdout.write(
+            f"Stock: {current['initial_stock']} initial = {current['final_stock']} left "
+            f"+ {current['reserved']} reserved + {current['sold']} sold"
+        )
+        self.stdout.write(
+            f"Rejected checkouts: {current['rejected_checkouts']} | "
+            f"Expired reservations released: {current['expired_released']} | Errors: {current['errors']}"
+        )
+        if current['consistent']:
+            self.stdout.write(self.style.SUCCESS('Audit: consistent'))
+        else:
+            self.stdout.write(self.style.ERROR('Audit: INCONSISTENT'))
+
+        self.stdout.write(self.style.SUCCESS('\n=== Legacy read-modify-write ==='))
+        self.stdout.write(
+            f"Taken: {legacy['taken']} | Left: {legacy['final_stock']} | "
+            f"Lost updates: {legacy['lost_updates']} units | Oversold: {legacy['oversold']} units"
+        )
@@ -1,12 +1,30 @@
 import logging
 from channels.middleware import BaseMiddleware
-from channels.db import database_sync_to_async
-from django.contrib.sessions.models import Session
-from django.contrib.auth.models import User, AnonymousUser
-from django.db import close_old_connections
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+
+from .websocket_auth import session_users
 
 logger = logging.getLogger(__name__)
 
+
+class NavigationStatsMiddleware:
+    """Report how many queries the navigation context saved on each page."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        navigation = getattr(request, '_navigation', None)
+        if navigation is not None:
+            navigation.record()
+            if settings.DEBUG:
+                response['X-Navigation-Queries'] = str(navigation.queries)
+                response['X-Navigation-Queries-Saved'] = str(navigation.queries_saved)
+        return response
+
+
 class WebSocketDebugMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
         if scope["type"] == "websocket":
@@ -17,17 +35,19 @@ class WebSocketDebugMiddleware(BaseMiddleware):
         
         return await super().__call__(scope, modified_receive, modified_send)
 
-    async def receive_with_logging(self, receive):
-        message = await receive()
-        if message["type"] == "websocket.connect":
-            logger.info("WebSocket connection initiated")
-        elif message["type"] == "websocket.disconnect":
-            logger.info("WebSocket disconnection initiated")
-        elif message["type"] == "websocket.receive":
-            logger.info("WebSocket message received")
-        return message
-
-    async def send_with_logging(self, send):
+    def receive_with_logging(self, receive):
+        async def wrapped_receive():
+            message = await receive()
+            if message["type"] == "websocket.connect":
+                logger.info("WebSocket connection initiated")
+            elif message["type"] == "websocket.disconnect":
+                logger.info("WebSocket disconnection initiated")
+            elif message["type"] == "websocket.receive":
+                logger.info("WebSocket message received")
+            return message
+        return wrapped_receive
+
+    def send_with_logging(self, send):
         async def wrapped_send(message):
             if message["type"] == "websocket.accept":
                 logger.info("WebSocket connection accepted")
@@ -39,17 +59,25 @@ class WebSocketDebugMiddleware(BaseMiddleware):
         return wrapped_send
 
 class WebSocketMiddleware(BaseMiddleware):
+    """
+    Resolve ``scope['user']`` from the session key.
+
+    The key comes from the ``session_key`` query parameter or, for
+    browsers, the session cookie.  Lookups go through the session-to-user
+    cache in core.websocket_auth, which runs its database work outside the
+    event loop.
+    """
+
     async def __call__(self, scope, receive, send):
         try:
-            # Close old database connections to prevent usage of timed out connections
-            close_old_connections()
-
             # Get session from scope
             session_key = None
             if scope["type"] == "websocket":
                 query_string = scope.get("query_string", b"").decode()
                 if "session_key=" in query_string:
                     session_key = query_string.split("session_key=")[-1].split("&")[0]
+            if not session_key:
+                session_key = scope.get("cookies", {}).get(settings.SESSION_COOKIE_NAME)
 
             if not session_key:
                 logger.warning("No session key found in WebSocket connection")
@@ -61,7 +89,7 @@ class WebSocketMiddleware(BaseMiddleware):
             scope['user'] = user if user else AnonymousUser()
 
             if not user:
-                logger.warning(f"No user found for session key: {session_key}")
+                logger.warning("No user found for WebSocket session")
 
             return await super().__call__(scope, receive, send)
             
@@ -70,15 +98,9 @@ class WebSocketMiddleware(BaseMiddleware):
             scope['user'] = AnonymousUser()
             return await super().__call__(scope, receive, send)
 
-    @database_sync_to_async
-    def get_user_from_session(self, session_key):
+    async def get_user_from_session(self, session_key):
         try:
-            session = Session.objects.get(session_key=session_key)
-            user_id = session.get_decoded().get('_auth_user_id')
-            return User.objects.get(id=user_id)
-        except (Session.DoesNotExist, User.DoesNotExist) as e:
-            logger.error(f"Session/User lookup failed: {str(e)}")
-            return None
+            return await session_users.resolve(session_key)
         except Exception as e:
             logger.error(f"Unexpected error in get_user_from_session: {str(e)}")
-            return None
\ No newline at end of file
+            return None
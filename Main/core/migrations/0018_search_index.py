@@ -0,0 +1,73 @@
+"""
+Create the full-text search structures used by core.search.
+
+On SQLite this is an FTS5 virtual table populated from the existing
+catalog; on MySQL it is a set of FULLTEXT indexes on the catalog tables.
+Other databases use the in-process index and need no schema.
+"""
+
+from django.db import migrations
+
+FTS5_TABLE = 'core_search_index'
+
+MYSQL_FULLTEXT_INDEXES = [
+    ('core_service', 'core_service_title_ft', 'title'),
+    ('core_service', 'core_service_title_description_ft', 'title, description'),
+    ('core_servicecategory', 'core_servicecategory_name_ft', 'name'),
+    ('core_storeitem', 'core_storeitem_name_ft', 'name'),
+    ('core_storeitem', 'core_storeitem_name_description_ft', 'name, description'),
+    ('core_storecategory', 'core_storecategory_name_ft', 'name'),
+]
+
+
+def sqlite_has_fts5(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            if not sqlite_has_fts5(cursor):
+                return
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS5_TABLE} USING fts5('
+                'kind UNINDEXED, object_id UNINDEXED, title, category, description, '
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+            # rowid = pk * 2 + kind code, matching SQLiteFTS5Backend
+            cursor.execute(
+                f'INSERT INTO {FTS5_TABLE} (rowid, kind, object_id, title, category, description) '
+                "SELECT s.id * 2, 'service', s.id, s.title, c.name, s.description "
+                'FROM core_service s JOIN core_servicecategory c ON c.id = s.category_id'
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS5_TABLE} (rowid, kind, object_id, title, category, description) '
+                "SELECT i.id * 2 + 1, 'storeitem', i.id, i.name, c.name, i.description "
+                'FROM core_storeitem i JOIN core_storecategory c ON c.id = i.category_id'
+            )
+        elif connection.vendor == 'mysql':
+            for table, name, columns in MYSQL_FULLTEXT_INDEXES:
+                cursor.execute(f'ALTER TABLE {table} ADD FULLTEXT INDEX {name} ({columns})')
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS5_TABLE}')
+        elif connection.vendor == 'mysql':
+            for table, name, _ in MYSQL_FULLTEXT_INDEXES:
+                cursor.execute(f'ALTER TABLE {table} DROP INDEX {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_add_notification_model'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
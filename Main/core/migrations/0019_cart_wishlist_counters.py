@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:43
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Cart = apps.get_model('core', 'Cart')
+    CartItem = apps.get_model('core', 'CartItem')
+    Wishlist = apps.get_model('core', 'Wishlist')
+    lines = CartItem.objects.filter(cart_id=OuterRef('pk')).values('cart_id')
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(lines.annotate(n=Count('pk')).values('n')), 0),
+        total_quantity=Coalesce(Subquery(lines.annotate(n=Sum('quantity')).values('n')), 0),
+    )
+    entries = Wishlist.items.through.objects.filter(wishlist_id=OuterRef('pk')).values('wishlist_id')
+    Wishlist.objects.update(
+        item_count=Coalesce(Subquery(entries.annotate(n=Count('pk')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of cart lines'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, help_text='Sum of cart line quantities'),
+        ),
+        migrations.AddField(
+            model_name='wishlist',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='service_type',
+            field=models.CharField(choices=[('service', 'Service'), ('event', 'Event Management'), ('photo', 'Photography'), ('catering', 'Catering'), ('printing', 'Printing Service')], max_length=20),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
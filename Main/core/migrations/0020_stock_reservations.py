@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:46
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def reserve_existing_lines(apps, schema_editor):
+    """Existing cart lines already took their stock; record it as reserved."""
+    CartItem = apps.get_model('core', 'CartItem')
+    StockReservation = apps.get_model('core', 'StockReservation')
+    expires_at = timezone.now() + timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 30 * 60))
+    lines = CartItem.objects.filter(quantity__gt=0).values_list('pk', 'cart_id', 'item_id', 'quantity')
+    StockReservation.objects.bulk_create(
+        (
+            StockReservation(cart_item_id=pk, cart_id=cart_id, item_id=item_id, quantity=quantity, expires_at=expires_at)
+            for pk, cart_id, item_id, quantity in lines.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_cart_wishlist_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.cart')),
+                ('cart_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation', to='core.cartitem')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.storeitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'expires_at'], name='core_stockr_item_id_7ca658_idx')],
+            },
+        ),
+        migrations.RunPython(reserve_existing_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_order_checkout_token'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['created_at', 'id'], name='core_servic_created_c89f53_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['price', 'id'], name='core_servic_price_e65cda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='core_servic_categor_ef5f96_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['category', 'price', 'id'], name='core_servic_categor_ca6fd8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storeitem',
+            index=models.Index(fields=['created_at', 'id'], name='core_storei_created_bd69d9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storeitem',
+            index=models.Index(fields=['price', 'id'], name='core_storei_price_312cc0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storeitem',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='core_storei_categor_237aaf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storeitem',
+            index=models.Index(fields=['category', 'price', 'id'], name='core_storei_categor_2d39c4_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+# (kind, model, title field, category, facet fields), as in core.catalog.SOURCES
+SOURCES = [
+    ('service', 'Service', 'title', 'category__name', ()),
+    ('event', 'EventManagement', 'title', 'event_type', ('capacity', 'duration', 'includes_decoration', 'includes_catering')),
+    ('photo', 'Photography', 'title', 'shoot_type', ('duration', 'includes_editing', 'number_of_photos', 'includes_prints')),
+    ('catering', 'Catering', 'title', 'cuisine_type', ('min_order_quantity', 'includes_serving_staff', 'includes_setup')),
+    ('printing', 'PrintingService', 'title', 'print_type', ('paper_type', 'min_order_quantity', 'includes_design', 'delivery_time')),
+    ('storeitem', 'StoreItem', 'name', 'category__name', ()),
+]
+
+
+def backfill_catalog(apps, schema_editor):
+    CatalogEntry = apps.get_model('core', 'CatalogEntry')
+    for kind, model_name, title_field, category_field, facet_fields in SOURCES:
+        model = apps.get_model('core', model_name)
+        has_category = category_field.endswith('__name')
+        columns = ['pk', title_field, 'price', 'image', 'created_at', category_field]
+        if has_category:
+            columns.append('category_id')
+        rows = model.objects.order_by('pk').values_list(*columns, *facet_fields).iterator(chunk_size=1000)
+        batch = []
+        for row in rows:
+            facets = row[len(columns):]
+            batch.append(CatalogEntry(
+                kind=kind, object_id=row[0], title=row[1], price=row[2], image=row[3] or '',
+                created_at=row[4], category=row[5] or '', category_id=row[6] if has_category else None,
+                facets=dict(zip(facet_fields, facets)),
+            ))
+            if len(batch) == 1000:
+                CatalogEntry.objects.bulk_create(batch)
+                batch = []
+        CatalogEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('service', 'Service'), ('event', 'Event Management'), ('photo', 'Photography'), ('catering', 'Catering'), ('printing', 'Printing Service'), ('storeitem', 'Store Item')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('image', models.ImageField(blank=True, max_length=255, upload_to='')),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('category_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('facets', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Catalog entries',
+                'indexes': [models.Index(fields=['kind', 'price', 'id'], name='core_catalo_kind_d5659a_idx'), models.Index(fields=['kind', 'created_at', 'id'], name='core_catalo_kind_d0bdb0_idx'), models.Index(fields=['price', 'id'], name='core_catalo_price_5a02fb_idx'), models.Index(fields=['created_at', 'id'], name='core_catalo_created_ffc9a8_idx'), models.Index(fields=['title'], name='core_catalo_title_e75e37_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_catalog_entry')],
+            },
+        ),
+        migrations.RunPython(backfill_catalog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Substr
+
+SOURCES = {
+    'service': 'Service',
+    'event': 'EventManagement',
+    'photo': 'Photography',
+    'catering': 'Catering',
+    'printing': 'PrintingService',
+    'storeitem': 'StoreItem',
+}
+
+
+def backfill_summaries(apps, schema_editor):
+    CatalogEntry = apps.get_model('core', 'CatalogEntry')
+    for kind, model_name in SOURCES.items():
+        model = apps.get_model('core', model_name)
+        description = model.objects.filter(pk=OuterRef('object_id')).values('description')
+        CatalogEntry.objects.filter(kind=kind).update(summary=Substr(Subquery(description), 1, 300))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_catalog_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogentry',
+            name='summary',
+            field=models.CharField(blank=True, max_length=300),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:06
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Least
+
+
+def backfill_durations(apps, schema_editor):
+    # Event and photography packages state their length in hours; bookings
+    # of the other services keep the default
+    Booking = apps.get_model('core', 'Booking')
+    for service_type, model_name in (('event', 'EventManagement'), ('photo', 'Photography')):
+        hours = apps.get_model('core', model_name).objects.filter(pk=OuterRef('service_id')).values('duration')
+        Booking.objects.filter(service_type=service_type).update(
+            duration_minutes=Coalesce(Least(Subquery(hours) * 60, Value(24 * 60)), Value(120)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_catalog_entry_summary'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='core_bookin_service_c5dd06_idx',
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=120),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['service_type', 'service_id', 'date'], name='core_bookin_service_e4bece_idx'),
+        ),
+        migrations.RunPython(backfill_durations, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_save, post_delete
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.query import ModelIterable
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 
@@ -50,6 +53,11 @@ class Service(models.Model):
         indexes = [
             models.Index(fields=['title']),
             models.Index(fields=['price']),
+            # Keyset pagination of the listings (core/listings.py)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['category', 'created_at', 'id']),
+            models.Index(fields=['category', 'price', 'id']),
         ]
 
 class EventManagement(models.Model):
@@ -157,10 +165,60 @@ class StoreItem(models.Model):
         indexes = [
             models.Index(fields=['name']),
             models.Index(fields=['price']),
+            # Keyset pagination of the listings (core/listings.py)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['category', 'created_at', 'id']),
+            models.Index(fields=['category', 'price', 'id']),
+        ]
+
+class CatalogEntry(models.Model):
+    """One row per sellable service or store item, maintained by core.catalog"""
+    KIND_CHOICES = [
+        ('service', 'Service'),
+        ('event', 'Event Management'),
+        ('photo', 'Photography'),
+        ('catering', 'Catering'),
+        ('printing', 'Printing Service'),
+        ('storeitem', 'Store Item'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=200)
+    # Start of the source description, for listing cards
+    summary = models.CharField(max_length=300, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Name of the source row's image; nothing is ever uploaded through this field
+    image = models.ImageField(max_length=255, blank=True)
+    # Category name for services and store items, the event/shoot/cuisine/print type otherwise
+    category = models.CharField(max_length=100, blank=True)
+    category_id = models.PositiveIntegerField(null=True, blank=True)
+    facets = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
+
+    class Meta:
+        verbose_name_plural = "Catalog entries"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_catalog_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'price', 'id']),
+            models.Index(fields=['kind', 'created_at', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['title']),
         ]
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
+    # Materialized from CartItem by the signal handlers below
+    item_count = models.PositiveIntegerField(default=0, help_text="Number of cart lines")
+    total_quantity = models.PositiveIntegerField(default=0, help_text="Sum of cart line quantities")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -175,44 +233,82 @@ class CartItem(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
-        # Ensure quantity doesn't exceed stock
-        if self.quantity > self.item.stock:
-            self.quantity = self.item.stock
-        super().save(*args, **kwargs)
+        # Keep the row, its stock reservation and the cart counters in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored quantity so pre_save need not re-read the row
+        instance._stored_quantity = instance.__dict__.get('quantity')
+        return instance
 
     def get_total(self):
         return self.item.price * self.quantity
 
 @receiver(pre_save, sender=CartItem)
 def cart_item_pre_save(sender, instance, **kwargs):
-    """Ensure cart item quantity doesn't exceed available stock and update stock"""
-    try:
-        if instance.pk:  # If updating existing item
-            old_item = CartItem.objects.get(pk=instance.pk)
-            old_quantity = old_item.quantity
-            quantity_diff = instance.quantity - old_quantity
-            
-            if quantity_diff > 0 and quantity_diff > instance.item.stock:
-                instance.quantity = old_quantity + instance.item.stock
-            
-            # Update stock
-            instance.item.stock = max(0, instance.item.stock - quantity_diff)
-            instance.item.save()
-        else:  # If creating new item
-            if instance.quantity > instance.item.stock:
-                instance.quantity = instance.item.stock
-            
-            # Update stock
-            instance.item.stock = max(0, instance.item.stock - instance.quantity)
-            instance.item.save()
-    except CartItem.DoesNotExist:
-        pass
+    """Reserve stock for the cart line (clamping its quantity) and update cart counters"""
+    from .inventory import reserve_for_cart_item
+
+    old_quantity = None
+    if instance.pk:
+        old_quantity = getattr(instance, '_stored_quantity', None)
+        if old_quantity is None:
+            old_quantity = CartItem.objects.filter(pk=instance.pk).values_list('quantity', flat=True).first()
+
+    reserve_for_cart_item(instance)
+
+    if old_quantity is not None:  # If updating existing item
+        Cart.objects.filter(pk=instance.cart_id).update(
+            total_quantity=Greatest(F('total_quantity') + (instance.quantity - old_quantity), 0)
+        )
+    else:  # If creating new item
+        Cart.objects.filter(pk=instance.cart_id).update(
+            item_count=F('item_count') + 1,
+            total_quantity=F('total_quantity') + instance.quantity,
+        )
+
+@receiver(post_save, sender=CartItem)
+def cart_item_post_save(sender, instance, **kwargs):
+    """Record the reservation made in pre_save against the saved cart line"""
+    from .inventory import hold_for_cart_item
+
+    hold_for_cart_item(instance)
+    instance._stored_quantity = instance.quantity
+
+@receiver(pre_delete, sender=CartItem)
+def cart_item_pre_delete(sender, instance, **kwargs):
+    """Return reserved stock; runs before the cascade removes the reservation"""
+    from .inventory import release_cart_item
+
+    release_cart_item(instance)
 
 @receiver(post_delete, sender=CartItem)
 def cart_item_post_delete(sender, instance, **kwargs):
-    """Return stock when cart item is deleted"""
-    instance.item.stock += instance.quantity
-    instance.item.save()
+    """Update cart counters when cart item is deleted"""
+    Cart.objects.filter(pk=instance.cart_id).update(
+        item_count=Greatest(F('item_count') - 1, 0),
+        total_quantity=Greatest(F('total_quantity') - instance.quantity, 0),
+    )
+
+class StockReservation(models.Model):
+    """Stock held for a cart line until checkout or until it expires (see core.inventory)"""
+    cart_item = models.OneToOneField(CartItem, on_delete=models.CASCADE, related_name='reservation')
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    item = models.ForeignKey(StoreItem, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.item_id} for cart #{self.cart_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'expires_at']),
+        ]
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -228,6 +324,8 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     shipping_address = models.TextField()
+    # Client-supplied token that makes a resubmitted checkout return the same order
+    checkout_token = models.CharField(max_length=64, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -237,31 +335,36 @@ class Order(models.Model):
         
         if is_new and self.status == 'cancelled':
             # Return stock for cancelled orders
-            for order_item in self.order_items.all():
-                order_item.item.stock += order_item.quantity
-                order_item.item.save()
+            from .inventory import release_many
+
+            quantities = {}
+            for item_id, quantity in self.order_items.values_list('item_id', 'quantity'):
+                quantities[item_id] = quantities.get(item_id, 0) + quantity
+            release_many(quantities)
 
     def __str__(self):
         return f"Order #{self.id} by {self.user.username}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'checkout_token'], name='unique_order_checkout_token'),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items')
     item = models.ForeignKey(StoreItem, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at time of purchase
     
-    def save(self, *args, **kwargs):
-        if self.pk is None:  # Only for new items
-            # Update stock when order item is created
-            self.item.stock = max(0, self.item.stock - self.quantity)
-            self.item.save()
-        super().save(*args, **kwargs)
-    
+    # Stock is taken when the order is placed (core.checkout.place_order),
+    # so creating an order item does not decrement it a second time
     def delete(self, *args, **kwargs):
         # Return stock when order item is deleted
-        self.item.stock += self.quantity
-        self.item.save()
-        super().delete(*args, **kwargs)
+        from .inventory import release
+
+        with transaction.atomic():
+            super().delete(*args, **kwargs)
+            release(self.item_id, self.quantity)
     
     def get_total(self):
         return self.price * self.quantity
@@ -269,11 +372,120 @@ class OrderItem(models.Model):
 class Wishlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     items = models.ManyToManyField(StoreItem, related_name='wishlists')
+    # Materialized from the items relation by the signal handlers below
+    item_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.user.username}'s Wishlist"
 
+    @classmethod
+    def recount(cls, wishlist_ids):
+        """Recompute item_count for the given wishlists in a single UPDATE"""
+        if not wishlist_ids:
+            return
+        counts = (
+            cls.items.through.objects
+            .filter(wishlist_id=OuterRef('pk'))
+            .values('wishlist_id')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        cls.objects.filter(pk__in=wishlist_ids).update(item_count=Coalesce(Subquery(counts), 0))
+
+@receiver(m2m_changed, sender=Wishlist.items.through)
+def wishlist_items_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Wishlist.item_count in step with the items relation"""
+    if reverse and action == 'pre_clear':
+        # Clearing from the StoreItem side: remember which wishlists are affected
+        instance._cleared_wishlist_ids = list(instance.wishlists.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            Wishlist.recount([instance.pk])
+        elif action == 'post_clear':
+            Wishlist.recount(getattr(instance, '_cleared_wishlist_ids', []))
+        else:
+            Wishlist.recount(pk_set)
+
+@receiver(pre_delete, sender=StoreItem)
+def store_item_pre_delete(sender, instance, **kwargs):
+    """Remember the wishlists holding an item; the cascade bypasses m2m_changed"""
+    instance._wishlist_ids = list(instance.wishlists.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=StoreItem)
+def store_item_post_delete(sender, instance, **kwargs):
+    Wishlist.recount(getattr(instance, '_wishlist_ids', []))
+
+class BookingTargets:
+    """Registry mapping Booking.service_type to the model of the booked service"""
+
+    def __init__(self):
+        self._models = {}
+
+    def register(self, service_type, model):
+        self._models[service_type] = model
+
+    def model_for(self, service_type):
+        return self._models.get(service_type)
+
+    def get(self, service_type, service_id):
+        return self.get_many([(service_type, service_id)]).get((service_type, service_id))
+
+    def get_many(self, pairs):
+        """
+        ``{(service_type, service_id): service}`` read from the catalog
+        entries in one query (core.catalog.lookup).  Services without an
+        entry, which ``rebuild_catalog`` has not caught up with or which
+        were deleted, are looked up in their own tables.
+        """
+        from .catalog import lookup
+        pairs = {(service_type, service_id) for service_type, service_id in pairs if self.model_for(service_type)}
+        services = lookup(pairs)
+        ids_by_type = {}
+        for service_type, service_id in pairs.difference(services):
+            ids_by_type.setdefault(service_type, set()).add(service_id)
+        for service_type, ids in ids_by_type.items():
+            for pk, service in self.model_for(service_type).objects.in_bulk(ids).items():
+                services[service_type, pk] = service
+        return services
+
+    def attach(self, bookings):
+        """Resolve the service of every booking with one catalog query"""
+        services = self.get_many((booking.service_type, booking.service_id) for booking in bookings)
+        for booking in bookings:
+            booking._service_cache = services.get((booking.service_type, booking.service_id))
+        return bookings
+
+
+booking_targets = BookingTargets()
+booking_targets.register('service', Service)
+booking_targets.register('event', EventManagement)
+booking_targets.register('photo', Photography)
+booking_targets.register('catering', Catering)
+booking_targets.register('printing', PrintingService)
+
+
+class BookingQuerySet(models.QuerySet):
+    _with_services = False
+
+    def with_services(self):
+        """Attach each booking's service when the queryset is evaluated"""
+        clone = self._chain()
+        clone._with_services = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_services = self._with_services
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if self._with_services and not fetched and self._iterable_class is ModelIterable:
+            booking_targets.attach(self._result_cache)
+
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -295,16 +507,21 @@ class Booking(models.Model):
     service_id = models.PositiveIntegerField()
     date = models.DateField()
     time_slot = models.TimeField()
+    # Minutes the service is occupied from time_slot (see core/availability.py)
+    duration_minutes = models.PositiveIntegerField(default=120)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     requirements = models.TextField(blank=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BookingQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['service_type', 'service_id']),
+            # Availability reads one service's bookings over a date range
+            models.Index(fields=['service_type', 'service_id', 'date']),
             models.Index(fields=['user', '-created_at']),
         ]
     
@@ -312,22 +529,10 @@ class Booking(models.Model):
         return f"{self.get_service_type_display()} booking by {self.user.username}"
 
     def get_service(self):
-        try:
-            if self.service_type == 'service':
-                return Service.objects.get(id=self.service_id)
-            elif self.service_type == 'event':
-                return EventManagement.objects.get(id=self.service_id)
-            elif self.service_type == 'photo':
-                return Photography.objects.get(id=self.service_id)
-            elif self.service_type == 'catering':
-                return Catering.objects.get(id=self.service_id)
-            elif self.service_type == 'printing':
-                return PrintingService.objects.get(id=self.service_id)
-        except (Service.DoesNotExist, EventManagement.DoesNotExist, 
-                Photography.DoesNotExist, Catering.DoesNotExist, 
-                PrintingService.DoesNotExist):
-            return None
-        return None
+        # Set for every booking fetched with Booking.objects.with_services()
+        if not hasattr(self, '_service_cache'):
+            self._service_cache = booking_targets.get(self.service_type, self.service_id)
+        return self._service_cache
 
 
 class Notification(models.Model):
@@ -352,12 +557,83 @@ class Notification(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', '-created_at']),
-            models.Index(fields=['is_read']),
+            # Unread counts; is_read alone matches most of the table
+            models.Index(fields=['user', 'is_read']),
+            # Retention sweeps (core/retention.py)
+            models.Index(fields=['notification_type', 'created_at']),
         ]
     
     def __str__(self):
         return f"{self.title} - {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save handler in core.notifications publish read/unread changes
+        instance._stored_is_read = instance.__dict__.get('is_read')
+        return instance
+
+
+class NotificationArchive(models.Model):
+    """Notifications removed by the retention sweep, one compressed batch per row (see core/retention.py)"""
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPE_CHOICES)
+    count = models.PositiveIntegerField()
+    oldest = models.DateTimeField()
+    newest = models.DateTimeField()
+    # zlib-compressed JSON list of the notifications' fields
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-archived_at']
+        indexes = [
+            models.Index(fields=['notification_type', 'oldest']),
+        ]
+
+    def __str__(self):
+        return f"{self.count} {self.get_notification_type_display()} notifications up to {self.newest:%Y-%m-%d}"
+
+
+class Broadcast(models.Model):
+    """A notification sent to every active user, in batches (see core/broadcasts.py)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPE_CHOICES, default='promo')
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    link = models.CharField(max_length=255, blank=True, null=True, help_text="Optional link to related page")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Users are notified in id order: everyone up to last_user_id has been
+    last_user_id = models.PositiveIntegerField(default=0)
+    recipients = models.PositiveIntegerField(default=0, help_text="Active users when the broadcast (re)started")
+    sent = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='broadcasts')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by every batch; a running broadcast whose heartbeat is older
+    # than NOTIFICATION_BROADCAST_LEASE has lost its worker
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title} ({self.get_status_display()})"
+
+    def throughput(self):
+        """Notifications written per second so far"""
+        if not self.started_at or not self.sent:
+            return 0
+        elapsed = ((self.finished_at or self.heartbeat_at or self.started_at) - self.started_at).total_seconds()
+        return round(self.sent / elapsed) if elapsed > 0 else 0
+
 
 class Contact(models.Model):
     """Model to store contact inquiries from users"""
@@ -0,0 +1,162 @@
+"""
+Navigation context shared by every rendered page.
+
+The navbar needs the service and store category lists plus the cart and
+wishlist badge counts.  Category lists change rarely, so they are held in
+a process-wide cache that category save/delete signals invalidate.  Badge
+counts are per user; they are wrapped in lazy objects and only queried if
+a template actually renders them, at most once per request (the context
+processor and the ``cart_item_count`` tag share the same
+``NavigationContext`` attached to the request).
+
+Each page is compared against what the four former context processors
+issued (two category queries, plus two cart and two wishlist queries for
+signed-in users); ``NavigationStatsMiddleware`` reports the difference.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+
+from .models import Cart, ServiceCategory, StoreCategory, Wishlist
+from .versioning import VersionStamp
+
+logger = logging.getLogger(__name__)
+
+# Queries the former per-page context processors issued
+LEGACY_CATEGORY_QUERIES = 2
+LEGACY_BADGE_QUERIES = {'cart': 2, 'wishlist': 2}
+
+
+class CategoryCache:
+    """Process-wide cache of the service and store category lists."""
+
+    def __init__(self):
+        self.version = VersionStamp('navigation-categories')
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, model):
+        """Return (categories, queried) for ``model``."""
+        version = self.version.current()
+        entry = self._entries.get(model)
+        if entry is not None and entry[0] == version:
+            return entry[1], False
+        categories = tuple(model.objects.all())
+        with self._lock:
+            self._entries[model] = (version, categories)
+        return categories, True
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+        self.version.bump()
+
+
+categories_cache = CategoryCache()
+
+# Totals for this process, exposed for monitoring
+stats = {'pages': 0, 'queries': 0, 'queries_saved': 0}
+_stats_lock = threading.Lock()
+
+
+class NavigationContext:
+    """Per-request navigation data, computed on first access."""
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.legacy_queries = LEGACY_CATEGORY_QUERIES
+        if request.user.is_authenticated:
+            self.legacy_queries += sum(LEGACY_BADGE_QUERIES.values())
+        self._cache = {}
+
+    @classmethod
+    def for_request(cls, request):
+        navigation = getattr(request, '_navigation', None)
+        if navigation is None:
+            navigation = request._navigation = cls(request)
+        return navigation
+
+    def _memoize(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _categories(self, model):
+        categories, queried = categories_cache.get(model)
+        if queried:
+            self.queries += 1
+        return categories
+
+    @property
+    def service_categories(self):
+        return self._memoize('service_categories', lambda: self._categories(ServiceCategory))
+
+    @property
+    def store_categories(self):
+        return self._memoize('store_categories', lambda: self._categories(StoreCategory))
+
+    def _count_cart(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return 0
+        self.queries += 1
+        # Materialized counter: a unique-key read instead of an aggregate over CartItem
+        total = Cart.objects.filter(user=user).values_list('total_quantity', flat=True).first()
+        return total or 0
+
+    def _count_wishlist(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return 0
+        self.queries += 1
+        total = Wishlist.objects.filter(user=user).aggregate(total=Sum('item_count'))['total']
+        return total or 0
+
+    @property
+    def cart_count(self):
+        return self._memoize('cart_count', self._count_cart)
+
+    @property
+    def wishlist_count(self):
+        return self._memoize('wishlist_count', self._count_wishlist)
+
+    def template_context(self):
+        return {
+            'service_categories': SimpleLazyObject(lambda: self.service_categories),
+            'store_categories': SimpleLazyObject(lambda: self.store_categories),
+            'cart_count': SimpleLazyObject(lambda: self.cart_count),
+            'wishlist_count': SimpleLazyObject(lambda: self.wishlist_count),
+        }
+
+    @property
+    def queries_saved(self):
+        return self.legacy_queries - self.queries
+
+    def record(self):
+        """Add this page to the process totals."""
+        with _stats_lock:
+            stats['pages'] += 1
+            stats['queries'] += self.queries
+            stats['queries_saved'] += self.queries_saved
+        if settings.DEBUG:
+            logger.debug(
+                'Navigation for %s: %d queries, %d saved',
+                self.request.path, self.queries, self.queries_saved,
+            )
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_save, sender=StoreCategory)
+@receiver(post_delete, sender=ServiceCategory)
+@receiver(post_delete, sender=StoreCategory)
+def invalidate_category_cache(sender, **kwargs):
+    """Category lists are cached process-wide; drop them once the change commits."""
+    transaction.on_commit(categories_cache.invalidate)
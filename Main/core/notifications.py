@@ -0,0 +1,163 @@
+"""
+Server push for the navbar notification badge.
+
+Every signed-in page holds one connection to the server: a WebSocket
+(``core.consumers.NotificationConsumer``) or, where WebSockets are not
+available, a Server-Sent Events stream (``notification_stream`` view).
+Both join the user's channel-layer group.  Both need the ASGI server: under
+WSGI the stream view answers 204 and the page polls /api/notifications/
+once a minute instead.  On connect the client receives
+the absolute unread count once; after that it only receives deltas:
+
+    {"type": "unread_count", "count": 4}
+    {"type": "unread_delta", "delta": 1, "notification": {...}}
+    {"type": "unread_delta", "delta": -1}
+
+Deltas are published from the Notification post_save/post_delete handlers
+below after the transaction commits.  Bulk updates bypass those handlers,
+so code that marks notifications read in bulk publishes the new absolute
+count with ``publish_unread_count``, and code that creates them with
+bulk_create (core.broadcasts) or deletes them in bulk (core.retention)
+publishes their deltas with ``publish_created`` or ``publish_deltas``.
+"""
+
+import asyncio
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Seconds between SSE keep-alive comments, so proxies keep the stream open
+STREAM_HEARTBEAT = 20
+
+
+def group_name(user_id):
+    return f'notifications.user.{user_id}'
+
+
+def serialize(notification):
+    """Dictionary sent to the navbar dropdown for one notification."""
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message[:100] + '...' if len(notification.message) > 100 else notification.message,
+        'type': notification.notification_type,
+        'link': notification.link or '',
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.strftime('%d %b %Y, %I:%M %p'),
+    }
+
+
+def unread_count(user_id):
+    return Notification.objects.filter(user_id=user_id, is_read=False).count()
+
+
+async def unread_count_async(user_id):
+    return await database_sync_to_async(unread_count)(user_id)
+
+
+def _send(user_id, payload):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(group_name(user_id), {'type': 'notification.event', 'payload': payload})
+    except Exception:
+        # Delivery is best effort; clients resynchronise on reconnect
+        logger.exception('Could not publish notification event for user %s', user_id)
+
+
+def publish(user_id, payload):
+    """Send ``payload`` to every open connection of the user once the transaction commits."""
+    transaction.on_commit(lambda: _send(user_id, payload))
+
+
+def publish_created(notifications):
+    """
+    Publish the deltas of notifications written with bulk_create, which
+    skips post_save, with one trip into the event loop for all of them.
+    """
+    events = [
+        (notification.user_id, {'type': 'unread_delta', 'delta': 1, 'notification': serialize(notification)})
+        for notification in notifications if not notification.is_read
+    ]
+    if events:
+        transaction.on_commit(lambda: _send_many(events))
+
+
+def publish_deltas(deltas):
+    """Publish unread-count changes made in bulk, ``{user_id: delta}``, like ``publish_created``."""
+    events = [(user_id, {'type': 'unread_delta', 'delta': delta}) for user_id, delta in deltas.items() if delta]
+    if events:
+        transaction.on_commit(lambda: _send_many(events))
+
+
+def _send_many(events):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+
+    async def send_all():
+        for user_id, payload in events:
+            try:
+                await layer.group_send(group_name(user_id), {'type': 'notification.event', 'payload': payload})
+            except Exception:
+                logger.exception('Could not publish notification event for user %s', user_id)
+
+    async_to_sync(send_all)()
+
+
+def publish_unread_count(user_id, count=None):
+    if count is None:
+        count = unread_count(user_id)
+    publish(user_id, {'type': 'unread_count', 'count': count})
+
+
+async def stream_events(user_id):
+    """Async generator of SSE frames for ``user_id`` (the WebSocket fallback)."""
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    group = group_name(user_id)
+    await layer.group_add(group, channel)
+    try:
+        count = await unread_count_async(user_id)
+        yield f"data: {json.dumps({'type': 'unread_count', 'count': count})}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(layer.receive(channel), STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield f"data: {json.dumps(message['payload'])}\n\n"
+    finally:
+        await layer.group_discard(group, channel)
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    """Publish the unread-count change of a created or (un)read notification."""
+    stored = getattr(instance, '_stored_is_read', None)
+    instance._stored_is_read = instance.is_read
+    if created:
+        if not instance.is_read:
+            publish(instance.user_id, {'type': 'unread_delta', 'delta': 1, 'notification': serialize(instance)})
+    elif stored is None:
+        # Saved without being loaded first: the change is unknown, send the total
+        publish_unread_count(instance.user_id)
+    elif stored != instance.is_read:
+        publish(instance.user_id, {'type': 'unread_delta', 'delta': -1 if instance.is_read else 1})
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        publish(instance.user_id, {'type': 'unread_delta', 'delta': -1})
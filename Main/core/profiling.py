@@ -0,0 +1,244 @@
+"""
+SQL profiling for requests and tests.
+
+``QueryProfile`` records every query run on any database connection of the
+current thread while it is active.  It hooks ``execute_wrapper``, so it
+works without DEBUG.  For each query it keeps the SQL, the time taken and
+where the query came from:
+
+* the innermost template node being rendered (``template.html:LINE``), for
+  queries triggered by a template, e.g. ``{{ service }}`` calling
+  ``Service.__str__``, which reads ``service.category``;
+* the innermost line of project code (``core/views.py:LINE``).
+
+From these it derives:
+
+* duplicates: the same SQL with the same parameters run more than once;
+* N+1 patterns: the same statement shape (its fingerprint, with literals
+  and IN lists collapsed) run at least ``SQL_N_PLUS_ONE_THRESHOLD`` times
+  from one origin, which is what a per-row lookup inside a loop looks like.
+
+``QueryProfilingMiddleware`` profiles every request while ``SQL_PROFILING``
+is on.  It keeps per-view totals in process (``view_stats``, exposed to
+staff by the ``api_sql_profile`` view) and logs requests that show N+1
+patterns or exceed their query budget.  ``SQL_QUERY_BUDGETS`` maps URL
+names to the most queries a request may run.  In DEBUG it adds
+``X-DB-Queries`` and ``X-DB-Time`` headers.  With ``SQL_PROFILING_STRICT``
+a request over budget raises ``QueryBudgetExceeded``, which the test client
+re-raises, so the test fails.
+
+In tests, ``assert_queries`` checks a block directly::
+
+    with assert_queries(budget=5):
+        self.client.get(reverse('store'))
+"""
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+Query = namedtuple('Query', ['sql', 'params', 'seconds', 'fingerprint', 'template', 'code'])
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """``sql`` with its literal values replaced, so that per-row variants match."""
+    sql = _STRING.sub('?', sql).replace('%s', '?')
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', _IN_LIST.sub('IN (...)', sql)).strip()
+
+
+def _origin(frame):
+    """``(template line, project code line)`` a query was issued from."""
+    project = str(settings.BASE_DIR) + os.sep
+    template = code = None
+    while frame is not None and (template is None or code is None):
+        if template is None:
+            node = frame.f_locals.get('self')
+            # type(), not isinstance(): the latter evaluates lazy objects
+            # such as request.user, which would query again from here
+            if issubclass(type(node), Node) and getattr(node, 'token', None) is not None and node.origin is not None:
+                template = f'{node.origin.template_name or node.origin.name}:{node.token.lineno}'
+        if code is None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(project) and filename != __file__ and 'site-packages' not in filename:
+                code = f'{filename[len(project):]}:{frame.f_lineno}'
+        frame = frame.f_back
+    return template, code
+
+
+class QueryProfile:
+    """Queries run on this thread's connections while the profile is active."""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold or getattr(settings, 'SQL_N_PLUS_ONE_THRESHOLD', 3)
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self._record))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def _record(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            template, code = _origin(sys._getframe(1))
+            self.queries.append(Query(sql, params, elapsed, fingerprint(sql), template, code))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def seconds(self):
+        return sum(query.seconds for query in self.queries)
+
+    def duplicates(self):
+        """``[(times, sql)]`` for statements run more than once with the same parameters."""
+        counts = Counter((query.sql, repr(query.params)) for query in self.queries)
+        return [(times, sql) for (sql, _), times in counts.most_common() if times > 1]
+
+    def n_plus_one(self):
+        """``[(times, fingerprint, origin)]`` for statement shapes repeated from one place."""
+        counts = Counter((query.fingerprint, query.template or query.code) for query in self.queries)
+        return [
+            (times, shape, origin or 'unknown')
+            for (shape, origin), times in counts.most_common() if times >= self.threshold
+        ]
+
+    def describe(self):
+        lines = [f'{self.count} queries in {1000 * self.seconds:.1f} ms']
+        for times, shape, origin in self.n_plus_one():
+            lines.append(f'  N+1: {times}x at {origin}: {shape[:200]}')
+        for times, sql in self.duplicates():
+            lines.append(f'  duplicate: {times}x {sql[:200]}')
+        return '\n'.join(lines)
+
+
+# ============== PER-VIEW STATISTICS ==============
+
+class ViewStats:
+    """Query totals per view name in this process."""
+
+    def __init__(self):
+        self._views = defaultdict(lambda: {
+            'requests': 0, 'queries': 0, 'seconds': 0.0, 'max_queries': 0,
+            'duplicates': 0, 'n_plus_one': Counter(),
+        })
+        self._lock = threading.Lock()
+
+    def record(self, view, profile):
+        duplicates = sum(times - 1 for times, _ in profile.duplicates())
+        patterns = profile.n_plus_one()
+        with self._lock:
+            totals = self._views[view]
+            totals['requests'] += 1
+            totals['queries'] += profile.count
+            totals['seconds'] += profile.seconds
+            totals['max_queries'] = max(totals['max_queries'], profile.count)
+            totals['duplicates'] += duplicates
+            for _, shape, origin in patterns:
+                totals['n_plus_one'][f'{origin}: {shape[:120]}'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {
+                    'requests': totals['requests'],
+                    'mean_queries': round(totals['queries'] / totals['requests'], 2),
+                    'max_queries': totals['max_queries'],
+                    'mean_db_ms': round(1000 * totals['seconds'] / totals['requests'], 3),
+                    'duplicates': totals['duplicates'],
+                    'n_plus_one': dict(totals['n_plus_one'].most_common(10)),
+                }
+                for view, totals in sorted(self._views.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_stats = ViewStats()
+
+
+def query_budget(url_name):
+    return getattr(settings, 'SQL_QUERY_BUDGETS', {}).get(url_name)
+
+
+class QueryProfilingMiddleware:
+    """Profile the queries of each request; see the module docstring."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SQL_PROFILING', False):
+            return self.get_response(request)
+        with QueryProfile() as profile:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or request.path
+        view_stats.record(view, profile)
+        budget = query_budget(match.url_name) if match else None
+        over_budget = budget is not None and profile.count > budget
+        if over_budget or profile.n_plus_one():
+            budget_note = f' (budget {budget})' if over_budget else ''
+            logger.warning('%s %s%s: %s', request.method, request.path, budget_note, profile.describe())
+        if settings.DEBUG:
+            response['X-DB-Queries'] = str(profile.count)
+            response['X-DB-Time'] = f'{1000 * profile.seconds:.1f}ms'
+        response.sql_profile = profile
+        if over_budget and getattr(settings, 'SQL_PROFILING_STRICT', False):
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path} ran {profile.count} queries, budget {budget}\n{profile.describe()}'
+            )
+        return response
+
+
+# ============== TEST HELPER ==============
+
+@contextmanager
+def assert_queries(budget=None, n_plus_one=True, threshold=None):
+    """
+    Fail if the enclosed block runs more than ``budget`` queries or, with
+    ``n_plus_one``, repeats a statement shape from one place ``threshold``
+    times or more.
+    """
+    with QueryProfile(threshold) as profile:
+        yield profile
+    failures = []
+    if budget is not None and profile.count > budget:
+        failures.append(f'{profile.count} queries exceed the budget of {budget}')
+    if n_plus_one and profile.n_plus_one():
+        failures.append('N+1 query pattern')
+    if failures:
+        raise AssertionError('; '.join(failures) + '\n' + profile.describe())
@@ -0,0 +1,140 @@
+"""
+Notification retention.
+
+Notifications are kept for ``DEFAULT_RETENTION_DAYS[type]`` days, or the
+override in ``NOTIFICATION_RETENTION_DAYS`` (None keeps them for good), and
+then deleted by ``prune``, run from the ``prune_notifications`` command.
+The sweep walks each type's expired rows oldest first through the
+(notification_type, created_at) index and deletes them
+``NOTIFICATION_RETENTION_BATCH_SIZE`` at a time, each batch in its own
+short transaction:
+
+    SELECT id, ... FROM core_notification
+     WHERE notification_type = %s AND created_at < %s
+     ORDER BY created_at, id LIMIT 1000
+    DELETE FROM core_notification WHERE id IN (...)
+
+so no statement holds its locks for more than one batch, and the pages
+reading notifications (the newest 50 or 10 of one user, and the unread
+count through the (user, is_read) index) interleave with the sweep.  The
+deletes bypass the per-row post_delete handler; the unread-count change of
+every affected user is published once per batch instead.
+
+With ``NOTIFICATION_ARCHIVE`` (or ``--archive``) each batch is first
+copied, zlib-compressed, into one ``NotificationArchive`` row in the same
+transaction; ``archived`` reads a batch back.
+"""
+
+import json
+import logging
+import time
+import zlib
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .deletion import delete_rows
+from .models import Notification, NotificationArchive
+from .notifications import publish_deltas
+
+logger = logging.getLogger(__name__)
+
+# Days kept per notification type; None keeps them for good
+DEFAULT_RETENTION_DAYS = {
+    'promo': 30,
+    'welcome': 90,
+    'system': 180,
+    'booking': 365,
+    'order': 365,
+}
+
+ARCHIVE_FIELDS = ('id', 'user_id', 'title', 'message', 'link', 'is_read', 'created_at')
+
+
+def retention_days():
+    return {**DEFAULT_RETENTION_DAYS, **getattr(settings, 'NOTIFICATION_RETENTION_DAYS', {})}
+
+
+def batch_size():
+    return getattr(settings, 'NOTIFICATION_RETENTION_BATCH_SIZE', 1000)
+
+
+def cutoffs(now=None, types=None):
+    """``{notification_type: datetime}``: notifications created before it have expired"""
+    now = now or timezone.now()
+    return {
+        notification_type: now - timedelta(days=days)
+        for notification_type, days in retention_days().items()
+        if days is not None and (not types or notification_type in types)
+    }
+
+
+def expired(notification_type, cutoff):
+    return Notification.objects.filter(notification_type=notification_type, created_at__lt=cutoff)
+
+
+def compress(rows):
+    """zlib-compressed JSON of ``ARCHIVE_FIELDS`` value rows"""
+    records = [dict(zip(ARCHIVE_FIELDS, row)) for row in rows]
+    for record in records:
+        record['created_at'] = record['created_at'].isoformat()
+    return zlib.compress(json.dumps(records, separators=(',', ':')).encode(), 6)
+
+
+def archived(archive):
+    """The notifications of an archive row, as dictionaries"""
+    return json.loads(zlib.decompress(bytes(archive.payload)))
+
+
+def prune_batch(notification_type, cutoff, size, archive=False):
+    """Delete (and optionally archive) the oldest ``size`` expired notifications of a type."""
+    with transaction.atomic():
+        fields = ARCHIVE_FIELDS if archive else ('id', 'user_id', 'is_read')
+        rows = list(expired(notification_type, cutoff).order_by('created_at', 'pk').values_list(*fields)[:size])
+        if not rows:
+            return 0
+        is_read = fields.index('is_read')
+        unread = Counter(row[1] for row in rows if not row[is_read])
+        if archive:
+            NotificationArchive.objects.create(
+                notification_type=notification_type,
+                count=len(rows),
+                oldest=rows[0][6],
+                newest=rows[-1][6],
+                payload=compress(rows),
+            )
+        # Bypass the per-row post_delete handler; deltas are published below
+        delete_rows(Notification, 'id', [row[0] for row in rows])
+        publish_deltas({user_id: -count for user_id, count in unread.items()})
+    return len(rows)
+
+
+def prune(now=None, types=None, size=None, archive=None, pause=0, progress=None):
+    """
+    Delete every expired notification, batch by batch, sleeping ``pause``
+    seconds between batches to leave the database to other writers.
+    ``progress(notification_type, deleted)`` is called after every batch.
+    Returns ``{notification_type: deleted}``.
+    """
+    size = size or batch_size()
+    if archive is None:
+        archive = getattr(settings, 'NOTIFICATION_ARCHIVE', False)
+    results = {}
+    for notification_type, cutoff in cutoffs(now, types).items():
+        deleted = 0
+        while True:
+            count = prune_batch(notification_type, cutoff, size, archive)
+            deleted += count
+            if count and progress is not None:
+                progress(notification_type, deleted)
+            if count < size:
+                break
+            if pause:
+                time.sleep(pause)
+        if deleted:
+            logger.info('Pruned %d %s notifications older than %s', deleted, notification_type, cutoff)
+        results[notification_type] = deleted
+    return results
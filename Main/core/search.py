@@ -0,0 +1,609 @@
+"""
+Full-text search for services and store items.
+
+The search page, the catalog listings and the AJAX search endpoints all go
+through this module instead of running ``icontains`` scans.  A backend keeps
+an inverted index over the title/name, description and category name of
+every Service and StoreItem and returns primary keys ranked by relevance.
+
+Three backends are available:
+
+- ``MySQLFullTextBackend``: FULLTEXT indexes created by migration 0018,
+  queried with ``MATCH ... AGAINST`` in boolean mode.
+- ``SQLiteFTS5Backend``: an FTS5 virtual table (``core_search_index``)
+  ranked with ``bm25()``.
+- ``InProcessSearchBackend``: a pure-Python inverted index held in memory.
+  Every write bumps the ``search-index`` version stamp; the other worker
+  processes see the stamp move and reload their index on a background
+  thread, searching the previous one until the new one is swapped in.
+
+The backend is chosen with ``settings.SEARCH_BACKEND`` (a dotted path) or,
+when that is empty, from the database vendor: MySQL gets FULLTEXT, anything
+else the in-process index.  FTS5 has to be selected explicitly; ``bm25()``
+ranking visits every matching row, so on very common terms it is slower
+than the in-process index (see ``manage.py bench_search``).
+
+``manage.py rebuild_search_index`` rewrites a backend's index from the
+catalog tables, e.g. after switching ``SEARCH_BACKEND`` to FTS5 on a
+database whose FTS5 table was not maintained in the meantime.
+"""
+
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import Case, IntegerField, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Service, ServiceCategory, StoreCategory, StoreItem
+from .versioning import VersionStamp
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Relative weight of each indexed field when ranking results
+FIELD_WEIGHTS = {'title': 10.0, 'category': 4.0, 'description': 1.0}
+
+DEFAULT_LIMIT = 200
+
+# Bumped on every indexed write so that in-process indexes of other workers reload
+index_version = VersionStamp('search-index')
+
+
+class IndexedModel:
+    """Describes how a model is mapped onto a search document."""
+
+    def __init__(self, kind, model, title_field, category_model):
+        self.kind = kind
+        self.model = model
+        self.title_field = title_field
+        self.category_model = category_model
+        self.table = model._meta.db_table
+        self.category_table = category_model._meta.db_table
+
+    def document(self, obj):
+        """Return the (title, description, category) text of an instance."""
+        return (
+            getattr(obj, self.title_field),
+            obj.description,
+            obj.category.name,
+        )
+
+    def documents(self, queryset=None):
+        """Yield (pk, title, description, category) rows in bulk."""
+        queryset = self.model.objects.all() if queryset is None else queryset
+        return queryset.values_list(
+            'pk', self.title_field, 'description', 'category__name'
+        ).iterator(chunk_size=2000)
+
+
+INDEXED_MODELS = {
+    'service': IndexedModel('service', Service, 'title', ServiceCategory),
+    'storeitem': IndexedModel('storeitem', StoreItem, 'name', StoreCategory),
+}
+
+KIND_BY_MODEL = {spec.model: kind for kind, spec in INDEXED_MODELS.items()}
+KIND_BY_CATEGORY = {spec.category_model: kind for kind, spec in INDEXED_MODELS.items()}
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class SearchBackend:
+    """Base class for search backends."""
+
+    def search(self, kind, query, limit=DEFAULT_LIMIT):
+        """Return primary keys of ``kind`` matching ``query``, best first."""
+        raise NotImplementedError
+
+    def index(self, kind, obj):
+        """Add or refresh a single instance in the index."""
+
+    def remove(self, kind, pk):
+        """Drop a single instance from the index."""
+
+    def reindex_category(self, kind, category_id):
+        """Refresh every document belonging to a renamed category."""
+        spec = INDEXED_MODELS[kind]
+        for obj in spec.model.objects.filter(category_id=category_id).select_related('category'):
+            self.index(kind, obj)
+
+    def rebuild(self):
+        """Rebuild the whole index from the database."""
+
+
+class InvertedIndex:
+    """
+    Postings, document tokens and sorted vocabulary of every kind.
+
+    Postings map each token to the documents containing it together with
+    the best field weight the token reached in that document.
+    """
+
+    def __init__(self):
+        self.postings = {kind: defaultdict(dict) for kind in INDEXED_MODELS}
+        self.doc_tokens = {kind: {} for kind in INDEXED_MODELS}
+        self.vocabulary = {kind: [] for kind in INDEXED_MODELS}
+
+    @classmethod
+    def load(cls):
+        """Build an index of every document in the database."""
+        index = cls()
+        for kind, spec in INDEXED_MODELS.items():
+            for pk, title, description, category in spec.documents():
+                index.add(kind, pk, title, description, category)
+            index.vocabulary[kind] = sorted(index.postings[kind])
+        return index
+
+    def add(self, kind, pk, title, description, category):
+        """Add a document's postings; the vocabulary is left to the caller."""
+        weights = {}
+        for field, text in (('title', title), ('category', category), ('description', description)):
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                if weights.get(token, 0) < weight:
+                    weights[token] = weight
+        postings = self.postings[kind]
+        for token, weight in weights.items():
+            postings[token][pk] = weight
+        self.doc_tokens[kind][pk] = tuple(weights)
+        return weights
+
+    def discard(self, kind, pk):
+        postings = self.postings[kind]
+        vocabulary = self.vocabulary[kind]
+        for token in self.doc_tokens[kind].pop(pk, ()):
+            docs = postings.get(token)
+            if docs is None:
+                continue
+            docs.pop(pk, None)
+            if not docs:
+                del postings[token]
+                position = bisect.bisect_left(vocabulary, token)
+                if position < len(vocabulary) and vocabulary[position] == token:
+                    del vocabulary[position]
+
+    def put(self, kind, pk, title, description, category):
+        """Add or replace one document, keeping the vocabulary sorted."""
+        self.discard(kind, pk)
+        vocabulary = self.vocabulary[kind]
+        for token in self.add(kind, pk, title, description, category):
+            position = bisect.bisect_left(vocabulary, token)
+            if position == len(vocabulary) or vocabulary[position] != token:
+                vocabulary.insert(position, token)
+
+
+class InProcessSearchBackend(SearchBackend):
+    """
+    Pure-Python inverted index kept in process memory.
+
+    The last query term is treated as a prefix so the navbar autocomplete
+    can match partially typed words; prefixes are expanded with a binary
+    search over a sorted vocabulary.  The index is loaded from the
+    database on first use and maintained from model signals afterwards;
+    signals only fire in the writing process, so each write also bumps
+    ``index_version``.  When another process moved it, the index is
+    reloaded on a background thread and swapped in once complete, and
+    searches keep using the previous index meanwhile.  Writes made in this
+    process during a reload are replayed onto the new index before the
+    swap.
+    """
+
+    max_prefix_expansions = 64
+
+    def __init__(self):
+        # Guards the current index; held by searches and writes, never by a load
+        self._lock = threading.RLock()
+        # Held for the whole of a load, so that only one runs at a time
+        self._build_lock = threading.Lock()
+        self._index = None
+        self._built_version = None
+        # Writes made while a load runs, and the version that load started at
+        self._replay = None
+        self._replay_version = None
+
+    @property
+    def _loaded(self):
+        return self._index is not None
+
+    def _refresh(self):
+        if self._index is None:
+            with self._build_lock:
+                if self._index is None:
+                    self._rebuild()
+        elif self._built_version != index_version.current() and self._build_lock.acquire(blocking=False):
+            try:
+                threading.Thread(target=self._rebuild_in_background, name='search-index', daemon=True).start()
+            except Exception:
+                self._build_lock.release()
+                raise
+
+    def _rebuild_in_background(self):
+        close_old_connections()
+        try:
+            self._rebuild()
+        except Exception:
+            logger.exception('Could not reload the search index')
+        finally:
+            self._build_lock.release()
+            connections.close_all()
+
+    def _publish(self):
+        """
+        Bump the version after a change applied to this index.  The index
+        stays current unless another process bumped it meanwhile, in which
+        case the stamp moved by more than this one change.
+        """
+        before = index_version.current()
+        index_version.bump()
+        after = index_version.current()
+        expected = (before[0] + 1, None if after[1] is None else (before[1] or 0) + 1)
+        if after != expected:
+            return
+        if self._index is not None and self._built_version == before:
+            self._built_version = after
+        if self._replay is not None and self._replay_version == before:
+            self._replay_version = after
+
+    def rebuild(self):
+        with self._build_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._replay_version = index_version.current()
+            self._replay = []
+        try:
+            index = InvertedIndex.load()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            for kind, pk, document in self._replay:
+                if document is None:
+                    index.discard(kind, pk)
+                else:
+                    index.put(kind, pk, *document)
+            self._index = index
+            self._built_version = self._replay_version
+            self._replay = None
+
+    def index(self, kind, obj):
+        document = INDEXED_MODELS[kind].document(obj)
+        with self._lock:
+            if self._index is not None:
+                self._index.put(kind, obj.pk, *document)
+            if self._replay is not None:
+                self._replay.append((kind, obj.pk, document))
+            self._publish()
+
+    def remove(self, kind, pk):
+        with self._lock:
+            if self._index is not None:
+                self._index.discard(kind, pk)
+            if self._replay is not None:
+                self._replay.append((kind, pk, None))
+            self._publish()
+
+    def _expand(self, kind, prefix):
+        vocabulary = self._index.vocabulary[kind]
+        start = bisect.bisect_left(vocabulary, prefix)
+        expansions = []
+        for token in vocabulary[start:start + self.max_prefix_expansions]:
+            if not token.startswith(prefix):
+                break
+            expansions.append(token)
+        return expansions
+
+    def search(self, kind, query, limit=DEFAULT_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._refresh()
+        with self._lock:
+            postings = self._index.postings[kind]
+            total = max(len(self._index.doc_tokens[kind]), 1)
+            scores = None
+            for position, term in enumerate(terms):
+                if position == len(terms) - 1:
+                    candidates = self._expand(kind, term)
+                else:
+                    candidates = [term] if term in postings else []
+                term_scores = {}
+                for token in candidates:
+                    docs = postings[token]
+                    idf = math.log(1 + total / len(docs))
+                    for pk, weight in docs.items():
+                        score = weight * idf
+                        if term_scores.get(pk, 0) < score:
+                            term_scores[pk] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pk: score + term_scores[pk] for pk, score in scores.items() if pk in term_scores}
+                if not scores:
+                    return []
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda pair: (-pair[1], pair[0]))
+        return [pk for pk, _ in ranked]
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    SQLite FTS5 index stored in the ``core_search_index`` virtual table.
+
+    Rows are keyed by rowid so that refreshing or dropping a document is a
+    rowid lookup rather than a scan of the FTS table.
+    """
+
+    table = 'core_search_index'
+    kind_codes = {'service': 0, 'storeitem': 1}
+
+    def _rowid(self, kind, pk):
+        return pk * len(self.kind_codes) + self.kind_codes[kind]
+
+    @staticmethod
+    def match_expression(query):
+        terms = tokenize(query)
+        if not terms:
+            return ''
+        quoted = ['"%s"' % term for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, kind, query, limit=DEFAULT_LIMIT):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        weights = FIELD_WEIGHTS
+        sql = (
+            f'SELECT object_id FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND kind = %s '
+            f'ORDER BY bm25({self.table}, 0, 0, %s, %s, %s), object_id LIMIT %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                expression, kind,
+                weights['title'], weights['category'], weights['description'],
+                limit,
+            ])
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, kind, obj):
+        title, description, category = INDEXED_MODELS[kind].document(obj)
+        rowid = self._rowid(kind, obj.pk)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [rowid])
+            cursor.execute(
+                f'INSERT INTO {self.table} '
+                '(rowid, kind, object_id, title, category, description) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [rowid, kind, obj.pk, title, category, description],
+            )
+
+    def remove(self, kind, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [self._rowid(kind, pk)])
+
+    def rebuild(self):
+        stride = len(self.kind_codes)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            for kind, spec in INDEXED_MODELS.items():
+                cursor.execute(
+                    f'INSERT INTO {self.table} '
+                    '(rowid, kind, object_id, title, category, description) '
+                    f'SELECT o.id * {stride} + {self.kind_codes[kind]}, %s, o.id, '
+                    f'o.{spec.title_field}, c.name, o.description '
+                    f'FROM {spec.table} o JOIN {spec.category_table} c ON c.id = o.category_id',
+                    [kind],
+                )
+
+
+class MySQLFullTextBackend(SearchBackend):
+    """
+    MySQL FULLTEXT search over the catalog tables themselves.
+
+    InnoDB maintains FULLTEXT indexes on every write, so ``index`` and
+    ``remove`` have nothing to do.  Terms shorter than the server's
+    ``innodb_ft_min_token_size`` are not indexed; queries made only of such
+    terms fall back to the in-process index.
+    """
+
+    min_token_size = 3
+
+    def __init__(self):
+        self.fallback = InProcessSearchBackend()
+
+    @staticmethod
+    def boolean_expression(terms):
+        expression = ['+%s' % term for term in terms]
+        expression[-1] += '*'
+        return ' '.join(expression)
+
+    def search(self, kind, query, limit=DEFAULT_LIMIT):
+        terms = [term for term in tokenize(query) if len(term) >= self.min_token_size]
+        if not terms:
+            return self.fallback.search(kind, query, limit) if tokenize(query) else []
+        spec = INDEXED_MODELS[kind]
+        expression = self.boolean_expression(terms)
+        title = f'o.{spec.title_field}'
+        sql = (
+            f'SELECT o.id, '
+            f'MATCH({title}) AGAINST (%s IN BOOLEAN MODE) * %s + '
+            f'MATCH(c.name) AGAINST (%s IN BOOLEAN MODE) * %s + '
+            f'MATCH({title}, o.description) AGAINST (%s IN BOOLEAN MODE) * %s AS score '
+            f'FROM {spec.table} o JOIN {spec.category_table} c ON c.id = o.category_id '
+            f'WHERE MATCH({title}, o.description) AGAINST (%s IN BOOLEAN MODE) '
+            f'OR MATCH(c.name) AGAINST (%s IN BOOLEAN MODE) '
+            f'ORDER BY score DESC, o.id LIMIT %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                expression, FIELD_WEIGHTS['title'],
+                expression, FIELD_WEIGHTS['category'],
+                expression, FIELD_WEIGHTS['description'],
+                expression, expression, limit,
+            ])
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, kind, obj):
+        self.fallback.index(kind, obj)
+
+    def remove(self, kind, pk):
+        self.fallback.remove(kind, pk)
+
+    def reindex_category(self, kind, category_id):
+        if self.fallback._loaded:
+            super().reindex_category(kind, category_id)
+        else:
+            self.fallback._publish()
+
+
+def sqlite_has_fts5():
+    """Return True if the SQLite build behind the default connection has FTS5."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+    except Exception:
+        return False
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the configured search backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'SEARCH_BACKEND', '')
+                if path:
+                    backend_class = import_string(path)
+                elif connection.vendor == 'mysql':
+                    backend_class = MySQLFullTextBackend
+                else:
+                    backend_class = InProcessSearchBackend
+                _backend = backend_class()
+    return _backend
+
+
+def reset_backend():
+    """Forget the current backend so the next call re-reads the settings."""
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def result_limit():
+    return getattr(settings, 'SEARCH_RESULT_LIMIT', DEFAULT_LIMIT)
+
+
+def search_ids(kind, query, limit=None):
+    """Return ranked primary keys of ``kind`` ('service' or 'storeitem')."""
+    if limit is None:
+        limit = result_limit()
+    return get_backend().search(kind, query, limit)
+
+
+def narrow(ids, queryset, field='pk'):
+    """The ``ids`` that ``queryset`` holds (matched on ``field``), in the same order, with one query."""
+    if not ids:
+        return []
+    found = set(queryset.filter(**{f'{field}__in': ids}).values_list(field, flat=True))
+    return [pk for pk in ids if pk in found]
+
+
+def filtered_ids(kind, query, queryset, field='pk', limit=None):
+    """
+    Ranked primary keys of ``kind`` among the rows of ``queryset``.
+
+    The backends rank without knowing about filters, so the best
+    ``SEARCH_FILTER_CANDIDATES`` matches are narrowed to ``queryset`` before
+    the limit is applied; a filter therefore only comes back short when
+    its matches rank below that many unfiltered ones.
+    """
+    if limit is None:
+        limit = result_limit()
+    candidates = search_ids(kind, query, max(limit, getattr(settings, 'SEARCH_FILTER_CANDIDATES', 5000)))
+    return narrow(candidates, queryset, field)[:limit]
+
+
+def in_rank_order(queryset, pks):
+    """Restrict ``queryset`` to ``pks`` and order it the same way."""
+    if not pks:
+        return queryset.none()
+    ranking = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(pks)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=pks).order_by(ranking)
+
+
+def search_services(query, queryset=None, limit=None, filtered=False):
+    """
+    Return a queryset of services matching ``query``, best match first.
+    With ``filtered``, ``queryset`` is applied before the limit (see
+    ``filtered_ids``) at the cost of one more query.
+    """
+    queryset = Service.objects.all() if queryset is None else queryset
+    if filtered:
+        return in_rank_order(queryset, filtered_ids('service', query, queryset, limit=limit))
+    return in_rank_order(queryset, search_ids('service', query, limit))
+
+
+def search_store_items(query, queryset=None, limit=None, filtered=False):
+    """Return a queryset of store items matching ``query``, best match first; see ``search_services``."""
+    queryset = StoreItem.objects.all() if queryset is None else queryset
+    if filtered:
+        return in_rank_order(queryset, filtered_ids('storeitem', query, queryset, limit=limit))
+    return in_rank_order(queryset, search_ids('storeitem', query, limit))
+
+
+# ============== INDEX MAINTENANCE ==============
+
+INDEXED_FIELDS = {'title', 'name', 'description', 'category', 'category_id'}
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=StoreItem)
+def index_catalog_item(sender, instance, update_fields=None, **kwargs):
+    """Refresh the search document of a saved service or store item."""
+    if update_fields is not None and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    kind = KIND_BY_MODEL[sender]
+    transaction.on_commit(lambda: get_backend().index(kind, instance))
+
+
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=StoreItem)
+def unindex_catalog_item(sender, instance, **kwargs):
+    """Drop a deleted service or store item from the search index."""
+    kind = KIND_BY_MODEL[sender]
+    pk = instance.pk
+    transaction.on_commit(lambda: get_backend().remove(kind, pk))
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_save, sender=StoreCategory)
+def reindex_category(sender, instance, created, **kwargs):
+    """Category names are indexed with their items, so refresh them on rename."""
+    if created:
+        return
+    kind = KIND_BY_CATEGORY[sender]
+    category_id = instance.pk
+    transaction.on_commit(lambda: get_backend().reindex_category(kind, category_id))
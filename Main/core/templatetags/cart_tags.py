@@ -1,25 +1,26 @@
 from django import template
-from django.db.models import Sum
 from core.models import Cart
+from core.navigation import NavigationContext
+from core.wishlists import membership
 
 register = template.Library()
 
-@register.simple_tag
-def cart_item_count(user):
+@register.simple_tag(takes_context=True)
+def cart_item_count(context, user):
     """Returns the total number of items in the user's cart, including quantities"""
-    if user.is_authenticated:
-        cart = Cart.objects.filter(user=user).first()
-        if cart:
-            total = cart.items.aggregate(total=Sum('quantity'))['total']
-            return total or 0
-    return 0
+    if not user.is_authenticated:
+        return 0
+    request = context.get('request')
+    if request is not None and request.user == user:
+        # Shares the count the navbar already computed for this request
+        return NavigationContext.for_request(request).cart_count
+    total = Cart.objects.filter(user=user).values_list('total_quantity', flat=True).first()
+    return total or 0
 
 @register.filter
 def get_wishlist_status(item, user):
     """Check if an item is in user's wishlist"""
-    if user.is_authenticated:
-        return user.wishlist_set.filter(items=item).exists()
-    return False
+    return item.pk in membership(user)
 
 @register.filter
 def smart_image_url(image):
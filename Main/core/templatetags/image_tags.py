@@ -0,0 +1,51 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from core.derivatives import manifest_for
+from core.templatetags.cart_tags import smart_image_url
+
+register = template.Library()
+
+# Rendered width of a catalog card: one column on phones, two on tablets,
+# three on the 1280px container
+CARD_SIZES = '(max-width: 768px) 100vw, (max-width: 1024px) 50vw, 400px'
+
+
+def _attributes(attrs):
+    return format_html_join('', ' {}="{}"', ((name.replace('_', '-'), value) for name, value in attrs.items()))
+
+
+def _srcset(entries):
+    return ', '.join(f'{settings.MEDIA_URL}{path} {width}w' for width, path, _ in entries)
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes=CARD_SIZES, **attrs):
+    """
+    ``<img>`` for an ImageField with a ``srcset`` of resized derivatives,
+    wrapped in a ``<picture>`` offering AVIF/WebP to browsers that accept
+    them.  Falls back to the original image until its derivatives exist.
+
+        {% responsive_image item.image alt=item.name loading="lazy" %}
+    """
+    name = getattr(image, 'name', '') or ''
+    manifest = manifest_for(name)
+    if manifest is None:
+        return format_html('<img src="{}" alt="{}"{}>', smart_image_url(image), alt, _attributes(attrs))
+
+    variants = manifest['variants']
+    formats = manifest['formats']
+    fallback_format = formats[-1][0]
+    fallback = variants[fallback_format]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((mime, _srcset(variants[format_name]), sizes) for format_name, mime in formats[:-1]),
+    )
+    img = format_html(
+        '<img src="{}{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}"{}>',
+        settings.MEDIA_URL, fallback[-1][1], _srcset(fallback), sizes,
+        manifest['width'], manifest['height'], alt, _attributes(attrs),
+    )
+    return mark_safe(f'<picture>{sources}{img}</picture>')
@@ -1,3 +1,281 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .checkout import EmptyCart, place_order
+from .inventory import InsufficientStock, release_expired, reserve_many
+from .models import (
+    Booking, CatalogEntry, Cart, CartItem, Catering, Order, OrderItem, Photography, Service, ServiceCategory,
+    StockReservation, StoreCategory, StoreItem,
+)
+from .profiling import assert_queries
+
+
+class StockTestCase(TestCase):
+    """Store items, carts and the stock invariant shared by the tests below."""
+
+    def setUp(self):
+        self.category = StoreCategory.objects.create(name='Decor')
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def make_item(self, stock, name='Fairy lights', price=100):
+        return StoreItem.objects.create(
+            category=self.category, name=name, description='', price=price, image='store/x.jpg', stock=stock,
+        )
+
+    def make_cart(self, username):
+        return Cart.objects.create(user=User.objects.create_user(username, password='secret'))
+
+    def add(self, item, quantity, cart=None):
+        return CartItem.objects.create(cart=cart or self.cart, item=item, quantity=quantity)
+
+    def stock(self, item):
+        return StoreItem.objects.get(pk=item.pk).stock
+
+    def reserved(self, item):
+        return sum(StockReservation.objects.filter(item=item).values_list('quantity', flat=True))
+
+    def sold(self, item):
+        return sum(OrderItem.objects.filter(item=item).values_list('quantity', flat=True))
+
+    def assertStockConserved(self, item, initial):
+        """stock + reserved + sold stays what the item started with"""
+        self.assertGreaterEqual(self.stock(item), 0)
+        self.assertEqual(self.stock(item) + self.reserved(item) + self.sold(item), initial)
+
+
+class StockReservationTests(StockTestCase):
+
+    def test_adding_to_cart_reserves_stock(self):
+        item = self.make_item(stock=5)
+        line = self.add(item, 3)
+        self.assertEqual(self.stock(item), 2)
+        self.assertEqual(StockReservation.objects.get(cart_item=line).quantity, 3)
+        self.assertStockConserved(item, 5)
+
+    def test_cart_lines_never_oversell(self):
+        item = self.make_item(stock=5)
+        first = self.add(item, 4)
+        second = self.add(item, 4, cart=self.make_cart('other'))
+        third = self.add(item, 1, cart=self.make_cart('late'))
+        # Each line is clamped to what was left when it was added
+        self.assertEqual((first.quantity, second.quantity, third.quantity), (4, 1, 0))
+        self.assertEqual(self.stock(item), 0)
+        self.assertStockConserved(item, 5)
+
+    def test_changing_quantity_adjusts_the_reservation(self):
+        item = self.make_item(stock=5)
+        line = self.add(item, 2)
+        line.quantity = 4
+        line.save()
+        self.assertEqual(self.stock(item), 1)
+        line.quantity = 1
+        line.save()
+        self.assertEqual(self.stock(item), 4)
+        self.assertEqual(StockReservation.objects.get(cart_item=line).quantity, 1)
+        self.assertStockConserved(item, 5)
+
+    def test_deleting_a_cart_line_releases_its_stock(self):
+        item = self.make_item(stock=5)
+        line = self.add(item, 3)
+        line.delete()
+        self.assertEqual(self.stock(item), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_deleting_a_cart_releases_every_line(self):
+        lights, candles = self.make_item(stock=5), self.make_item(stock=5, name='Candles')
+        self.add(lights, 2)
+        self.add(candles, 3)
+        self.cart.delete()
+        self.assertEqual((self.stock(lights), self.stock(candles)), (5, 5))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_are_released(self):
+        item = self.make_item(stock=5)
+        self.add(item, 3)
+        kept = self.add(self.make_item(stock=5, name='Candles'), 1)
+        StockReservation.objects.exclude(cart_item=kept).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(self.stock(item), 5)
+        self.assertEqual(list(StockReservation.objects.values_list('cart_item', flat=True)), [kept.pk])
+        # A second sweep finds nothing left to release
+        self.assertEqual(release_expired(), 0)
+        self.assertEqual(self.stock(item), 5)
+
+    def test_expired_stock_is_reclaimed_for_a_new_cart(self):
+        item = self.make_item(stock=3)
+        self.add(item, 3)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        line = self.add(item, 2, cart=self.make_cart('other'))
+        self.assertEqual(line.quantity, 2)
+        self.assertEqual(self.stock(item), 1)
+
+    def test_reserve_many_is_all_or_nothing(self):
+        lights, candles = self.make_item(stock=5), self.make_item(stock=1, name='Candles')
+        with transaction.atomic():
+            self.assertFalse(reserve_many({lights.pk: 2, candles.pk: 2}))
+            transaction.set_rollback(True)
+        self.assertEqual((self.stock(lights), self.stock(candles)), (5, 1))
+        self.assertTrue(reserve_many({lights.pk: 2, candles.pk: 1}))
+        self.assertEqual((self.stock(lights), self.stock(candles)), (3, 0))
+
+
+class CheckoutTests(StockTestCase):
+
+    def test_checkout_turns_reservations_into_an_order(self):
+        lights, candles = self.make_item(stock=5), self.make_item(stock=5, name='Candles', price=40)
+        self.add(lights, 2)
+        self.add(candles, 3)
+        order, created = place_order(self.user, 'Road 1, Dhaka')
+        self.assertTrue(created)
+        self.assertEqual(order.total_amount, 2 * 100 + 3 * 40)
+        self.assertEqual(
+            set(order.order_items.values_list('item_id', 'quantity')), {(lights.pk, 2), (candles.pk, 3)},
+        )
+        # The stock was taken when the items were added, not again at checkout
+        self.assertEqual((self.stock(lights), self.stock(candles)), (3, 2))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+        cart = Cart.objects.get(pk=self.cart.pk)
+        self.assertEqual((cart.item_count, cart.total_quantity), (0, 0))
+        self.assertStockConserved(lights, 5)
+        self.assertStockConserved(candles, 5)
+
+    def test_checkout_token_is_idempotent(self):
+        item = self.make_item(stock=5)
+        self.add(item, 2)
+        order, created = place_order(self.user, 'Road 1, Dhaka', checkout_token='token-1')
+        self.add(item, 1)
+        again, created_again = place_order(self.user, 'Road 1, Dhaka', checkout_token='token-1')
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, order.pk)
+        self.assertEqual(Order.objects.count(), 1)
+        # The line added after the first checkout is still in the cart
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        self.assertStockConserved(item, 5)
+
+    def test_resubmitted_checkout_form_places_one_order(self):
+        item = self.make_item(stock=5)
+        self.add(item, 2)
+        self.client.force_login(self.user)
+        form = {'address': 'Road 1', 'city': 'Dhaka', 'zip_code': '1207', 'checkout_token': 'abc123'}
+        for _ in range(2):
+            response = self.client.post(reverse('checkout'), form)
+            self.assertRedirects(response, reverse('order_history'), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.filter(user=self.user, checkout_token='abc123').count(), 1)
+        self.assertEqual(self.stock(item), 3)
+
+    def test_expired_reservation_is_topped_up_at_checkout(self):
+        item = self.make_item(stock=5)
+        self.add(item, 2)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired()
+        self.assertEqual(self.stock(item), 5)
+        place_order(self.user, 'Road 1, Dhaka')
+        self.assertEqual(self.stock(item), 3)
+        self.assertStockConserved(item, 5)
+
+    def test_checkout_fails_without_writing_when_released_stock_was_sold(self):
+        lights, candles = self.make_item(stock=3), self.make_item(stock=5, name='Candles')
+        self.add(lights, 2)
+        self.add(candles, 1)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired()
+        # Someone else buys the stock this cart let go of
+        self.add(lights, 2, cart=self.make_cart('other'))
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(self.user, 'Road 1, Dhaka')
+        self.assertEqual((raised.exception.item_id, raised.exception.available), (lights.pk, 1))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+        # The candles topped up in the same statement were rolled back too
+        self.assertEqual((self.stock(lights), self.stock(candles)), (1, 5))
+
+    def test_empty_cart_raises(self):
+        with self.assertRaises(EmptyCart):
+            place_order(self.user, 'Road 1, Dhaka')
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_queries_do_not_grow_with_cart_lines(self):
+        counts = []
+        for lines in (1, 10):
+            for number in range(lines):
+                self.add(self.make_item(stock=5, name=f'Item {lines}-{number}'), 1)
+            with assert_queries() as profile:
+                place_order(self.user, 'Road 1, Dhaka')
+            counts.append(profile.count)
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(OrderItem.objects.count(), 11)
+
+
+class CatalogBookingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('guest', password='secret')
+        self.category = ServiceCategory.objects.create(name='Decoration')
+        self.service = Service.objects.create(
+            category=self.category, title='Stage decoration', description='Flowers and lights', price=5000,
+            image='services/stage.jpg',
+        )
+        self.photo = Photography.objects.create(
+            title='Wedding shoot', description='A full day of photography', price=20000, image='services/photo.jpg',
+            shoot_type='Wedding', duration=8, includes_editing=True, number_of_photos=300, includes_prints=False,
+        )
+        self.catering = Catering.objects.create(
+            title='Biryani buffet', description='Kacchi and borhani', price=450, image='services/food.jpg',
+            cuisine_type='Bengali', min_order_quantity=50,
+        )
+
+    def book(self, service_type, service):
+        return Booking.objects.create(
+            user=self.user, service_type=service_type, service_id=service.pk, date=timezone.localdate(),
+            time_slot='12:00', total_amount=service.price,
+        )
+
+    def test_bookings_of_every_type_resolve_with_one_catalog_query(self):
+        for service_type, service in (('service', self.service), ('photo', self.photo), ('catering', self.catering)):
+            self.book(service_type, service)
+        with self.assertNumQueries(2):
+            services = [booking.get_service() for booking in Booking.objects.with_services()]
+        self.assertEqual(
+            {(type(service), service.pk, service.title) for service in services},
+            {(Service, self.service.pk, 'Stage decoration'), (Photography, self.photo.pk, 'Wedding shoot'),
+             (Catering, self.catering.pk, 'Biryani buffet')},
+        )
+
+    def test_booked_service_reads_uncached_columns_from_its_table(self):
+        service = self.book('photo', self.photo).get_service()
+        self.assertIsInstance(service, Photography)
+        self.assertEqual((service.shoot_type, service.number_of_photos, service.image.name), ('Wedding', 300, 'services/photo.jpg'))
+        with self.assertNumQueries(1):
+            self.assertEqual(service.description, 'A full day of photography')
+
+    def test_service_without_an_entry_is_read_from_its_table(self):
+        booking = self.book('photo', self.photo)
+        CatalogEntry.objects.filter(kind='photo').delete()
+        service = Booking.objects.get(pk=booking.pk).get_service()
+        self.assertEqual((type(service), service.pk), (Photography, self.photo.pk))
+        self.photo.delete()
+        self.assertIsNone(Booking.objects.get(pk=booking.pk).get_service())
+
+    def test_package_detail_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('package_detail', args=['photo', self.photo.pk]))
+        self.assertContains(response, 'Wedding shoot')
+        self.assertContains(response, 'Minimum number of delivered photos: 300')
+        self.assertContains(response, reverse('book_package', args=['photo', self.photo.pk]))
+        self.assertEqual(self.client.get(reverse('package_detail', args=['photo', self.photo.pk + 1])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('package_detail', args=['storeitem', 1])).status_code, 404)
 
-# Create your tests here.
+    def test_services_listing_links_every_type_to_its_detail_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('all_services'))
+        self.assertContains(response, reverse('service_detail', args=[self.service.pk]))
+        self.assertContains(response, reverse('package_detail', args=['photo', self.photo.pk]))
+        self.assertNotContains(response, 'Enquire')
@@ -0,0 +1,134 @@
+"""
+Version stamps for in-process caches.
+
+Several modules keep derived data in process memory (the autocomplete
+index, the navigation category lists, ...).  Each of them owns a
+``VersionStamp`` that its signal receivers bump whenever the source rows
+change.  A bump is visible immediately in the current process and is
+mirrored in the shared Django cache so that other worker processes pick
+it up the next time they check, at most every ``check_interval`` seconds.
+Between checks reading the version costs nothing, so hot paths can
+compare versions on every request without a cache or database round trip.
+
+Caches whose entries change one at a time (the WebSocket session cache)
+use an ``InvalidationLog`` instead, which tells the other processes which
+keys to drop rather than that everything changed.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class VersionStamp:
+    """A monotonically increasing version shared between worker processes."""
+
+    def __init__(self, name, check_interval=None):
+        self.cache_key = f'version:{name}'
+        self._check_interval = check_interval
+        self._local = 0
+        self._shared = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def check_interval(self):
+        if self._check_interval is not None:
+            return self._check_interval
+        return getattr(settings, 'VERSION_CHECK_INTERVAL', 5)
+
+    def bump(self):
+        """Record a change locally and publish it to the other workers."""
+        with self._lock:
+            self._local += 1
+        try:
+            cache.add(self.cache_key, 0, timeout=None)
+            shared = cache.incr(self.cache_key)
+        except Exception:
+            logger.exception('Could not publish version %s', self.cache_key)
+            return
+        with self._lock:
+            self._shared = shared
+            self._checked_at = time.monotonic()
+
+    def current(self):
+        """Return a value that changes whenever any process bumped the stamp."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            try:
+                self._shared = cache.get(self.cache_key)
+            except Exception:
+                logger.exception('Could not read version %s', self.cache_key)
+        return (self._local, self._shared)
+
+
+class InvalidationLog:
+    """
+    Keys invalidated in one process, replayed by the others.
+
+    For in-process caches whose entries are invalidated one by one: a
+    version stamp would make every other process drop everything on each
+    change.  ``publish`` appends the keys to a log in the shared cache, a
+    sequence number under ``invalidations:<name>:seq`` and ``window``
+    slots reused in turn, and ``poll`` returns the keys published since
+    the previous poll, reading the cache at most every ``check_interval``
+    seconds.  ``poll`` returns None when the log cannot tell (the first
+    poll, or slots that were overwritten or expired because the process
+    fell more than ``window`` entries behind); the caller then drops
+    everything.
+    """
+
+    def __init__(self, name, window=256, timeout=300, check_interval=None):
+        self.seq_key = f'invalidations:{name}:seq'
+        self.slot_prefix = f'invalidations:{name}:log:'
+        self.window = window
+        self.timeout = timeout
+        self._check_interval = check_interval
+        self._seen = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def check_interval(self):
+        if self._check_interval is not None:
+            return self._check_interval
+        return getattr(settings, 'VERSION_CHECK_INTERVAL', 5)
+
+    def publish(self, keys):
+        """Make the other processes drop ``keys`` on their next poll."""
+        try:
+            cache.add(self.seq_key, 0, timeout=None)
+            seq = cache.incr(self.seq_key)
+            cache.set(f'{self.slot_prefix}{seq % self.window}', (seq, list(keys)), self.timeout)
+        except Exception:
+            logger.exception('Could not publish invalidations %s', self.seq_key)
+
+    def poll(self):
+        """The keys published since the last poll, or None if they cannot be told."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval or not self._lock.acquire(blocking=False):
+            return ()
+        try:
+            self._checked_at = now
+            seq = cache.get(self.seq_key) or 0
+            seen, self._seen = self._seen, seq
+            if seen is None or seq < seen or seq - seen > self.window:
+                return None
+            if seq == seen:
+                return ()
+            slots = {f'{self.slot_prefix}{number % self.window}': number for number in range(seen + 1, seq + 1)}
+            entries = cache.get_many(list(slots))
+            if any(entries.get(slot, (None,))[0] != number for slot, number in slots.items()):
+                return None
+            return [key for _, keys in entries.values() for key in keys]
+        except Exception:
+            logger.exception('Could not read invalidations %s', self.seq_key)
+            return None
+        finally:
+            self._lock.release()
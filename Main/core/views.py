@@ -4,24 +4,38 @@ Production-ready views for all core functionality
 """
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
-from django.http import Http404, JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.db.models import Q, Prefetch, Sum
 from django.views.decorators.http import require_POST
 from django.views.decorators.cache import cache_page
+from django.core.cache import caches
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.db import transaction
 from functools import wraps
 from .forms import SignUpForm, BookingForm
 from .models import (
     ServiceCategory, Service, StoreCategory, StoreItem, 
     Cart, CartItem, Order, OrderItem, Wishlist,
-    UserProfile, Booking, Contact, Notification
+    UserProfile, Booking, Contact, Notification, booking_targets
 )
+from .search import search_services, search_store_items
+from .autocomplete import autocomplete
+from .checkout import EmptyCart, place_order
+from .inventory import InsufficientStock, extend_cart
+from .pagination import InvalidCursor
+from . import availability, catalog, fragments, invoices, listings, notifications as notifications_push, profiling
 from django.utils import timezone
+from datetime import date
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -59,23 +73,20 @@ def search(request):
     
     services = Service.objects.none()
     store_items = StoreItem.objects.none()
+    specialised = []
     
     if query:
-        services = Service.objects.filter(
-            Q(title__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        )
-        store_items = StoreItem.objects.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        )
+        # Result cards show the category name
+        services = search_services(query, Service.objects.select_related('category'))
+        store_items = search_store_items(query, StoreItem.objects.select_related('category'))
+        # Event, photography, catering and printing packages in one catalog query
+        specialised = list(catalog.search(query, kinds=catalog.SPECIALISED_KINDS))
     
     context = {
         'query': query,
         'services': services,
         'store_items': store_items,
+        'specialised': specialised,
     }
     return render(request, 'search_results.html', context)
 
@@ -203,96 +214,101 @@ def profile(request):
 @login_required(login_url='login')
 def all_services(request):
     """Browse all services"""
-    query = request.GET.get('q', '')
-    category_id = request.GET.get('category', '')
-    
-    services = Service.objects.all()
-    
-    if query:
-        services = services.filter(
-            Q(title__icontains=query) | 
-            Q(description__icontains=query)
-        )
-    
-    if category_id:
-        services = services.filter(category_id=category_id)
-    
-    categories = ServiceCategory.objects.all()
-    
-    context = {
-        'services': services,
-        'categories': categories,
-        'query': query,
-    }
+    context = listings.listing_context(request, 'service')
     return render(request, 'services/all_services.html', context)
 
 
 @login_required(login_url='login')
 def service_detail(request, service_id):
     """Service detail page"""
-    service = get_object_or_404(Service, id=service_id)
-    
-    context = {
-        'service': service,
-    }
-    return render(request, 'services/service_detail.html', context)
+    return render(request, 'services/service_detail.html', fragments.detail_context(request, 'service', service_id))
+
+
+@login_required(login_url='login')
+def package_detail(request, service_type, service_id):
+    """Event, photography, catering or printing package detail page"""
+    if service_type not in catalog.SPECIALISED_KINDS:
+        raise Http404('Unknown service type.')
+    return render(request, 'services/service_detail.html', fragments.detail_context(request, service_type, service_id))
 
 
 # ============== SERVICES - BOOKING ==============
 
+def book_service(request, service_type, service, detail_url):
+    """Create a pending booking of ``service`` from the posted booking form"""
+    try:
+        from datetime import datetime
+        
+        # Get form data
+        date_str = request.POST.get('date')
+        time_str = request.POST.get('time')
+        requirements = request.POST.get('requirements', '')
+        
+        # Parse date and time
+        booking_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        booking_time = datetime.strptime(time_str, '%H:%M').time()
+        
+        # Create booking, unless the slot is taken
+        booking = availability.reserve_slot(Booking(
+            user=request.user,
+            service_type=service_type,
+            service_id=service.id,
+            date=booking_date,
+            time_slot=booking_time,
+            requirements=requirements,
+            total_amount=service.price,
+            status='pending'
+        ))
+        
+        # Create notification
+        Notification.objects.create(
+            user=request.user,
+            notification_type='booking',
+            title='Booking Confirmed',
+            message=f'Your booking for {service.title} on {booking_date.strftime("%B %d, %Y")} at {booking_time.strftime("%I:%M %p")} has been created.',
+            link=f'/my-bookings/'
+        )
+        
+        messages.success(request, f'Booking confirmed! Check your bookings page for details.')
+        return redirect('my_bookings')
+    except availability.SlotUnavailable as e:
+        messages.error(request, f'{e} Please choose another time.')
+        return redirect(detail_url)
+    except Exception as e:
+        messages.error(request, f'Error creating booking: {str(e)}')
+        return redirect(detail_url)
+
+
 @login_required(login_url='login')
 def request_service_quote(request, service_id):
     """Book a service or request a quote"""
     service = get_object_or_404(Service, id=service_id)
     
     if request.method == 'POST':
-        try:
-            from datetime import datetime
-            
-            # Get form data
-            date_str = request.POST.get('date')
-            time_str = request.POST.get('time')
-            requirements = request.POST.get('requirements', '')
-            
-            # Parse date and time
-            booking_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            booking_time = datetime.strptime(time_str, '%H:%M').time()
-            
-            # Create booking
-            booking = Booking.objects.create(
-                user=request.user,
-                service_type='service',
-                service_id=service.id,
-                date=booking_date,
-                time_slot=booking_time,
-                requirements=requirements,
-                total_amount=service.price,
-                status='pending'
-            )
-            
-            # Create notification
-            Notification.objects.create(
-                user=request.user,
-                notification_type='booking',
-                title='Booking Confirmed',
-                message=f'Your booking for {service.title} on {booking_date.strftime("%B %d, %Y")} at {booking_time.strftime("%I:%M %p")} has been created.',
-                link=f'/my-bookings/'
-            )
-            
-            messages.success(request, f'Booking confirmed! Check your bookings page for details.')
-            return redirect('my_bookings')
-        except Exception as e:
-            messages.error(request, f'Error creating booking: {str(e)}')
-            return redirect('service_detail', service_id=service_id)
+        return book_service(request, 'service', service, reverse('service_detail', args=[service_id]))
     
     return render(request, 'services/service_detail.html', {'service': service})
 
 
+@login_required(login_url='login')
+def book_package(request, service_type, service_id):
+    """Book an event, photography, catering or printing package"""
+    if service_type not in catalog.SPECIALISED_KINDS:
+        raise Http404('Unknown service type.')
+    service = get_object_or_404(booking_targets.model_for(service_type), id=service_id)
+    detail_url = reverse('package_detail', args=[service_type, service_id])
+    
+    if request.method == 'POST':
+        return book_service(request, service_type, service, detail_url)
+    
+    return redirect(detail_url)
+
+
 
 @login_required(login_url='login')
 def my_bookings(request):
     """View user's bookings"""
-    bookings = Booking.objects.filter(user=request.user).order_by('-created_at')
+    bookings = Booking.objects.filter(user=request.user).order_by('-created_at').with_services()
     
     context = {
         'bookings': bookings,
@@ -325,18 +341,30 @@ def modify_booking(request, booking_id):
         return redirect('my_bookings')
     
     if request.method == 'POST':
+        from datetime import datetime
+        
         new_date = request.POST.get('date')
         new_time = request.POST.get('time_slot')
         new_requirements = request.POST.get('requirements', '')
         
-        if new_date:
-            booking.date = new_date
-        if new_time:
-            booking.time_slot = new_time
+        try:
+            booking_date = datetime.strptime(new_date, '%Y-%m-%d').date() if new_date else booking.date
+            booking_time = datetime.strptime(new_time[:5], '%H:%M').time() if new_time else booking.time_slot
+        except ValueError:
+            messages.error(request, 'Please enter a valid date and time.')
+            return redirect('modify_booking', booking_id=booking.id)
         if new_requirements:
             booking.requirements = new_requirements
         
-        booking.save()
+        if (booking_date, booking_time) != (booking.date, booking.time_slot):
+            booking.date, booking.time_slot = booking_date, booking_time
+            try:
+                availability.reserve_slot(booking)
+            except availability.SlotUnavailable as e:
+                messages.error(request, f'{e} Please choose another time.')
+                return redirect('modify_booking', booking_id=booking.id)
+        else:
+            booking.save()
         messages.success(request, f'Booking #{booking.id} has been updated successfully.')
         return redirect('my_bookings')
     
@@ -351,59 +379,14 @@ def modify_booking(request, booking_id):
 @login_required(login_url='login')
 def all_store_items(request):
     """Browse all store items"""
-    query = request.GET.get('q', '')
-    category_id = request.GET.get('category', '')
-    
-    items = StoreItem.objects.all()
-    
-    if query:
-        items = items.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query)
-        )
-    
-    if category_id:
-        items = items.filter(category_id=category_id)
-    
-    categories = StoreCategory.objects.all()
-    
-    # Get wishlist items for the user
-    wishlist_items = []
-    if request.user.is_authenticated:
-        try:
-            user_wishlist = Wishlist.objects.get(user=request.user)
-            wishlist_items = list(user_wishlist.items.all())
-        except Wishlist.DoesNotExist:
-            pass
-    
-    context = {
-        'items': items,
-        'categories': categories,
-        'query': query,
-        'wishlist_items': wishlist_items,
-    }
+    context = listings.listing_context(request, 'storeitem')
     return render(request, 'store/all_items.html', context)
 
 
 @login_required(login_url='login')
 def store_item_detail(request, item_id):
     """Store item detail page"""
-    item = get_object_or_404(StoreItem, id=item_id)
-    
-    # Get wishlist items for the user
-    wishlist_items = []
-    if request.user.is_authenticated:
-        try:
-            user_wishlist = Wishlist.objects.get(user=request.user)
-            wishlist_items = list(user_wishlist.items.all())
-        except Wishlist.DoesNotExist:
-            pass
-    
-    context = {
-        'item': item,
-        'wishlist_items': wishlist_items,
-    }
-    return render(request, 'store/item_detail.html', context)
+    return render(request, 'store/item_detail.html', fragments.detail_context(request, 'storeitem', item_id))
 
 
 # ============== SHOPPING CART ==============
@@ -415,9 +398,13 @@ def cart(request):
         return redirect('login')
     
     cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all().select_related('item')
+    cart_items = cart.items.all().select_related('item__category')
     total = sum(item.get_total() for item in cart_items)
     
+    # Keep the stock held while the customer is looking at the cart
+    if not created:
+        extend_cart(cart)
+    
     context = {
         'cart_items': cart_items,
         'total': total,
@@ -460,7 +447,8 @@ def update_cart(request, cart_item_id):
     quantity = int(request.POST.get('quantity', 1))
     
     if quantity > 0:
-        cart_item.quantity = min(quantity, cart_item.item.stock)
+        # Clamped to what can be reserved by the CartItem pre_save handler
+        cart_item.quantity = quantity
         cart_item.save()
     
     return redirect('cart')
@@ -484,6 +472,26 @@ def remove_from_cart(request, cart_item_id):
 @login_required(login_url='login')
 def checkout(request):
     """Checkout page"""
+    if request.method == 'POST':
+        shipping_address = f"{request.POST.get('address', '')}, {request.POST.get('city', '')}, {request.POST.get('zip_code', '')}"
+        try:
+            order, created = place_order(
+                request.user,
+                shipping_address,
+                checkout_token=request.POST.get('checkout_token', '')[:64],
+            )
+        except EmptyCart:
+            return redirect('cart')
+        except InsufficientStock as exc:
+            name = StoreItem.objects.filter(pk=exc.item_id).values_list('name', flat=True).first()
+            messages.error(request, f'Sorry, only {exc.available} of {name} left in stock. Please update your cart.')
+            return redirect('cart')
+        
+        if created:
+            invoices.prerender(order.id)
+            messages.success(request, 'Order placed successfully! Thank you for your purchase.')
+        return redirect('order_history')
+    
     cart = get_object_or_404(Cart, user=request.user)
     cart_items = cart.items.all().select_related('item')
     total = sum(item.get_total() for item in cart_items)
@@ -491,42 +499,11 @@ def checkout(request):
     if not cart_items:
         return redirect('cart')
     
-    if request.method == 'POST':
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            total_amount=total,
-            status='pending',
-            shipping_address=f"{request.POST.get('address', '')}, {request.POST.get('city', '')}, {request.POST.get('zip_code', '')}"
-        )
-        
-        # Create order items
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                item=cart_item.item,
-                quantity=cart_item.quantity,
-                price=cart_item.item.price
-            )
-        
-        # Clear cart
-        cart_items.delete()
-        
-        # Create order notification
-        Notification.objects.create(
-            user=request.user,
-            notification_type='order',
-            title='Order Placed Successfully! 🛒',
-            message=f'Your order #{order.id} for ৳{int(total)} has been placed. We will process it soon and update you on delivery.',
-            link='/orders/'
-        )
-        
-        messages.success(request, 'Order placed successfully! Thank you for your purchase.')
-        return redirect('order_history')
-    
     context = {
         'cart_items': cart_items,
         'total': total,
+        # Resubmitting the same form returns the order already placed
+        'checkout_token': uuid.uuid4().hex,
     }
     return render(request, 'store/checkout.html', context)
 
@@ -554,6 +531,7 @@ def wishlist(request):
     
     context = {
         'wishlist': user_wishlist,
+        'items': user_wishlist.items.all(),
     }
     return render(request, 'store/wishlist.html', context)
 
@@ -619,21 +597,18 @@ def contact(request):
 @login_required(login_url='login')
 def api_cart_count(request):
     """Get cart item count via AJAX"""
-    try:
-        cart = Cart.objects.get(user=request.user)
-        count = cart.items.aggregate(total=Sum('quantity'))['total'] or 0
-        return JsonResponse({'count': count})
-    except Cart.DoesNotExist:
-        return JsonResponse({'count': 0})
+    count = Cart.objects.filter(user=request.user).values_list('total_quantity', flat=True).first()
+    return JsonResponse({'count': count or 0})
 
 
 def api_services_search(request):
     """Search services via AJAX"""
     query = request.GET.get('q', '')
-    services = Service.objects.filter(
-        Q(title__icontains=query) |
-        Q(description__icontains=query)
-    )[:10].values('id', 'title', 'price')
+    if query:
+        services = search_services(query, limit=10)
+    else:
+        services = Service.objects.all()[:10]
+    services = services.values('id', 'title', 'price')
     
     return JsonResponse(list(services), safe=False)
 
@@ -641,14 +616,86 @@ def api_services_search(request):
 def api_items_search(request):
     """Search store items via AJAX"""
     query = request.GET.get('q', '')
-    items = StoreItem.objects.filter(
-        Q(name__icontains=query) |
-        Q(description__icontains=query)
-    )[:10].values('id', 'name', 'price')
+    if query:
+        items = search_store_items(query, limit=10)
+    else:
+        items = StoreItem.objects.all()[:10]
+    items = items.values('id', 'name', 'price')
     
     return JsonResponse(list(items), safe=False)
 
 
+def api_catalog(request):
+    """Services of every type and store items from the catalog read model.
+
+    ``kind`` (repeatable) narrows the types, ``q`` searches titles and
+    categories, ``sort`` is one of the listing sorts and ``after`` the
+    cursor of the next page.  Every variant is a single query on one table.
+    """
+    kinds = [kind for kind in request.GET.getlist('kind') if kind in catalog.SOURCES]
+    query = request.GET.get('q', '').strip()
+    if query:
+        rows, next_cursor = catalog.search(query, kinds=kinds), None
+    else:
+        sort = request.GET.get('sort')
+        ordering = listings.SORTS.get(sort, listings.SORTS[listings.DEFAULT_SORT])
+        try:
+            page = catalog.page(kinds, ordering, listings.page_size(), after=request.GET.get('after') or None)
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        rows, next_cursor = page, page.next_cursor
+    return JsonResponse({
+        'results': [catalog.as_dict(entry) for entry in rows],
+        'next': next_cursor,
+    })
+
+
+def api_availability(request, service_type, service_id):
+    """Free booking slots of a service.
+
+    ``start`` (YYYY-MM-DD, default today) and ``days`` (default and at most
+    the booking horizon) choose the dates; one query reads the bookings.
+    """
+    model = booking_targets.model_for(service_type)
+    if model is None:
+        raise Http404('Unknown service type')
+    if not model.objects.filter(pk=service_id).exists():
+        raise Http404('Unknown service')
+    try:
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+        days = max(1, int(request.GET.get('days') or availability.horizon_days()))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start or days'}, status=400)
+    duration = availability.service_duration(service_type, service_id)
+    slots = availability.free_slots(service_type, service_id, start=start, days=days, duration=duration)
+    return JsonResponse({
+        'service_type': service_type,
+        'service_id': service_id,
+        'duration': duration,
+        'days': [
+            {'date': day.isoformat(), 'slots': [at.strftime('%H:%M') for at in times]}
+            for day, times in slots.items()
+        ],
+    })
+
+
+def api_autocomplete(request):
+    """Navbar autocomplete over services, store items and categories.
+
+    Answered from the in-memory autocomplete index without touching the database.
+    """
+    query = request.GET.get('q', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 8)), 20))
+    except ValueError:
+        limit = 8
+    suggestions = autocomplete.suggest(query, limit)
+    return JsonResponse({
+        'query': query,
+        'results': [suggestion.as_dict() for suggestion in suggestions],
+    })
+
+
 # ============== NOTIFICATIONS ==============
 
 @login_required(login_url='login')
@@ -668,24 +715,28 @@ def api_notifications(request):
     user_notifications = Notification.objects.filter(user=request.user).order_by('-created_at')[:10]
     unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
     
-    notifications_list = []
-    for n in user_notifications:
-        notifications_list.append({
-            'id': n.id,
-            'title': n.title,
-            'message': n.message[:100] + '...' if len(n.message) > 100 else n.message,
-            'type': n.notification_type,
-            'link': n.link or '',
-            'is_read': n.is_read,
-            'created_at': n.created_at.strftime('%d %b %Y, %I:%M %p'),
-        })
-    
     return JsonResponse({
-        'notifications': notifications_list,
+        'notifications': [notifications_push.serialize(n) for n in user_notifications],
         'unread_count': unread_count,
     })
 
 
+async def notification_stream(request):
+    """Server-Sent Events fallback for clients that cannot open the notification WebSocket"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be held by the endless stream; 204 tells
+        # EventSource not to reconnect, and the page polls instead
+        return HttpResponse(status=204)
+    
+    response = StreamingHttpResponse(notifications_push.stream_events(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+
 @login_required(login_url='login')
 @require_POST
 def mark_notification_read(request, notification_id):
@@ -704,6 +755,8 @@ def mark_notification_read(request, notification_id):
 def mark_all_notifications_read(request):
     """Mark all notifications as read"""
     Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    # Bulk update skips the post_save handler; push the new total instead
+    notifications_push.publish_unread_count(request.user.pk, 0)
     return JsonResponse({'success': True})
 
 
@@ -727,7 +780,7 @@ def api_order_items(request, order_id):
         order = Order.objects.get(id=order_id, user=request.user)
         items = []
         
-        for order_item in order.order_items.all():
+        for order_item in order.order_items.select_related('item'):
             items.append({
                 'id': order_item.item.id,
                 'name': order_item.item.name,
@@ -747,140 +800,37 @@ def api_order_items(request, order_id):
         }, status=404)
 
 
+
+@staff_member_required
+def api_fragment_stats(request):
+    """Hit ratios of the catalog fragment cache, across all workers."""
+    return JsonResponse(fragments.stats.snapshot(fragments.fragment_names()))
+
+
+@staff_member_required
+def api_cache_stats(request):
+    """Hit ratios and shared-tier latency of the default cache in this worker."""
+    cache = caches['default']
+    stats = cache.stats() if hasattr(cache, 'stats') else None
+    return JsonResponse({'backend': type(cache).__name__, 'stats': stats})
+
+
+@staff_member_required
+def api_sql_profile(request):
+    """Queries per view in this worker, recorded while SQL_PROFILING is on."""
+    return JsonResponse({'enabled': settings.SQL_PROFILING, 'views': profiling.view_stats.snapshot()})
+
 # ============== INVOICE ==============
 
 @login_required(login_url='login')
 def download_invoice(request, order_id):
     """Download invoice as PDF"""
     try:
-        order = Order.objects.get(id=order_id, user=request.user)
+        order = invoices.invoice_orders().get(id=order_id, user=request.user)
     except Order.DoesNotExist:
         return redirect('order_history')
     
-    try:
-        from io import BytesIO
-        from reportlab.lib.pagesizes import letter
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        from datetime import datetime
-        from django.http import FileResponse
-        
-        # Create PDF in memory
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Custom styles
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#7C3AED'),
-            spaceAfter=12,
-            alignment=1  # Center
-        )
-        
-        header_style = ParagraphStyle(
-            'Header',
-            parent=styles['Normal'],
-            fontSize=11,
-            textColor=colors.HexColor('#666666'),
-            spaceAfter=6
-        )
-        
-        # Title
-        elements.append(Paragraph("INVOICE", title_style))
-        elements.append(Spacer(1, 0.2*inch))
-        
-        # Order info
-        order_info = [
-            [f"Invoice #: {order.id}", f"Date: {order.created_at.strftime('%B %d, %Y')}"],
-            [f"Status: {order.get_status_display()}", f"Amount: ৳{order.total_amount:,.2f}"],
-        ]
-        
-        info_table = Table(order_info, colWidths=[3*inch, 3*inch])
-        info_table.setStyle(TableStyle([
-            ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#333333')),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ]))
-        elements.append(info_table)
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Customer info
-        elements.append(Paragraph("Bill To:", styles['Heading3']))
-        customer_info = f"{order.user.get_full_name() or order.user.username}<br/>{order.shipping_address}"
-        elements.append(Paragraph(customer_info, header_style))
-        elements.append(Spacer(1, 0.2*inch))
-        
-        # Items table
-        elements.append(Paragraph("Order Items", styles['Heading3']))
-        
-        item_data = [
-            ['Product', 'Quantity', 'Price', 'Total'],
-        ]
-        
-        for order_item in order.order_items.all():
-            item_data.append([
-                order_item.item.name[:30],
-                str(order_item.quantity),
-                f"৳{order_item.price:,.2f}",
-                f"৳{order_item.get_total():,.2f}",
-            ])
-        
-        # Add total row
-        item_data.append([
-            '',
-            '',
-            'Total:',
-            f"৳{order.total_amount:,.2f}",
-        ])
-        
-        items_table = Table(item_data, colWidths=[2.5*inch, 1*inch, 1.5*inch, 1.5*inch])
-        items_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7C3AED')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#F3E8FF')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#F9F5FF')]),
-        ]))
-        elements.append(items_table)
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Footer
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor=colors.grey,
-            alignment=1  # Center
-        )
-        elements.append(Paragraph(
-            "Thank you for your order! <br/>EventNest - Event Management Platform",
-            footer_style
-        ))
-        
-        # Build PDF
-        doc.build(elements)
-        buffer.seek(0)
-        
-        # Return as file download
-        response = FileResponse(buffer, as_attachment=True, filename=f'Invoice_{order.id}.pdf', content_type='application/pdf')
-        return response
-    
-    except ImportError:
+    if not invoices.AVAILABLE:
         # Fallback if reportlab not installed - return JSON with order data
         return JsonResponse({
             'error': 'PDF generation library not available',
@@ -897,6 +847,16 @@ def download_invoice(request, order_id):
             ]
         })
 
+    # The cache key is a hash of everything the invoice shows, so it is the ETag
+    data = invoices.invoice_data(order)
+    etag = f'"{invoices.invoice_key(data)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(invoices.open_invoice(data), as_attachment=True, filename=f'Invoice_{order.id}.pdf', content_type='application/pdf')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 
 # ============== ERROR HANDLERS ==============
 
@@ -0,0 +1,240 @@
+"""
+Session-to-user resolution for WebSocket connects.
+
+Every page a signed-in user opens connects the notification socket, and
+each connect used to load the session row and then the user row on the
+event loop's thread.  ``SessionUserCache`` keeps the result per session
+key in a bounded LRU:
+
+* an entry lives for ``WEBSOCKET_SESSION_CACHE_TTL`` seconds, but never
+  past the session's own ``expire_date``;
+* unknown or anonymous session keys are remembered for
+  ``NEGATIVE_TTL`` seconds so that a storm of bad keys does not reach the
+  database either;
+* deleted sessions and changed users are dropped here and published in
+  an invalidation log (see core.versioning), from which the other
+  workers drop the same entries within ``VERSION_CHECK_INTERVAL``
+  seconds.  Login and logout only touch the session being replaced or
+  flushed, whose row deletion is what gets published; sessions that had
+  already expired are never cached, so their deletion is not published.
+
+Misses are resolved in a small dedicated thread pool rather than the
+shared ``sync_to_async`` executor, and concurrent connects with the same
+session key share one lookup.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, load_backend
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.contrib.sessions.models import Session
+from django.db import close_old_connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .versioning import InvalidationLog
+
+logger = logging.getLogger(__name__)
+
+# Seconds a session key that resolved to no user is remembered
+NEGATIVE_TTL = 5
+
+
+def load_user(session_key):
+    """
+    Return ``(user, expires_at)`` for ``session_key``; ``user`` is None for
+    unknown, expired or anonymous sessions.  Runs in a worker thread.
+    """
+    close_old_connections()
+    try:
+        session = Session.objects.filter(session_key=session_key, expire_date__gt=timezone.now()).first()
+        if session is None:
+            return None, None
+        data = session.get_decoded()
+        user_id, backend_path = data.get(SESSION_KEY), data.get(BACKEND_SESSION_KEY)
+        if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+            return None, session.expire_date
+        user = load_backend(backend_path).get_user(user_id)
+        # Same check as django.contrib.auth.get_user: a password change
+        # signs out every other session
+        if user is None or not constant_time_compare(data.get(HASH_SESSION_KEY, ''), user.get_session_auth_hash()):
+            return None, session.expire_date
+        return user, session.expire_date
+    finally:
+        close_old_connections()
+
+
+class SessionUserCache:
+    """Bounded LRU of session key -> user with per-entry expiry."""
+
+    def __init__(self, size=None, ttl=None, threads=None):
+        self.size = size or getattr(settings, 'WEBSOCKET_SESSION_CACHE_SIZE', 10000)
+        self.ttl = ttl or getattr(settings, 'WEBSOCKET_SESSION_CACHE_TTL', 300)
+        self.threads = threads or getattr(settings, 'WEBSOCKET_AUTH_THREADS', 4)
+        self.log = InvalidationLog('websocket-sessions')
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self._entries = OrderedDict()  # session key -> (user, deadline)
+        self._by_user = {}  # user id -> session keys, for invalidation
+        self._generation = 0  # bumped by every invalidation
+        self._pending = {}  # (loop, session key) -> future of the running lookup
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='websocket-auth')
+        return self._executor
+
+    def get(self, session_key):
+        """Return ``(found, user)`` from the cache without touching the database."""
+        published = self.log.poll()
+        with self._lock:
+            if published is None:
+                self._clear()
+            elif published:
+                self._drop(published)
+            entry = self._entries.get(session_key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(session_key)
+                self.stats['hits'] += 1
+                return True, entry[0]
+            if entry is not None:
+                self._pop(session_key)
+            self.stats['misses'] += 1
+            return False, None
+
+    def put(self, session_key, user, expires_at):
+        ttl = self.ttl if user is not None else NEGATIVE_TTL
+        if expires_at is not None:
+            ttl = min(ttl, (expires_at - timezone.now()).total_seconds())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._pop(session_key)
+            self._entries[session_key] = (user, time.monotonic() + ttl)
+            if user is not None:
+                self._by_user.setdefault(user.pk, set()).add(session_key)
+            while len(self._entries) > self.size:
+                self._pop(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    async def resolve(self, session_key):
+        """Return the user signed in with ``session_key``, or None."""
+        found, user = self.get(session_key)
+        if found:
+            return user
+        loop = asyncio.get_running_loop()
+        key = (loop, session_key)
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = loop.run_in_executor(self.executor, load_user, session_key)
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+            generation = self._generation
+            future.add_done_callback(lambda done: self._store(session_key, done, generation))
+        # Shielded so that one disconnecting client does not fail the others
+        user, _ = await asyncio.shield(future)
+        return user
+
+    def _store(self, session_key, future, generation):
+        if future.cancelled() or future.exception() is not None:
+            return
+        if generation != self._generation:
+            return  # invalidated while the lookup ran; the result may be stale
+        self.put(session_key, *future.result())
+
+    def invalidate(self, session_key):
+        with self._lock:
+            self._drop([('session', session_key)])
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._drop([('user', user_id)])
+
+    def forget(self, session_keys=(), user_ids=()):
+        """Drop sessions and users here and in every other process."""
+        keys = [('session', key) for key in session_keys] + [('user', pk) for pk in user_ids]
+        with self._lock:
+            self._drop(keys)
+        self.log.publish(keys)
+
+    def _drop(self, keys):
+        # Callers hold self._lock
+        self._generation += 1
+        for kind, key in keys:
+            session_keys = (key,) if kind == 'session' else tuple(self._by_user.get(key, ()))
+            for session_key in session_keys:
+                if self._pop(session_key):
+                    self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _pop(self, session_key):
+        entry = self._entries.pop(session_key, None)
+        if entry is None or entry[0] is None:
+            return entry is not None
+        keys = self._by_user.get(entry[0].pk)
+        if keys is not None:
+            keys.discard(session_key)
+            if not keys:
+                del self._by_user[entry[0].pk]
+        return True
+
+    def _clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._by_user.clear()
+
+
+session_users = SessionUserCache()
+
+
+def _session_key(request):
+    session = getattr(request, 'session', None)
+    return session.session_key if session is not None else None
+
+
+@receiver(user_logged_in)
+@receiver(user_logged_out)
+def invalidate_on_auth_change(sender, request, user, **kwargs):
+    """
+    The session now belongs to someone else (or nobody).  Only dropped
+    here: login moves the session to a new key and logout flushes it, and
+    deleting the old row is published below.
+    """
+    session_key = _session_key(request)
+    if session_key:
+        session_users.invalidate(session_key)
+
+
+@receiver(post_delete, sender=Session)
+def invalidate_deleted_session(sender, instance, **kwargs):
+    # Covers login's cycle_key(), logout's flush() and deletions in the admin
+    if instance.expire_date > timezone.now():
+        session_users.forget(session_keys=[instance.session_key])
+    else:
+        session_users.invalidate(instance.session_key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_changed_user(sender, instance, created=False, update_fields=None, **kwargs):
+    """Deactivation, password changes and deletion end cached sign-ins."""
+    if created:
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return  # written on every login, which is handled above
+    session_users.forget(user_ids=[instance.pk])
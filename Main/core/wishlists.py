@@ -0,0 +1,79 @@
+"""
+Wishlist membership.
+
+Store pages only need to know *whether* an item is on the user's wishlist,
+so instead of loading the wishlisted StoreItem objects and comparing model
+instances, ``membership`` returns a frozenset of item ids: one
+``values_list`` query, cached per user in the shared cache and memoized on
+the user object for the rest of the request.  Every m2m change to a
+wishlist deletes the affected users' entries once the transaction commits,
+and so does deleting a wishlist (directly or with its user) or a store item,
+whose relation rows cascade without sending m2m_changed.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import StoreItem, Wishlist
+
+logger = logging.getLogger(__name__)
+
+EMPTY = frozenset()
+
+
+def cache_key(user_id):
+    return f'wishlist-items:{user_id}'
+
+
+def membership(user):
+    """Frozenset of the ids of the store items on ``user``'s wishlist."""
+    if not user.is_authenticated:
+        return EMPTY
+    memo = getattr(user, '_wishlist_membership', None)
+    if memo is not None:
+        return memo
+    key = cache_key(user.pk)
+    item_ids = cache.get(key)
+    if item_ids is None:
+        item_ids = frozenset(
+            Wishlist.items.through.objects.filter(wishlist__user=user).values_list('storeitem_id', flat=True)
+        )
+        cache.set(key, item_ids, getattr(settings, 'WISHLIST_CACHE_TTL', 3600))
+    user._wishlist_membership = item_ids
+    return item_ids
+
+
+def invalidate(user_ids):
+    # Keys are built now: a lazy queryset would be read after the change
+    keys = [cache_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(m2m_changed, sender=Wishlist.items.through)
+def wishlist_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate([instance.user_id])
+    elif action == 'pre_clear':
+        # Cleared from the StoreItem side: every wishlist holding it
+        invalidate(instance.wishlists.values_list('user_id', flat=True).distinct())
+    else:
+        invalidate(Wishlist.objects.filter(pk__in=pk_set).values_list('user_id', flat=True).distinct())
+
+
+@receiver(post_delete, sender=Wishlist)
+def wishlist_deleted(sender, instance, **kwargs):
+    invalidate([instance.user_id])
+
+
+@receiver(pre_delete, sender=StoreItem)
+def store_item_deleted(sender, instance, **kwargs):
+    # Read before the cascade removes the relation rows naming the users
+    invalidate(instance.wishlists.values_list('user_id', flat=True).distinct())
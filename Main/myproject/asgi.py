@@ -10,22 +10,23 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
+from channels.sessions import CookieMiddleware
 from channels.security.websocket import AllowedHostsOriginValidator
-from core.routing import websocket_urlpatterns
-from core.middleware import WebSocketMiddleware, WebSocketDebugMiddleware
-import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
-django.setup()
+# Set up Django (app registry included) before importing code that uses models
+django_asgi_app = get_asgi_application()
 
-from channels.layers import get_channel_layer
+from core.routing import websocket_urlpatterns  # noqa: E402
+from core.middleware import WebSocketMiddleware, WebSocketDebugMiddleware  # noqa: E402
+from channels.layers import get_channel_layer  # noqa: E402
 channel_layer = get_channel_layer()
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        # WebSocketMiddleware resolves the user from the session cookie
+        CookieMiddleware(
             WebSocketDebugMiddleware(
                 WebSocketMiddleware(
                     URLRouter(
@@ -81,12 +81,16 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     # Whitenoise for static files (important for Vercel)
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Does nothing unless SQL_PROFILING is on; outside the session
+    # middleware so that session saves are counted
+    'core.profiling.QueryProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.NavigationStatsMiddleware',
 ]
 
 ROOT_URLCONF = 'myproject.urls'
@@ -102,10 +106,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'core.context_processors.service_categories_processor',
-                'core.context_processors.store_categories_processor',
-                'core.context_processors.cart_processor',
-                'core.context_processors.wishlist_processor',
+                'core.context_processors.navigation_processor',
             ],
         },
     },
@@ -167,17 +168,122 @@ else:
 # CHANNELS CONFIGURATION
 # ==============================================================================
 
-# Use in-memory channel layer (sufficient for Vercel without Redis)
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# CHANNEL_LAYER_URL selects how WebSocket/SSE messages reach other processes:
+#   (empty)                          in-memory, single process (Vercel)
+#   unix:///path/to/channels.sock    `manage.py channel_broker` on this host
+#   redis://host:6379/0              Redis pub/sub
+# See core/channel_layers.py.
+CHANNEL_LAYER_URL = os.getenv('CHANNEL_LAYER_URL', '')
+
+if CHANNEL_LAYER_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'core.channel_layers.PubSubChannelLayer',
+            'CONFIG': {
+                'url': CHANNEL_LAYER_URL,
+                'capacity': int(os.getenv('CHANNEL_LAYER_CAPACITY', 100)),
+            },
+        }
+    }
+else:
+    # Use in-memory channel layer (sufficient for Vercel without Redis)
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
-}
 
 # WebSocket configuration
 WEBSOCKET_ACCEPT_TIME = 20
 WEBSOCKET_TIMEOUT = 3600
 
+# Session-to-user cache for WebSocket connects (see core/websocket_auth.py):
+# entries kept, seconds an entry lives at most, and threads running the
+# session/user lookups on a miss
+WEBSOCKET_SESSION_CACHE_SIZE = 10000
+WEBSOCKET_SESSION_CACHE_TTL = 300
+WEBSOCKET_AUTH_THREADS = 4
+
+
+# ==============================================================================
+# SEARCH
+# ==============================================================================
+
+# Dotted path of the full-text search backend (see core/search.py).
+# Leave empty to pick one from the database vendor: MySQL FULLTEXT, or the
+# in-process index elsewhere. 'core.search.SQLiteFTS5Backend' is also available.
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', '')
+
+# Maximum number of ranked results returned for a search
+SEARCH_RESULT_LIMIT = 200
+
+# Best matches a filtered search (listing facets) narrows before applying
+# SEARCH_RESULT_LIMIT
+SEARCH_FILTER_CANDIDATES = 5000
+
+# Navbar autocomplete (see core/autocomplete.py): suggestions kept per
+# prefix and number of cached prefixes
+AUTOCOMPLETE_TOP_K = 10
+AUTOCOMPLETE_PREFIX_CACHE_SIZE = 10000
+
+# Catalog listings (see core/listings.py): cards per page, and seconds a
+# rendered page is cached (stock counts on cached pages lag by at most this)
+CATALOG_PAGE_SIZE = 24
+CATALOG_PAGE_CACHE_TTL = 60
+
+# Seconds a user's wishlist item ids stay cached (core/wishlists.py);
+# wishlist changes invalidate them immediately
+WISHLIST_CACHE_TTL = 3600
+
+# PDF invoices (see core/invoices.py): render each new order's invoice in
+# the background after checkout, in this many threads
+INVOICE_PRERENDER = True
+INVOICE_RENDER_THREADS = 2
+
+# Responsive image derivatives (see core/derivatives.py): widths generated
+# per image, whether saving an image builds them straight away, and threads
+# building them in the background (the bulk path is build_image_derivatives)
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 960, 1280)
+IMAGE_DERIVATIVES_ON_SAVE = True
+IMAGE_DERIVATIVE_THREADS = 1
+
+# How often (seconds) each worker checks the shared cache for changes
+# other workers made to data held in in-process caches (core/versioning.py)
+VERSION_CHECK_INTERVAL = 5
+
+# Seconds a cart line keeps its stock reserved (see core/inventory.py);
+# viewing the cart extends it. Expired reservations are returned to stock
+# by `manage.py release_expired_reservations`.
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 30 * 60))
+
+# Service bookings (see core/availability.py): bookings start on the hours
+# from BOOKING_HOURS[0] to before BOOKING_HOURS[1] in BOOKING_SLOT_MINUTES
+# steps, at most BOOKING_HORIZON_DAYS ahead. A service takes
+# BOOKING_CAPACITY[service type] (default 1) overlapping bookings; bookings
+# of services without a duration last BOOKING_DEFAULT_DURATION minutes.
+BOOKING_HOURS = (9, 21)
+BOOKING_SLOT_MINUTES = 60
+BOOKING_HORIZON_DAYS = 90
+BOOKING_DEFAULT_DURATION = 120
+BOOKING_CAPACITY = {}
+
+# Notification broadcasts (see core/broadcasts.py): recipients written per
+# INSERT, background threads running broadcasts in each web process (0
+# leaves them to `manage.py run_broadcasts`), and seconds without progress
+# after which a running broadcast is taken over by another worker.
+NOTIFICATION_BROADCAST_BATCH_SIZE = 1000
+NOTIFICATION_BROADCAST_THREADS = int(os.getenv('NOTIFICATION_BROADCAST_THREADS', 1))
+NOTIFICATION_BROADCAST_LEASE = 60
+
+# Notification retention (see core/retention.py): overrides of the days
+# each notification type is kept, on top of DEFAULT_RETENTION_DAYS there
+# (e.g. {'promo': 14}; None keeps a type for good), rows deleted per
+# transaction by `manage.py prune_notifications`, and whether pruned rows
+# are first copied, compressed, into NotificationArchive.
+NOTIFICATION_RETENTION_DAYS = {}
+NOTIFICATION_RETENTION_BATCH_SIZE = 1000
+NOTIFICATION_ARCHIVE = os.getenv('NOTIFICATION_ARCHIVE', 'False').lower() in ('true', '1', 'yes')
+
 
 # ==============================================================================
 # SESSIONS AND SECURITY
@@ -298,13 +404,52 @@ LOGOUT_REDIRECT_URL = 'login'
 # CACHING
 # ==============================================================================
 
-# Use local memory cache for development, database cache for production
+# Use local memory cache for development.  Production keeps a small LRU in
+# every process in front of a shared cache (see core/cache_backends.py),
+# selected with CACHE_URL or CACHE_DIR:
+#   redis://host:6379/1      CACHE_URL: Redis, shared by every host
+#   /var/cache/eventnest     CACHE_DIR: files, shared only by the processes
+#                            of one host; never on Vercel, where /tmp is
+#                            private to each instance
+#   (neither)                the database cache table, shared by every host
+#                            (manage.py createcachetable)
+# The shared tier carries the version stamps and invalidations of every
+# instance, so it must be reachable from all of them.
+# L1 entries live CACHE_L1_TIMEOUT seconds at most, and writes reach the
+# other processes' L1 within BROADCAST_INTERVAL seconds.  With the database
+# table a cache write is one round trip and the invalidations are sent in
+# batches (BATCH_BROADCASTS), as each broadcast is three more; writes then
+# reach the other processes within CACHE_L1_TIMEOUT seconds.
 if IS_PRODUCTION:
-    CACHES = {
-        'default': {
+    CACHE_URL = os.getenv('CACHE_URL', '')
+    CACHE_DIR = os.getenv('CACHE_DIR', '')
+    if CACHE_URL:
+        CACHE_L2 = {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    elif CACHE_DIR:
+        CACHE_L2 = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    else:
+        CACHE_L2 = {
             'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
             'LOCATION': 'django_cache_table',
         }
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TieredCache',
+            'OPTIONS': {
+                'L2': CACHE_L2,
+                'L1_MAX_ENTRIES': 2048,
+                'L1_MAX_BYTES': 32 * 1024 * 1024,
+                'L1_TIMEOUT': float(os.getenv('CACHE_L1_TIMEOUT', 5)),
+                'BROADCAST_INTERVAL': 1,
+            },
+        }
     }
 else:
     CACHES = {
@@ -313,3 +458,40 @@ else:
             'LOCATION': 'unique-snowflake',
         }
     }
+
+
+# ==============================================================================
+# SQL PROFILING
+# ==============================================================================
+
+# QueryProfilingMiddleware (core/profiling.py) records the queries of every
+# request while SQL_PROFILING is on and logs N+1 patterns: a statement shape
+# repeated SQL_N_PLUS_ONE_THRESHOLD times from one template or code line.
+# SQL_QUERY_BUDGETS caps the queries per request by URL name; with
+# SQL_PROFILING_STRICT a request over budget raises, failing tests.
+SQL_PROFILING = os.getenv('SQL_PROFILING', 'False').lower() in ('true', '1', 'yes')
+SQL_PROFILING_STRICT = False
+SQL_N_PLUS_ONE_THRESHOLD = 3
+# Budgets for a signed-in user: two queries above what each page runs with a
+# cold cache (measured with bench_hot_paths' data at --scale 0.05), at least 4
+SQL_QUERY_BUDGETS = {
+    'home': 6,
+    'search': 8,
+    'all_services': 8,
+    'service_detail': 7,
+    'package_detail': 7,
+    'all_store_items': 7,
+    'store_item_detail': 8,
+    'cart': 8,
+    'order_history': 8,
+    'download_invoice': 7,
+    'wishlist': 7,
+    'my_bookings': 7,
+    'notifications': 6,
+    'api_notifications': 6,
+    'api_cart_count': 5,
+    'api_order_items': 6,
+    'api_autocomplete': 6,
+    'api_catalog': 4,
+    'api_availability': 5,
+}
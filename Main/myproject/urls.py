@@ -46,6 +46,8 @@ urlpatterns = [
     path('services/', views.all_services, name='all_services'),
     path('services/<int:service_id>/', views.service_detail, name='service_detail'),
     path('services/<int:service_id>/quote/', views.request_service_quote, name='request_quote'),
+    path('services/<str:service_type>/<int:service_id>/', views.package_detail, name='package_detail'),
+    path('services/<str:service_type>/<int:service_id>/book/', views.book_package, name='book_package'),
     
     # Store
     path('store/', views.all_store_items, name='all_store_items'),
@@ -71,6 +73,7 @@ urlpatterns = [
     # Notifications
     path('notifications/', views.notifications, name='notifications'),
     path('api/notifications/', views.api_notifications, name='api_notifications'),
+    path('api/notifications/stream/', views.notification_stream, name='notification_stream'),
     path('api/notifications/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
     path('api/notifications/read-all/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
     
@@ -78,7 +81,13 @@ urlpatterns = [
     path('api/cart-count/', views.api_cart_count, name='api_cart_count'),
     path('api/services-search/', views.api_services_search, name='api_services_search'),
     path('api/items-search/', views.api_items_search, name='api_items_search'),
+    path('api/autocomplete/', views.api_autocomplete, name='api_autocomplete'),
+    path('api/catalog/', views.api_catalog, name='api_catalog'),
+    path('api/availability/<str:service_type>/<int:service_id>/', views.api_availability, name='api_availability'),
     path('api/order/<int:order_id>/items/', views.api_order_items, name='api_order_items'),
+    path('api/fragment-stats/', views.api_fragment_stats, name='api_fragment_stats'),
+    path('api/cache-stats/', views.api_cache_stats, name='api_cache_stats'),
+    path('api/sql-profile/', views.api_sql_profile, name='api_sql_profile'),
 ]
 
 if settings.DEBUG:
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
 application = get_wsgi_application()
+
+# Build the in-memory autocomplete index before the first request
+from core.autocomplete import warm  # noqa: E402
+warm()